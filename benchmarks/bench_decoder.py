@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compare the history record decoder with the generic str2datetime path.
+
+Usage:
+    PYTHONPATH=src python benchmarks/bench_decoder.py [--lines=N]
+"""
+import argparse
+import time
+
+from generator import synthetic_history
+from history import decode_line, sanitize
+from timetoolkit import str2datetime
+
+
+def generic_decode(line):
+    """The decoding path used before the dedicated decoder"""
+    fields = line.strip().split(",")
+    if len(fields) == 5:
+        start_str, end_str = fields[3], fields[4]
+    else:
+        start_str, end_str = fields[2], fields[3]
+    return (
+        sanitize(fields[1]).strip(),
+        str2datetime(start_str.strip()),
+        str2datetime(end_str.strip()),
+    )
+
+
+def measure(decoder, history):
+    begin = time.perf_counter()
+    for line in history:
+        decoder(line)
+    elapsed = time.perf_counter() - begin
+    return len(history) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=1000000)
+    parser.add_argument("--legacy-ratio", type=float, default=0.1)
+    args = parser.parse_args()
+
+    history = synthetic_history(args.lines, args.legacy_ratio)
+    assert all(generic_decode(line) == decode_line(line) for line in history[:1000])
+
+    before = measure(generic_decode, history)
+    after = measure(decode_line, history)
+    print("lines:  %d" % len(history))
+    print("before: %12.0f lines/s (str2datetime)" % before)
+    print("after:  %12.0f lines/s (decode_line)" % after)
+    print("speedup: %.1fx" % (after / before))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compare the peak memory of "lets see all" with the history records and with
+full Task objects, as measured by tracemalloc.
+
+The history is synthetic and lives in a temporary HOME.
+
+Usage:
+    PYTHONPATH=src python benchmarks/bench_memory.py [--lines=N]
+"""
+import argparse
+import contextlib
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+
+from generator import synthetic_history
+
+
+def legacy_record(name, start_time, end_time, tid=None, uid=None, work_time=None):
+    """Build a full Task, as the reports did before the history records"""
+    from tasks import Task
+
+    task = Task(
+        name,
+        start_time.strftime("%Y-%m-%d %H:%M"),
+        end_time.strftime("%Y-%m-%d %H:%M") if end_time else None,
+        tid=tid,
+    )
+    if work_time is not None:
+        task.work_time = work_time
+    return task
+
+
+def legacy_summarize(aggregates):
+    summary = []
+    for group in aggregates:
+        group.task.work_time = group.work_time
+        summary.append(group.task)
+    return summary
+
+
+def see_all():
+    import app
+
+    args = {
+        "all": True,
+        "<query>": None,
+        "--detailed": False,
+        "--day-by-day": False,
+        "--dot-list": False,
+        "--ascii": True,
+    }
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        app.do_report(args)
+
+
+def measure():
+    gc.collect()
+    tracemalloc.start()
+    begin = time.perf_counter()
+    see_all()
+    elapsed = time.perf_counter() - begin
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=1000000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        os.environ["HOME"] = home
+        with open(os.path.join(home, ".letsdo.yaml"), "w") as cfile:
+            cfile.write("color: false\ndata_directory: %s\n" % home)
+        with open(os.path.join(home, "letsdo-history"), "w") as hfile:
+            hfile.writelines(synthetic_history(args.lines))
+
+        import app
+        from storage import get_storage
+
+        # build the history snapshot outside of the measures
+        for _ in get_storage().all_records():
+            pass
+
+        results = []
+        peak, elapsed = measure()
+        results.append(("history records", peak, elapsed))
+
+        app.HistoryRecord, app._summarize = legacy_record, legacy_summarize
+        peak, elapsed = measure()
+        results.append(("Task objects", peak, elapsed))
+
+    print("lets see all, %d history lines" % args.lines)
+    for label, peak, elapsed in results:
+        print("%-16s peak %8.1f MiB %8.2f s" % (label, peak / 2 ** 20, elapsed))
+    print("peak ratio %.2f" % (results[0][1] / results[1][1]))
+
+
+if __name__ == "__main__":
+    main()
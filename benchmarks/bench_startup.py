@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Measure the cold start time of each lets subcommand.
+
+Every subcommand runs in a fresh interpreter with -X importtime, against a
+temporary HOME. The best wall time of a few runs is compared with the
+subcommand budget, the script exits with an error if any budget is exceeded.
+
+Usage:
+    PYTHONPATH=src python benchmarks/bench_startup.py [--runs=N] [--scale=F]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI = os.path.join(ROOT, "src", "cli.py")
+
+# Budget in milliseconds of each subcommand, interpreter startup included
+BUDGETS = (
+    (["cancel"], 120),
+    (["stop"], 120),
+    (["do", "benchmark task"], 120),
+    (["see"], 200),
+)
+
+
+def run(args, home):
+    env = dict(os.environ, HOME=home, PYTHONPATH=os.path.join(ROOT, "src"))
+    begin = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", CLI] + args,
+        env=env,
+        cwd=home,
+        capture_output=True,
+        text=True,
+    )
+    elapsed = (time.perf_counter() - begin) * 1000
+    return elapsed, proc.stderr
+
+
+def top_imports(importtime, count=5):
+    """Return the slowest top-level imports as (cumulative us, module)"""
+    imports = []
+    for line in importtime.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, module = line.split("|")
+        if cumulative.strip().isdigit() and not module.startswith("  "):
+            imports.append((int(cumulative), module.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--scale", type=float, default=1.0, help="budget multiplier")
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as home:
+        with open(os.path.join(home, ".letsdo.yaml"), "w") as cfile:
+            cfile.write("color: true\ndata_directory: %s\n" % home)
+
+        for command, budget in BUDGETS:
+            results = [run(command, home) for _ in range(args.runs)]
+            best, importtime = min(results, key=lambda result: result[0])
+            budget *= args.scale
+            status = "ok" if best <= budget else "OVER BUDGET"
+            failed = failed or best > budget
+            print("%-22s %7.1f ms (budget %5.0f ms) %s" % (" ".join(command), best, budget, status))
+            for cumulative, module in top_imports(importtime):
+                print("    %7.1f ms  %s" % (cumulative / 1000, module))
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Time the main letsdo code paths on a synthetic history and write the results
+as JSON, to compare releases.
+
+The history is generated (see generator.py) in a temporary HOME and ends
+now, so that the relative queries (today, this week...) find tasks. Each
+benchmark runs once to warm up the caches, then --runs times.
+
+Usage:
+    PYTHONPATH=src python benchmarks/bench_suite.py [--lines=N] [--tags=N]
+        [--contexts=N] [--legacy-ratio=F] [--seed=N] [--runs=N]
+        [--output=FILE] [--baseline=FILE]
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from generator import add_arguments, generator_kwargs, synthetic_history
+
+# Number of strings timed in the str2datetime and sanitize benchmarks
+SAMPLE_SIZE = 10000
+
+
+def letsdo_version():
+    try:
+        from __version__ import version
+
+        return version
+    except ImportError:
+        pass
+    try:
+        from importlib.metadata import version
+
+        return version("letsdo")
+    except Exception:
+        return "unknown"
+
+
+def report_args(query=None, **options):
+    """Return the docopt arguments of lets see <query>"""
+    args = {
+        "all": query == "all",
+        "<query>": None if query == "all" else query,
+        "--detailed": False,
+        "--day-by-day": False,
+        "--dot-list": False,
+        "--ascii": True,
+    }
+    args.update(options)
+    return args
+
+
+def query_styles(history):
+    """Return the lets see queries to time, by name"""
+    last_end = datetime.strptime(history[-1].strip().split(",")[-1], "%Y-%m-%d %H:%M")
+    last_month = (last_end.replace(day=1) - timedelta(days=1)).strftime("%Y-%m")
+    return {
+        "today": report_args("today"),
+        "yesterday": report_args("yesterday"),
+        "this week": report_args("this week"),
+        "last month": report_args("last month"),
+        "date": report_args(last_end.strftime("%Y-%m-%d")),
+        "month": report_args(last_month),
+        "year": report_args(last_end.strftime("%Y")),
+        "tag": report_args("+project1"),
+        "tag and context": report_args("+project1 @ctx1"),
+        "tag alternatives": report_args("+project1 or @ctx2"),
+        "text": report_args("task 1"),
+        "all": report_args("all"),
+        "today detailed": report_args("today", **{"--detailed": True}),
+        "month day-by-day": report_args(last_month, **{"--day-by-day": True}),
+    }
+
+
+def timeit(function, runs):
+    """Return the durations in seconds of runs calls of function, after a warm up"""
+    function()
+    durations = []
+    for _ in range(runs):
+        begin = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - begin)
+    return durations
+
+
+def run_suite(history, runs):
+    """Return the durations of each benchmark, by name"""
+    import app
+    from history import sanitize
+    from timetoolkit import str2datetime
+
+    fields = [line.strip().split(",") for line in history[:SAMPLE_SIZE]]
+    times = [field[-1] for field in fields]
+    names = [field[1] for field in fields]
+
+    tasks = app.get_tasks()
+    grouped = app.group_task_by(tasks, "name")
+    last_month = query_styles(history)["month"]["<query>"]
+    since = datetime.strptime(last_month, "%Y-%m")
+    until = (since + timedelta(days=31)).replace(day=1)
+
+    benchmarks = {
+        "str2datetime": lambda: [str2datetime(string) for string in times],
+        "sanitize": lambda: [sanitize(name) for name in names],
+        "get_tasks all": app.get_tasks,
+        "get_tasks month": lambda: app.get_tasks(since=since, until=until),
+        "group_task_by name": lambda: app.group_task_by(tasks, "name"),
+        "group_task_by date": lambda: app.group_task_by(tasks, "date"),
+        "report_task": lambda: app.report_task(grouped, title="all", ascii=True),
+    }
+    for style, args in query_styles(history).items():
+        benchmarks["do_report %s" % style] = lambda args=args: app.do_report(dict(args))
+
+    results = {}
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for name, function in benchmarks.items():
+            results[name] = timeit(function, runs)
+    return results
+
+
+def compare(results, baseline_path):
+    """Print the ratio of each best time to the baseline one, on stderr"""
+    with open(baseline_path, encoding="utf-8") as bfile:
+        baseline = json.load(bfile)["results"]
+    print(
+        "%-28s %10s %10s %7s" % ("benchmark", "baseline", "current", "ratio"),
+        file=sys.stderr,
+    )
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]["best"], result["best"]
+        ratio = after / before if before else float("inf")
+        print(
+            "%-28s %8.1fms %8.1fms %6.2fx" % (name, before * 1000, after * 1000, ratio),
+            file=sys.stderr,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    add_arguments(parser)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="JSON results file, default stdout")
+    parser.add_argument("--baseline", help="JSON results file to compare with")
+    args = parser.parse_args()
+
+    history = synthetic_history(args.lines, end=datetime.now(), **generator_kwargs(args))
+    with tempfile.TemporaryDirectory() as home:
+        os.environ["HOME"] = home
+        with open(os.path.join(home, ".letsdo.yaml"), "w") as cfile:
+            cfile.write("color: false\ndata_directory: %s\n" % home)
+        with open(os.path.join(home, "letsdo-history"), "w", encoding="utf-8") as hfile:
+            hfile.writelines(history)
+
+        durations = run_suite(history, args.runs)
+
+    results = {
+        name: {
+            "best": min(runs),
+            "median": statistics.median(runs),
+            "runs": runs,
+        }
+        for name, runs in durations.items()
+    }
+    report = {
+        "version": letsdo_version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "parameters": dict(vars(args), output=None, baseline=None),
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as ofile:
+            json.dump(report, ofile, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Generate deterministic synthetic histories for the benchmarks.
+
+The same parameters (and seed) always give the same history, so results of
+different releases can be compared.
+
+Usage:
+    python benchmarks/generator.py [--lines=N] [--tags=N] [--contexts=N]
+        [--legacy-ratio=F] [--seed=N] [--end=now] <output>
+"""
+import argparse
+import random
+from datetime import datetime, timedelta
+
+# Start of the generated histories, unless they are anchored to an end time
+START = datetime(2015, 1, 1, 8, 0)
+
+
+def synthetic_history(
+    lines, legacy_ratio=0.1, seed=0, tags=7, contexts=3, names=300, end=None
+):
+    """Return a list of history lines, with some legacy 5-field ones
+
+    Task names use the given number of distinct +tags and @contexts. When end
+    is given the history is shifted so that the last task ends at end.
+    """
+    rnd = random.Random(seed)
+    choices = [
+        "task %d +project%d @ctx%d" % (i, i % tags, i % contexts) for i in range(names)
+    ]
+    start = START
+    tasks = []
+    for _ in range(lines):
+        start += timedelta(minutes=rnd.randint(5, 240))
+        end_time = start + timedelta(minutes=rnd.randint(1, 180))
+        tasks.append((rnd.choice(choices), start, end_time, rnd.random() < legacy_ratio))
+
+    shift = timedelta()
+    if end is not None and tasks:
+        shift = end.replace(second=0, microsecond=0) - tasks[-1][2]
+
+    history = []
+    for name, start, end_time, legacy in tasks:
+        start, end_time = start + shift, end_time + shift
+        start_str = start.strftime("%Y-%m-%d %H:%M")
+        end_str = end_time.strftime("%Y-%m-%d %H:%M")
+        if legacy:
+            work = str(end_time - start)[:-3]
+            history.append(
+                "%s,%s,%s,%s,%s\n" % (start.date(), name, work, start_str, end_str)
+            )
+        else:
+            history.append("%s,%s,%s,%s\n" % (start.date(), name, start_str, end_str))
+    return history
+
+
+def write_history(path, lines, **kwargs):
+    """Write a synthetic history to path, see synthetic_history"""
+    with open(path, "w", encoding="utf-8") as hfile:
+        hfile.writelines(synthetic_history(lines, **kwargs))
+
+
+def add_arguments(parser):
+    """Add the generator parameters to an argument parser"""
+    parser.add_argument("--lines", type=int, default=100000)
+    parser.add_argument("--tags", type=int, default=7, help="distinct +tags")
+    parser.add_argument("--contexts", type=int, default=3, help="distinct @contexts")
+    parser.add_argument("--legacy-ratio", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def generator_kwargs(args):
+    """Return the synthetic_history keyword arguments from parsed arguments"""
+    return {
+        "legacy_ratio": args.legacy_ratio,
+        "seed": args.seed,
+        "tags": args.tags,
+        "contexts": args.contexts,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    add_arguments(parser)
+    parser.add_argument("--end", choices=["now"], help="make the last task end now")
+    parser.add_argument("output")
+    args = parser.parse_args()
+
+    end = datetime.now() if args.end == "now" else None
+    write_history(args.output, args.lines, end=end, **generator_kwargs(args))
+
+
+if __name__ == "__main__":
+    main()
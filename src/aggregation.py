@@ -0,0 +1,64 @@
+"""
+This module keeps the single pass aggregation of tasks' work time
+"""
+from datetime import timedelta
+
+
+class Aggregate(object):
+    """Work time totals of all the tasks sharing the same key"""
+
+    __slots__ = ("task", "seconds", "count", "first_time", "last_time")
+
+    def __init__(self, task):
+        # the first task found for this key, it represents the whole group
+        self.task = task
+        self.seconds = 0
+        self.count = 0
+        self.first_time = None
+        self.last_time = None
+
+    @property
+    def work_time(self):
+        return timedelta(seconds=self.seconds)
+
+    def add(self, task):
+        """Account the given task in the totals"""
+        self.seconds += task.work_time // timedelta(seconds=1)
+        self.count += 1
+        end_time = task.end_time
+        if end_time:
+            if self.first_time is None or end_time < self.first_time:
+                self.first_time = end_time
+            if self.last_time is None or end_time > self.last_time:
+                self.last_time = end_time
+
+
+def by_uid(task):
+    return task.uid
+
+
+def by_date_and_uid(task):
+    return task.last_end_date, task.uid
+
+
+def by_source_and_uid(task):
+    return task.source, task.uid
+
+
+def by_date_source_and_uid(task):
+    return task.last_end_date, task.source, task.uid
+
+
+def aggregate(tasks, key=by_uid):
+    """Aggregate tasks by key in a single pass
+
+    Returns a dictionary key -> Aggregate, in order of first appearance.
+    """
+    aggregates = {}
+    for task in tasks:
+        group_key = key(task)
+        group = aggregates.get(group_key)
+        if group is None:
+            group = aggregates[group_key] = Aggregate(task)
+        group.add(task)
+    return aggregates
@@ -1,17 +1,19 @@
-import os
-import re
 from datetime import datetime, timedelta
-from terminaltables import SingleTable, AsciiTable
 from tasks import Task
-from log import LOGGER, RAFFAELLO
-from configuration import get_configuration, get_history_file_path
-from timetoolkit import str2datetime, strfdelta
-
+from log import LOGGER
+from colors import paint
+from configuration import get_history_file_path
+from timetoolkit import strfdelta
+from aggregation import aggregate, by_source_and_uid, by_date_source_and_uid
+from storage import get_storage
+from record import HistoryRecord
+from query import compile_query
+from profiling import phase, profiled
+
+@profiled("colorize")
 def _p(msg):
     """Colorize message"""
-    if msg and get_configuration()["color"] and RAFFAELLO:
-        return RAFFAELLO.paint(str(msg))
-    return msg
+    return paint(msg)
 
 
 FORMAT = "%Y-%m-%d %H:%M"
@@ -28,12 +30,11 @@ def store_task(task: Task):
 
 def work_on(task_id=0, start_time_str=None):
     """Start given task id"""
-    tasks = get_tasks(condition=lambda x: x.tid == task_id)
-    tasks = group_task_by(tasks, group="name")
-    if not tasks:
+    # Task IDs are assigned newest first, the first match is the one
+    task = next((x for x in iter_tasks() if x.tid == task_id), None)
+    if not task:
         LOGGER.error("could not find task ID '%s'", task_id)
     else:
-        task = tasks[0]
         start_time = None
         if start_time_str:
             date_str = datetime.strftime(datetime.today(), "%Y-%m-%d")
@@ -42,96 +43,142 @@ def work_on(task_id=0, start_time_str=None):
         Task(task.name, start_str=start_time).start()
 
 
-def sanitize(text):
-    """Remove symbols, dates and Markdown syntax from text"""
-    # remove initial list symbol (if any)
-    if re.match(r"^[\-\*]", text):
-        text = re.sub(r"^[\-\*]", "", text)
+def iter_tasks(since=None, until=None, tags=None):
+    """Yield the tasks ended in [since, until), newest first
 
-    # remove initial date (yyyy-mm-dd)
-    if re.match(r"^\s*\d+-\d+-\d+\s+", text):
-        text = re.sub(r"^\s*\d+-\d+-\d+\s+", "", text)
+    When tags is given (see tagindex.parse_tag_query) only the tasks matching
+    the tag query are considered. The history is read lazily, stop iterating
+    to stop reading it.
+    """
+    try:
+        storage = get_storage()
+        if not storage.exists():
+            LOGGER.info("No Task recorded yet")
+            return
 
-    # remove initial date (yy\date-of-year)
-    if re.match(r"^\s*\d+/\d+\s+", text):
-        text = re.sub(r"^\s*\d+/\d+\s+", "", text)
+        if tags:
+            records = storage.iter_tagged_records(tags, since, until)
+        else:
+            records = storage.iter_records(since, until)
+        # merged histories add the label of the source
+        for name, uid, tid, start_time, end_time, *source in records:
+            yield HistoryRecord(
+                name, start_time, end_time, tid=tid, uid=uid, source=source[0] if source else None
+            )
+    except IOError as error:
+        LOGGER.error("could not get tasks' history: %s", error)
 
-    # remove markdown links
-    md_link = re.compile(r"\[(.*)\]\(.*\)")
-    has_link = md_link.search(text)
-    if has_link:
-        link_name = md_link.findall(text)
-        text = re.sub(r"\[(.*)\]\(.*\)", link_name[0], text)
 
-    return text
+@profiled("get_tasks")
+def get_tasks(condition=None, since=None, until=None, tags=None):
+    """Get all tasks by condition
 
+    When since or until are given, only the tasks ended in [since, until)
+    are read from the history. When tags is given, only the tasks matching
+    the tag query are read.
+    """
+    if since is not None or until is not None or tags:
+        with phase("history"):
+            tasks = list(iter_tasks(since, until, tags))
+        with phase("filter"):
+            return list(filter(condition, tasks))
 
-def get_tasks(condition=None):
-    """Get all tasks by condition"""
     tasks = []
-
-    tid = 0
-    uids = dict()
     try:
-        history_file_path = get_history_file_path()
-        if not os.path.exists(history_file_path):
+        storage = get_storage()
+        if not storage.exists():
             LOGGER.info("No Task recorded yet")
             return []
 
-        with open(get_history_file_path()) as cfile:
-            for line in reversed(cfile.readlines()):
-                fields = line.strip().split(",")
-                if not fields[1]:
-                    continue
-
-                # Take care of old history format with worked_time
-                if len(fields) == 5:
-                    task = Task(
-                        name=sanitize(fields[1]), start_str=fields[3], end_str=fields[4]
+        with phase("history"):
+            for name, uid, tid, start_time, end_time, *source in storage.all_records():
+                tasks.append(
+                    HistoryRecord(
+                        name,
+                        start_time,
+                        end_time,
+                        tid=tid,
+                        uid=uid,
+                        source=source[0] if source else None,
                     )
-                elif len(fields) == 4:
-                    task = Task(
-                        name=sanitize(fields[1]), start_str=fields[2], end_str=fields[3]
-                    )
-                else:
-                    raise Exception(
-                        "History unexpected fields ({}: {})".format(len(fields), fields)
-                    )
-
-                # Tasks with same UID share the same Task ID as well
-                # Integer IDs are easier to use than hash IDs
-                if task.uid not in uids:
-                    tid += 1
-                    uids[task.uid] = tid
-                task.tid = uids[task.uid]
-                tasks.append(task)
+                )
 
-        conditioned = filter(condition, tasks)
-        return list(conditioned)
+        with phase("filter"):
+            conditioned = filter(condition, tasks)
+            return list(conditioned)
     except IOError as error:
         LOGGER.error("could not get tasks' history: %s", error)
         return []
 
 
+@profiled("get_task_summary")
+def get_task_summary(since=None, until=None, tags=None, by_day=False):
+    """Get the tasks ended in [since, until) grouped by name
+
+    When tags is given (see tagindex.parse_tag_query) only the tasks matching
+    the tag query are considered. When by_day is true, returns a dictionary
+    date -> tasks grouped by name that day.
+    The aggregation is done by the storage backend when supported.
+    """
+    rows = None
+    try:
+        storage = get_storage()
+        if not storage.exists():
+            LOGGER.info("No Task recorded yet")
+            return {} if by_day else []
+
+        if storage.can_aggregate:
+            rows = list(storage.aggregate(since, until, tags=tags, by_day=by_day))
+    except ValueError as error:
+        LOGGER.debug("could not aggregate in storage: %s", error)
+    except IOError as error:
+        LOGGER.error("could not get tasks' history: %s", error)
+        return {} if by_day else []
+
+    if rows is None:
+        tasks = get_tasks(since=since, until=until, tags=tags)
+        if by_day:
+            return group_by_day(tasks)
+        return group_task_by(tasks, "name")
+
+    tasks = [
+        HistoryRecord(
+            name,
+            start_time,
+            end_time,
+            tid=tid,
+            uid=uid,
+            work_time=timedelta(seconds=seconds),
+            source=source[0] if source else None,
+        )
+        for name, uid, tid, start_time, end_time, seconds, *source in rows
+    ]
+    if by_day:
+        day_map = {}
+        for task in tasks:
+            day_map.setdefault(task.last_end_date, []).append(task)
+        return day_map
+    return tasks
+
+
+def _summarize(aggregates):
+    """Return the representative task of each aggregate with its total work time"""
+    return [group.task.with_work_time(group.work_time) for group in aggregates]
+
+
+def group_by_day(tasks):
+    """Return a dictionary date -> tasks grouped by name that day"""
+    day_map = {}
+    for (date, _, _), group in aggregate(tasks, key=by_date_source_and_uid).items():
+        day_map.setdefault(date, []).append(group)
+    return {date: _summarize(groups) for date, groups in day_map.items() if date}
+
+
 def group_task_by(tasks, group=None):
     """Group given task by name or date"""
     if group == "name":
-        uniques = []
-        for task in tasks:
-            if task not in uniques:
-                uniques.append(task)
-
-        for main_task in uniques:
-            work_time_in_seconds = sum(
-                [
-                    same_task.work_time.seconds
-                    for same_task in tasks
-                    if same_task == main_task
-                ]
-            )
-            work_time = timedelta(seconds=work_time_in_seconds)
-            main_task.work_time = work_time
-        return uniques
+        # the same task in two histories is reported twice
+        return _summarize(aggregate(tasks, key=by_source_and_uid).values())
 
     if group == "date":
         task_map = {}
@@ -147,18 +194,36 @@ def group_task_by(tasks, group=None):
     return tasks
 
 
-def report_task(tasks, title=None, detailed=False, ascii=False):
-    """Display table with tasks data"""
+# Descriptions longer than this are wrapped on more lines
+HARD_MAX_LINE_LENGTH = 72
+INDENT_STRING = "\n⤷ "
 
-    table_data = [["ID", "Last update", "Work time", "Description"]]
-    if detailed:
-        table_data = [["ID", "Last update", "Work time", "Interval", "Description"]]
-        tasks = sorted(tasks, key=lambda x: x.end_time, reverse=True)
+# Reports with more rows than this are printed by the streaming renderer
+STREAM_THRESHOLD = 500
+
+
+def _wrap(name):
+    """smart break message at boundaries"""
+    current_text_segment = name
+    wrapped_lines = []
+
+    while current_text_segment:
+        if len(current_text_segment) <= HARD_MAX_LINE_LENGTH:
+            wrapped_lines.append(current_text_segment)
+            break
+
+        # try to break at a words boundary as close as possible to the limit
+        split_at = min(current_text_segment.rfind(" "), HARD_MAX_LINE_LENGTH)
+        wrapped_lines.append(current_text_segment[:split_at])
+
+        remaining_part = current_text_segment[split_at:].lstrip()
+        current_text_segment = INDENT_STRING + remaining_part
+
+    return "".join(wrapped_lines)
 
-    tot_work_time = timedelta()
-    for task in tasks:
-        tot_work_time += task.work_time
 
+def _task_rows(tasks, tot_work_time, detailed, sources=False):
+    """Yield the report table row of each task, with its source history if sources"""
     for task in tasks:
         last_time = ""
         if task.last_end_date:
@@ -173,43 +238,62 @@ def report_task(tasks, title=None, detailed=False, ascii=False):
 
         time = "{} {:2d}%".format(strfdelta(task.work_time, fmt="{H:2}h {M:02}m"), perc)
 
-        # smart break message at boundaries
-        task_name = task.name
-        HARD_MAX_LINE_LENGTH = 72
-        INDENT_STRING = "\n⤷ "
-
-        current_text_segment = task.name
-        wrapped_lines = []
-
-        while current_text_segment:
-            if len(current_text_segment) <= HARD_MAX_LINE_LENGTH:
-                wrapped_lines.append(current_text_segment)
-                break
-
-            # try to break at a words boundary as close as possible to the limit
-            split_at = min(current_text_segment.rfind(" "), HARD_MAX_LINE_LENGTH)
-            wrapped_lines.append(current_text_segment[:split_at])
-
-            remaining_part = current_text_segment[split_at:].lstrip()
-            current_text_segment = INDENT_STRING + remaining_part
-
-        task_name = "".join(wrapped_lines)
-
+        row = [_p(task.tid), _p(last_time), _p(time)]
         if detailed:
             begin = task.start_time.strftime("%H:%M")
             end = task.end_time.strftime("%H:%M")
-            interval = "{} -> {}".format(begin, end)
-
-            row = [_p(task.tid), _p(last_time), _p(time), _p(interval), _p(task_name)]
-        else:
-            row = [_p(task.tid), _p(last_time), _p(time), _p(task_name)]
+            row.append(_p("{} -> {}".format(begin, end)))
+        if sources:
+            # the running task is not a history record
+            row.append(_p(getattr(task, "source", None) or ""))
+        row.append(_p(_wrap(task.name)))
+        yield row
+
+
+def _stream_task_rows(header, rows, footer, tasks, title, ascii):
+    """Print the report table row by row, see render.StreamingTable"""
+    from render import StreamingTable, visible_width
+
+    # bounds known without formatting the rows
+    widths = [0] * len(header)
+    widths[0] = max(len(str(task.tid)) for task in tasks)
+    widths[-1] = min(max(len(task.name) for task in tasks), HARD_MAX_LINE_LENGTH)
+    # the footer is printed last, after the widths are settled
+    for column, cell in enumerate(footer):
+        widths[column] = max(widths[column], visible_width(str(cell)))
+    justify = ["right", "center", "right"] + ["left"] * (len(header) - 3)
+
+    table = StreamingTable(header, widths, justify, title=title, ascii=ascii)
+    for row in rows:
+        table.add_row(row)
+    table.close(footer)
+
+
+@profiled("report_task")
+def report_task(tasks, title=None, detailed=False, ascii=False, stream=None):
+    """Display table with tasks data
+
+    Large reports (see STREAM_THRESHOLD) are printed as soon as each row is
+    ready, stream forces (True) or prevents (False) this.
+    """
 
-        table_data.append(row)
+    header = ["ID", "Last update", "Work time", "Description"]
+    if detailed:
+        header = ["ID", "Last update", "Work time", "Interval", "Description"]
+        tasks = sorted(tasks, key=lambda x: x.end_time, reverse=True)
+    # merged histories, see storage.MergedStorage
+    sources = any(getattr(task, "source", None) for task in tasks)
+    if sources:
+        header.insert(-1, "Source")
 
     if len(tasks) == 0:
         print(_p("Nothing to show for %s" % title))
         return
 
+    tot_work_time = timedelta()
+    for task in tasks:
+        tot_work_time += task.work_time
+
     if title:
         title = " %s " % title
 
@@ -217,142 +301,124 @@ def report_task(tasks, title=None, detailed=False, ascii=False):
         recap = "activities,"
     else:
         recap = "activity,"
-    table_data.append(
-        [
-            len(tasks),
-            recap,
-            "total time:",
-            _p(strfdelta(tot_work_time, fmt="{H:2}h {M:02}m")),
-        ]
-    )
-
-    if ascii:
-        table = AsciiTable(table_data, title)
-    else:
-        table = SingleTable(table_data, title)
-
-    table.outer_border = True
-    table.inner_column_border = False
-    table.inner_heading_row_border = True
-    table.inner_footing_row_border = True
-    table.justify_columns[0] = "right"
-    table.justify_columns[1] = "center"
-    table.justify_columns[2] = "right"
-    table.justify_columns[3] = "left"
-
-    print("")
-    print(table.table)
-
-
-def __is_a_month(string):
-    months = [
-        "jan",
-        "feb",
-        "mar",
-        "apr",
-        "may",
-        "jun",
-        "jul",
-        "aug",
-        "sep",
-        "oct",
-        "nov",
-        "dec",
+    footer = [
+        len(tasks),
+        recap,
+        "total time:",
+        _p(strfdelta(tot_work_time, fmt="{H:2}h {M:02}m")),
     ]
-    if string.lower() in months:
-        return True
-
-    for month in months:
-        if month in string.lower():
-            return True
 
-    return False
+    if stream is None:
+        stream = len(tasks) > STREAM_THRESHOLD
+    if stream:
+        with phase("stream"):
+            print("")
+            _stream_task_rows(
+                header,
+                _task_rows(tasks, tot_work_time, detailed, sources),
+                footer,
+                tasks,
+                title,
+                ascii,
+            )
+        return
 
+    with phase("rows"):
+        table_data = [header]
+        table_data.extend(_task_rows(tasks, tot_work_time, detailed, sources))
+        table_data.append(footer)
 
-def __get_time_format_from_query(query):
-    format = "%Y-%m-%d"
+    with phase("table"):
+        from terminaltables import SingleTable, AsciiTable
 
-    if not query:
-        return format
+        if ascii:
+            table = AsciiTable(table_data, title)
+        else:
+            table = SingleTable(table_data, title)
 
-    if "last year" in query:
-        format = "%Y"
-    elif "week" in query:
-        format = "%V"
-        week_check = True
-    elif "month" in query or __is_a_month(query):
-        format = "%Y-%m"
+        table.outer_border = True
+        table.inner_column_border = False
+        table.inner_heading_row_border = True
+        table.inner_footing_row_border = True
+        table.justify_columns[0] = "right"
+        table.justify_columns[1] = "center"
+        table.justify_columns[2] = "right"
+        table.justify_columns[3] = "left"
+        output = table.table
 
-    return format
+    with phase("print"):
+        print("")
+        print(output)
 
 
-def __get_task_condition_from_query(query):
-    format = __get_time_format_from_query(query)
-    try:
-        query = datetime.strftime(str2datetime(query), format)
-    except:
-        LOGGER.debug("query '%s' does not seems a date", query)
-
-    if format == "%V":
-        condition = lambda x: x.week_no == query and x.end_time.strftime(
-            "%Y"
-        ) == datetime.now().strftime("%Y")
-    else:
-        condition = lambda x: not query or (
-            query in str(x.last_end_date) or query in x.name
-        )
+@profiled("do_report")
+def do_report(args):
+    """Wrap show reports"""
+    from render import pager
 
-    return condition, query, format
+    with pager(enabled=args.get("--pager")):
+        _do_report(args)
 
 
-def do_report(args):
-    """Wrap show reports"""
+def _do_report(args):
 
     if not args["all"] and not args["<query>"]:
         args["<query>"] = "today"
 
-    query = args["<query>"]
+    with phase("query"):
+        try:
+            query = compile_query(args["<query>"])
+        except ValueError as error:
+            LOGGER.error("invalid query: %s", error)
+            return
 
-    condition, date, format = __get_task_condition_from_query(query)
+    since, until, tags, condition = query.since, query.until, query.tags, query.condition
+    title = query.title
 
-    if format == "%V":
-        title = "week {}".format(date)
-    else:
-        title = "{}".format(date)
+    # date ranges, tags and the whole history are summarized by the storage,
+    # only the detailed reports and the text queries read the records
+    summary = not args["--detailed"] and condition is None
 
-    tasks = get_tasks(condition)
+    if args["--day-by-day"]:
+        if summary:
+            day_map = get_task_summary(since, until, tags=tags, by_day=True)
+        else:
+            tasks = get_tasks(condition, since=since, until=until, tags=tags)
+            with phase("group"):
+                day_map = group_by_day(tasks)
+
+        for key in sorted(day_map.keys()):
+            sorted_by_time = sorted(day_map[key], key=lambda x: x.work_time, reverse=True)
+
+            report_task(sorted_by_time)
+        return
+
+    if summary:
+        tasks = get_task_summary(since, until, tags=tags)
+    else:
+        tasks = get_tasks(condition, since=since, until=until, tags=tags)
 
     if args["--detailed"]:
         tasks.reverse()
         report_task(tasks, title=title, detailed=True, ascii=args["--ascii"])
         return
 
-    if args["--day-by-day"]:
-        task_map = group_task_by(tasks, "date")
-
-        for key in sorted(task_map.keys()):
-            if not key:
-                continue
+    if not summary:
+        with phase("group"):
+            tasks = group_task_by(tasks, "name")
 
-            task = group_task_by(task_map[key], "name")
-            sorted_by_time = sorted(task, key=lambda x: x.work_time, reverse=True)
-
-            report_task(sorted_by_time)
-        return
-
-    tasks = group_task_by(tasks, "name")
     if args["--dot-list"]:
         print(_p("\n{}".format(title)))
 
         for task in tasks:
-            print(_p(" ● (%s) %s" % (task.tid, task.name)))
+            if task.source:
+                print(_p(" ● (%s) %s [%s]" % (task.tid, task.name, task.source)))
+            else:
+                print(_p(" ● (%s) %s" % (task.tid, task.name)))
         return
 
     running = Task.get_running()
-    current_running = ["today", "now", "this week", "this month"]
-    if running and (
-        not query or query.lower() in current_running or query in running.name
-    ):
+    if running and query.matches(running.name, datetime.now()):
         running.tid = "R"
         running.work_time = datetime.now() - running.start_time
         running.end_time = running.start_time
@@ -0,0 +1,477 @@
+"""
+This module keeps the sealed segments of the tasks' history.
+
+    lets archive            # seal the closed years
+    lets archive --monthly  # seal the closed months
+
+The history file only keeps the current period. The tasks ended in closed
+periods are sealed, in history order, in gzip compressed segments next to it
+(letsdo-history.2021.gz, letsdo-history.2022-03.gz...), which are never
+written again unless a late task ends in their period. The manifest
+(letsdo-history.manifest, JSON) records for each segment its period, the
+range of its end times, its totals and tags, and the order of its tasks by
+recency, so that the queries open only the segments they need. The work
+time of each task by period is kept next to each segment
+(letsdo-history.2021.gz.totals, see totals.Totals) for the summaries. It also
+records the order of all the tasks by recency when the history was last
+archived, so that the task IDs do not change when lines appended out of
+order are sealed away from their neighbours.
+
+The whole history is the segments, oldest first, followed by the history
+file.
+"""
+import gzip
+import io
+import json
+import os
+import re
+import zlib
+from datetime import datetime
+
+from dayindex import load_day_index
+from history import (
+    decode_line,
+    end_time_key,
+    is_read_only,
+    iter_lines_reversed,
+    locked_history,
+    region_crcs,
+    time_key,
+)
+from log import LOGGER
+from names import identify
+from tagindex import find_tags
+from totals import Totals, totals_path
+
+
+MANIFEST_SUFFIX = ".manifest"
+SEGMENT_SUFFIX = ".gz"
+
+MANIFEST_VERSION = 1
+
+# Periods of the segment files, years or months
+PERIOD_PATTERN = re.compile(r"^\d{4}(-\d{2})?$")
+
+TIME_FORMAT = "%Y-%m-%d %H:%M"
+
+# Loaded manifests by path: (mtime_ns, size, segments, order, kept)
+_MANIFESTS = {}
+
+
+def manifest_path(history_path):
+    """Return the manifest file path of the given history"""
+    return history_path + MANIFEST_SUFFIX
+
+
+def segment_path(history_path, period):
+    """Return the path of the segment of a period (2021 or 2021-03)"""
+    return "%s.%s%s" % (history_path, period, SEGMENT_SUFFIX)
+
+
+def period_of(end_time, monthly=False):
+    """Return the period of a task end time, its year or its month"""
+    if monthly:
+        return end_time.strftime("%Y-%m")
+    return end_time.strftime("%Y")
+
+
+class Segment(object):
+    """A sealed part of the history, as recorded in the manifest"""
+
+    def __init__(self, path, period):
+        self.path = path
+        self.period = period
+        # end times of the oldest and of the newest task
+        self.first = None
+        self.last = None
+        self.records = 0
+        self.seconds = 0
+        # CRC of the uncompressed lines
+        self.crc = 0
+        self.tags = set()
+        # task uids, the most recent first
+        self.uids = []
+
+    def overlaps(self, since=None, until=None):
+        """Tell whether some task of the segment may have ended in [since, until)"""
+        if self.first is None:
+            return False
+        if since is not None and self.last < since:
+            return False
+        return until is None or self.first < until
+
+    def has_tags(self, alternatives):
+        """Tell whether some task of the segment may match a tag query"""
+        return any(all(tag in self.tags for tag in alternative) for alternative in alternatives)
+
+    def read(self):
+        """Return the uncompressed history lines of the segment"""
+        with gzip.open(self.path, "rb") as sfile:
+            return sfile.read()
+
+    def account(self, data):
+        """Compute the manifest entry from the uncompressed lines"""
+        self.first = self.last = None
+        self.records, self.seconds = 0, 0
+        self.crc = zlib.crc32(data)
+        self.tags = set()
+        lasts = {}
+        for line in data.split(b"\n"):
+            if not line.strip():
+                continue
+            record = decode_line(line.decode("utf-8", errors="replace"))
+            if not record:
+                continue
+            name, start_time, end_time = record
+            lasts[identify(name).uid] = self.records
+            self.records += 1
+            self.tags.update(find_tags(name))
+            if end_time:
+                self.first = min(self.first or end_time, end_time)
+                self.last = max(self.last or end_time, end_time)
+                if start_time:
+                    self.seconds += int((end_time - start_time).total_seconds())
+        self.uids = sorted(lasts, key=lasts.get, reverse=True)
+
+    def write(self, data):
+        """Compress the lines in the segment file atomically, and account them"""
+        tmp_path = "%s.%d.tmp" % (self.path, os.getpid())
+        with gzip.open(tmp_path, "wb") as sfile:
+            sfile.write(data)
+        os.replace(tmp_path, self.path)
+        self.account(data)
+        self.dump_totals(data)
+
+    def dump_totals(self, data):
+        """Write the totals of the uncompressed lines next to the segment"""
+        totals = Totals()
+        totals.extend(data, 0)
+        # marks the segment lines the totals were made from
+        totals.size, totals.head_crc, totals.tail_crc = len(data), self.crc, self.crc
+        if is_read_only(self.path):
+            return totals
+        try:
+            totals.dump(totals_path(self.path))
+        except IOError as error:
+            LOGGER.debug("could not save the totals of %s: %s", self.path, error)
+        return totals
+
+    def load_totals(self):
+        """Return the totals.Totals of the segment, made again if it changed"""
+        totals = Totals.load(totals_path(self.path))
+        if totals is None or (totals.head_crc, totals.records) != (self.crc, self.records):
+            LOGGER.debug("accounting %s", self.path)
+            totals = self.dump_totals(self.read())
+        return totals
+
+    def to_dict(self):
+        return {
+            "file": os.path.basename(self.path),
+            "period": self.period,
+            "first": self.first.strftime(TIME_FORMAT) if self.first else None,
+            "last": self.last.strftime(TIME_FORMAT) if self.last else None,
+            "records": self.records,
+            "seconds": self.seconds,
+            "crc": self.crc,
+            "tags": sorted(self.tags),
+            "uids": self.uids,
+        }
+
+    @staticmethod
+    def from_dict(directory, entry):
+        segment = Segment(os.path.join(directory, entry["file"]), entry["period"])
+        if entry["first"]:
+            segment.first = datetime.strptime(entry["first"], TIME_FORMAT)
+            segment.last = datetime.strptime(entry["last"], TIME_FORMAT)
+        segment.records = entry["records"]
+        segment.seconds = entry["seconds"]
+        segment.crc = entry["crc"]
+        segment.tags = set(entry["tags"])
+        segment.uids = entry["uids"]
+        return segment
+
+    def __repr__(self):
+        return "Segment(%r, %d records)" % (self.period, self.records)
+
+
+def _load(history_path):
+    path = manifest_path(history_path)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return [], None, None
+    cached = _MANIFESTS.get(path)
+    if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2:]
+
+    try:
+        with open(path, encoding="utf-8") as mfile:
+            manifest = json.load(mfile)
+        if manifest.get("version") != MANIFEST_VERSION:
+            raise ValueError("unknown version %r" % manifest.get("version"))
+        directory = os.path.dirname(history_path)
+        segments = [Segment.from_dict(directory, entry) for entry in manifest["segments"]]
+    except (OSError, ValueError, KeyError, TypeError) as error:
+        raise IOError("could not read %s: %s" % (path, error))
+    segments.sort(key=lambda segment: segment.period, reverse=True)
+    entry = (segments, manifest.get("order"), manifest.get("kept"))
+    _MANIFESTS[path] = (stat.st_mtime_ns, stat.st_size) + entry
+    return entry
+
+
+def load_manifest(history_path):
+    """Return the sealed segments of a history, the most recent first
+
+    Returns an empty list when the history has no sealed segment.
+    """
+    return _load(history_path)[0]
+
+
+def dump_manifest(history_path, segments, order=None, kept=None):
+    """Write the manifest of the segments atomically
+
+    order is the task uids of the whole history by recency when it was
+    archived, kept the size and CRCs (see history.region_crcs) of the
+    history file then.
+    """
+    path = manifest_path(history_path)
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "segments": [segment.to_dict() for segment in segments],
+    }
+    if order is not None:
+        manifest["order"] = order
+        manifest["kept"] = kept
+    with open(tmp_path, "w", encoding="utf-8") as mfile:
+        json.dump(manifest, mfile, indent=1)
+    os.replace(tmp_path, path)
+    _MANIFESTS.pop(path, None)
+
+
+def _only_appended(history_path, kept):
+    """Tell whether the history file only grew since it was archived"""
+    try:
+        with open(history_path, "rb") as hfile:
+            if os.fstat(hfile.fileno()).st_size < kept["size"]:
+                return False
+            return list(region_crcs(hfile, kept["size"])[:2]) == kept["crcs"]
+    except FileNotFoundError:
+        return kept["size"] == 0
+
+
+def extend_tids(history_path, index):
+    """Return the task IDs of the whole history
+
+    index is the day index of the history file. The tasks appended since the
+    history was archived come first, then the tasks in the order recorded by
+    archive_history. When the history file was edited since, or for the
+    tasks not recorded, the tasks of the history file come first, then the
+    ones of the segments, the most recent first.
+    """
+    segments, order, kept = _load(history_path)
+    tids = {}
+
+    def assign(uids):
+        for uid in uids:
+            if uid not in tids:
+                tids[uid] = len(tids) + 1
+
+    file_tids = index.tids()
+    if order is not None and _only_appended(history_path, kept):
+        assign(uid for uid in file_tids if index.lasts[uid] >= kept["size"])
+        # tasks removed by hand since do not take an ID
+        known = set(file_tids).union(*(segment.uids for segment in segments))
+        assign(uid for uid in order if uid in known)
+    assign(file_tids)
+    for segment in segments:
+        assign(segment.uids)
+    return tids
+
+
+def iter_sealed_records(segments, tids, since=None, until=None, tags=None):
+    """Yield the records of the segments ended in [since, until), newest first
+
+    Records are (name, uid, tid, start_time, end_time) tuples, tids are the
+    task IDs of the whole history (see extend_tids). When tags is given (see
+    tagindex.parse_tag_query) only the records matching it are yielded. Only
+    the segments which may hold such records are read.
+    """
+    since_key = time_key(since) if since is not None else None
+    until_key = time_key(until) if until is not None else None
+    for segment in segments:
+        if not segment.overlaps(since, until) or (tags and not segment.has_tags(tags)):
+            continue
+        LOGGER.debug("reading %s", segment.path)
+        for _, line in iter_lines_reversed(segment.read()):
+            key = end_time_key(line)
+            if key is not None and (
+                (since_key is not None and key < since_key)
+                or (until_key is not None and key > until_key)
+            ):
+                continue
+            record = decode_line(line.decode("utf-8", errors="replace"))
+            if not record:
+                continue
+            name, start_time, end_time = record
+            if not end_time:
+                continue
+            if since is not None and end_time < since:
+                continue
+            if until is not None and end_time >= until:
+                continue
+            if tags:
+                found = find_tags(name)
+                if not any(all(tag in found for tag in alternative) for alternative in tags):
+                    continue
+            uid = identify(name).uid
+            yield name, uid, tids[uid], start_time, end_time
+
+
+def archive_history(history_path, monthly=False, now=None):
+    """Seal the tasks of the history ended in closed periods, see the module documentation
+
+    Tasks ending in the period of a sealed segment are added to it, the
+    others go to the segment of their year (or month when monthly is true).
+    Tasks of the current period and lines without an end time stay in the
+    history file. Returns the segments written.
+
+    The history is locked against the tasks stopped meanwhile. The segments
+    are written first, then the history, then the manifest: when interrupted
+    in between, no task is counted twice and lets rebuild lists the segments
+    missing from the manifest.
+    """
+    current = period_of(now or datetime.now(), monthly)
+    segments = {segment.period: segment for segment in load_manifest(history_path)}
+    sealed = {}
+    kept = []
+    with locked_history(history_path, "rb") as hfile:
+        for line in hfile:
+            record = None
+            if line.strip():
+                record = decode_line(line.decode("utf-8", errors="replace"))
+            end_time = record[2] if record else None
+            if end_time is None:
+                kept.append(line)
+                continue
+            # a sealed segment of the year or of the month, else a new one
+            period = next(
+                (
+                    period
+                    for period in (period_of(end_time), period_of(end_time, True))
+                    if period in segments
+                ),
+                period_of(end_time, monthly),
+            )
+            if period >= current and period not in segments:
+                kept.append(line)
+                continue
+            if not line.endswith(b"\n"):
+                line += b"\n"
+            sealed.setdefault(period, []).append(line)
+
+        if not sealed:
+            return []
+
+        # task IDs of the whole history, kept once its lines are sealed
+        tids = extend_tids(history_path, load_day_index(history_path))
+        order = sorted(tids, key=tids.get)
+        kept_data = b"".join(kept)
+        kept_crcs = list(region_crcs(io.BytesIO(kept_data), len(kept_data))[:2])
+
+        written = []
+        for period, lines in sorted(sealed.items()):
+            segment = segments.get(period)
+            data = b""
+            if segment is None:
+                segment = segments[period] = Segment(segment_path(history_path, period), period)
+            else:
+                data = segment.read()
+            segment.write(data + b"".join(lines))
+            written.append(segment)
+            LOGGER.debug("sealed %d tasks in %s", len(lines), segment.path)
+
+        tmp_path = "%s.%d.tmp" % (history_path, os.getpid())
+        with open(tmp_path, "wb") as tfile:
+            tfile.write(kept_data)
+        os.replace(tmp_path, history_path)
+
+    dump_manifest(
+        history_path,
+        sorted(segments.values(), key=lambda segment: segment.period),
+        order,
+        {"size": len(kept_data), "crcs": kept_crcs},
+    )
+    return written
+
+
+def iter_history_lines(history_path):
+    """Yield the lines of the whole history, oldest first"""
+    for segment in reversed(load_manifest(history_path)):
+        for line in segment.read().decode("utf-8", errors="replace").splitlines(True):
+            yield line
+    if os.path.exists(history_path):
+        with open(history_path, encoding="utf-8", errors="replace") as hfile:
+            yield from hfile
+
+
+def _segment_files(history_path):
+    """Return the period of each segment file next to the history"""
+    directory = os.path.dirname(history_path) or "."
+    prefix = os.path.basename(history_path) + "."
+    periods = {}
+    for file_name in os.listdir(directory):
+        if file_name.startswith(prefix) and file_name.endswith(SEGMENT_SUFFIX):
+            period = file_name[len(prefix) : -len(SEGMENT_SUFFIX)]
+            if PERIOD_PATTERN.match(period):
+                periods[period] = os.path.join(directory, file_name)
+    return periods
+
+
+def rebuild_manifest(history_path):
+    """Account the sealed segments again, e.g. after editing one by hand
+
+    Segment files missing from the manifest (e.g. when archive_history was
+    interrupted) are added to it.
+    """
+    segments, order, kept = _load(history_path)
+    listed = {segment.period for segment in segments}
+    for period, path in _segment_files(history_path).items():
+        if period not in listed:
+            LOGGER.info("adding %s to the manifest", path)
+            segments = segments + [Segment(path, period)]
+    if not segments:
+        return
+    for segment in segments:
+        data = segment.read()
+        segment.account(data)
+        segment.dump_totals(data)
+    dump_manifest(history_path, sorted(segments, key=lambda segment: segment.period), order, kept)
+
+
+def check_segments(history_path):
+    """Compare the sealed segments with the manifest
+
+    Returns a list of problems, empty when the segments are consistent.
+    """
+    try:
+        segments = load_manifest(history_path)
+    except IOError as error:
+        return [str(error)]
+
+    problems = []
+    listed = {segment.period for segment in segments}
+    for period, path in sorted(_segment_files(history_path).items()):
+        if period not in listed:
+            problems.append("segment %s is not in the manifest" % path)
+    for segment in segments:
+        try:
+            data = segment.read()
+        except (OSError, EOFError) as error:
+            problems.append("could not read segment %s: %s" % (segment.path, error))
+            continue
+        fresh = Segment(segment.path, segment.period)
+        fresh.account(data)
+        if fresh.to_dict() != segment.to_dict():
+            problems.append("segment %s differs from the manifest" % segment.path)
+    return problems
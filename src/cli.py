@@ -3,23 +3,37 @@
 """
 Usage:
     lets do     <name>... [--time=<time>]
-    lets see    [all|config] [--detailed|--day-by-day] [--ascii| --dot-list] [-p|--project] [<query>...]
+    lets see    [all|config] [--detailed|--day-by-day] [--ascii| --dot-list] [-p|--project] [--pager] [<query>...]
     lets edit
     lets cancel
     lets stop   [<time>...]
     lets goto   <newtask>...
     lets config
+    lets check
+    lets rebuild
+    lets archive [--monthly]
+    lets export [all] [--summary|--day-by-day] [--format=<format>] [-o <file>|--output=<file>] [<query>...]
+    lets daemon [stop]
+    lets status [--format=<format>] [--watch]
     lets autocomplete
 
 options:
     -a, --ascii       Print report table in ASCII characters
     -t, --time=<time> Change the start/stop time of the task on the fly
+    --pager           Show the report through $PAGER (less -R by default)
+    --monthly         Seal the closed months of the history, not only the closed years
+    --format=<format> Status as plain text, json or a template, e.g. '{name} {hours}h{minutes:02}',
+                      export as csv (default), ndjson or ics
+    -o, --output=<file> Export to a file instead of the standard output
+    --summary         Export the work time of each task instead of each record
+    --watch           Refresh the status in place every second
 
 examples:
     lets see            # show today's activities
     lets see yesterday  # show yesterday's activities
     lets see 2018-07    # show 2018 July's activities
     lets see last July  # same as above (if we're still in 2019)
+    lets see 2018-07..2018-09  # show July to September 2018
     lets see +project   # show activities with +project tag (+project is autocompleted with TAB)
     lets see something  # show activities whose description has he word 'something'
     lets see this week
@@ -29,17 +43,49 @@ examples:
 """
 
 import os
-import docopt
+import sys
 
-import handlers
-from app import guess_task_id_from_string, do_report
-from log import RAFFAELLO
-from configuration import get_configuration, get_task_file_path, CONFIG_FILE_NAME
+# Each command imports only what it needs, letsdo runs from shell prompts
+# and key bindings where startup time matters.
+from profiling import phase, profiled
 
 
+@profiled("cli.main")
 def main():
     """main"""
-    args = docopt.docopt(__doc__)
+    # hidden command used by the shell completion, at every TAB press
+    if sys.argv[1:2] == ["__complete"]:
+        from completion import main as complete
+
+        return complete(sys.argv[2:])
+
+    # run at every shell prompt, without the configuration and the reports
+    if sys.argv[1:2] == ["status"]:
+        from status import main as status
+
+        return status(sys.argv[2:])
+
+    from paths import daemon_socket_path
+
+    if os.path.exists(daemon_socket_path()):
+        from daemon import forward
+
+        code = forward(sys.argv[1:])
+        if code is not None:
+            return code
+
+    return run(sys.argv[1:])
+
+
+def run(argv):
+    """Run the lets command in argv, return the exit code"""
+    with phase("imports"):
+        import docopt
+        import handlers
+        from configuration import get_task_file_path, CONFIG_FILE_NAME
+
+    with phase("arguments"):
+        args = docopt.docopt(__doc__, argv=argv)
 
     is_ok = True
     msg = ""
@@ -47,6 +93,10 @@ def main():
     if args["autocomplete"]:
         handlers.autocomplete()
 
+    elif args["daemon"]:
+        # before stop, "lets daemon stop" sets both
+        is_ok, msg = handlers.daemon_handler(args["stop"])
+
     elif args["do"]:
         is_ok, msg = handlers.start_task_handler(
             " ".join(args["<name>"]), args["--time"]
@@ -70,11 +120,43 @@ def main():
     elif args["stop"]:
         is_ok, msg = handlers.stop_task_handler(" ".join(args["<time>"]))
 
+    elif args["status"]:
+        from status import main as status
+
+        return status(argv[1:])
+
+    elif args["check"]:
+        is_ok, msg = handlers.check_handler()
+
+    elif args["rebuild"]:
+        is_ok, msg = handlers.rebuild_handler()
+
+    elif args["archive"]:
+        is_ok, msg = handlers.archive_handler(args["--monthly"])
+
+    elif args["export"]:
+        query = None
+        if not args["all"]:
+            query = " ".join(args["<query>"]) or "today"
+        is_ok, msg = handlers.export_handler(
+            query,
+            args["--format"] or "csv",
+            args["--output"],
+            args["--summary"],
+            args["--day-by-day"],
+        )
+        # the standard output is the export
+        if msg:
+            print(msg, file=sys.stderr)
+        return 0 if is_ok else 1
+
     elif args["goto"]:
         description = " ".join(args["<newtask>"])
         is_ok, msg = handlers.goto_task_handler(description)
 
     if args["see"]:
+        from app import do_report
+
         if args["<query>"]:
             args["<query>"] = " ".join(args["<query>"])
 
@@ -87,4 +169,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""
+This module keeps the colorization of the reports.
+
+The Raffaello request in log.REQUEST is compiled once into a single
+alternation, so each message is painted in one pass, and the painted
+messages are cached since reports repeat the same dates, times and names.
+"""
+import re
+
+from configuration import is_color_enabled
+from log import REQUEST, LOGGER
+
+# Painted messages kept in cache, the cache is emptied when full
+CACHE_SIZE = 4096
+
+
+class Painter(object):
+    """Paints the patterns of a Raffaello request in one pass"""
+
+    def __init__(self, commission):
+        alternatives = []
+        self.brushes = {}
+        for index, (pattern, brush) in enumerate(commission):
+            group = "p%d" % index
+            alternatives.append("(?P<%s>%s)" % (group, pattern))
+            self.brushes[group] = (brush["open_color_tag"], brush["close_color_tag"])
+        self.regex = re.compile("|".join(alternatives))
+        self.cache = {}
+
+    def _stroke(self, match):
+        open_tag, close_tag = self.brushes[match.lastgroup]
+        return open_tag + match.group() + close_tag
+
+    def paint(self, msg):
+        """Return msg with the requested patterns colored"""
+        painted = self.cache.get(msg)
+        if painted is None:
+            if len(self.cache) >= CACHE_SIZE:
+                self.cache.clear()
+            painted = self.cache[msg] = self.regex.sub(self._stroke, msg.rstrip())
+        return painted
+
+
+# None means no colors, False means not initialized yet
+_PAINTER = False
+# the color setting the Painter was made for
+_ENABLED = None
+
+
+def get_painter():
+    """Return the Painter of the reports, None if colors are disabled"""
+    global _PAINTER, _ENABLED
+    if _PAINTER is False:
+        _PAINTER = None
+        _ENABLED = is_color_enabled()
+        if _ENABLED:
+            try:
+                from raffaello import parse_string_request
+
+                _PAINTER = Painter(parse_string_request(REQUEST))
+            except ImportError:
+                LOGGER.debug("raffaello not available, colors disabled")
+            except re.error as error:
+                LOGGER.error("could not compile the color request: %s", error)
+    return _PAINTER
+
+
+def reset_painter():
+    """Forget the Painter, e.g. after the color setting changed"""
+    global _PAINTER
+    _PAINTER = False
+
+
+def refresh_painter():
+    """Forget the Painter if the color setting changed since it was made
+
+    For long running processes, see daemon.serve.
+    """
+    if _PAINTER is not False and is_color_enabled() != _ENABLED:
+        reset_painter()
+
+
+def paint(msg):
+    """Colorize message, when colors are enabled"""
+    if msg:
+        painter = get_painter()
+        if painter:
+            return painter.paint(str(msg))
+    return msg
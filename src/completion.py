@@ -0,0 +1,92 @@
+"""
+This module answers the shell completion requests (lets __complete <word>)
+from the vocabulary file kept next to the history: tags, contexts and the
+names of the most recent tasks.
+
+It runs at every TAB press, so it must stay cheap to import: only the
+vocabulary file and the cached data directory are read.
+"""
+import os
+import sys
+
+from paths import HISTORY_FILE_NAME, get_cached_data_directory
+
+
+VOCABULARY_SUFFIX = ".vocabulary"
+
+
+def vocabulary_path(history_path):
+    """Return the vocabulary file path of the given history"""
+    return history_path + VOCABULARY_SUFFIX
+
+
+def read_vocabulary(path):
+    """Return the (header, tags, names) in a vocabulary file, most recent first
+
+    The file has a header line, the tags and contexts one per line, an empty
+    line and the task names one per line. The header fields are the size,
+    mtime_ns, head and tail CRCs of the history the vocabulary was made
+    from, followed by its path when it is not the CSV history.
+    """
+    with open(path, encoding="utf-8") as vfile:
+        content = vfile.read()
+    header, _, body = content.partition("\n")
+    tags, _, names = body.partition("\n\n")
+    return (
+        header.split(" ", 4),
+        tags.split("\n") if tags else [],
+        names.split("\n") if names else [],
+    )
+
+
+def is_fresh(header, history_path):
+    """Tell whether a vocabulary header matches the current history"""
+    try:
+        source = header[4] if len(header) > 4 else history_path
+        stat = os.stat(source)
+        return (stat.st_size, stat.st_mtime_ns) == (int(header[0]), int(header[1]))
+    except (OSError, ValueError, IndexError):
+        return False
+
+
+def _history_path(home):
+    data_directory = get_cached_data_directory(home)
+    if data_directory is None:
+        from configuration import get_history_file_path
+
+        return get_history_file_path(home)
+    return os.path.join(data_directory, HISTORY_FILE_NAME)
+
+
+def complete(word, home="~"):
+    """Return the tags, contexts or task names starting with word
+
+    The vocabulary is made again when the history changed since, e.g. when
+    edited by hand.
+    """
+    history_path = _history_path(home)
+    try:
+        header, tags, names = read_vocabulary(vocabulary_path(history_path))
+        fresh = is_fresh(header, history_path)
+    except OSError:
+        fresh = False
+    if not fresh:
+        from storage import get_own_storage
+
+        vocabulary = get_own_storage(home).load_vocabulary()
+        if vocabulary is None:
+            return []
+        tags, names = vocabulary.recent_tags(), vocabulary.recent_names()
+
+    if word[:1] in ("@", "+"):
+        return [tag for tag in tags if tag.startswith(word)]
+    return [name for name in names if name.startswith(word)]
+
+
+def main(argv):
+    """Print the completions of the (only) word in argv"""
+    word = argv[0] if argv else ""
+    matches = complete(word)
+    if matches:
+        sys.stdout.write("\n".join(matches) + "\n")
+    return 0
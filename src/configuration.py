@@ -2,39 +2,152 @@
 This module keeps the classes and function that manage user customization
 """
 import os
-import yaml
 from log import info, LOGGER
+from profiling import profiled
+from paths import (
+    CONFIG_FILE_NAME,
+    TASK_FILE_NAME,
+    HISTORY_FILE_NAME,
+    DATABASE_FILE_NAME,
+    config_file_path,
+    save_data_directory,
+)
+
+# History size in bytes from which the history is decoded by a process pool
+DEFAULT_PARALLEL_THRESHOLD = 8 * 1024 * 1024
+
+# Loaded configurations by file path: (mtime, size, configuration, derived values)
+_CACHE = {}
+# Number of times the configuration has been actually read from disk
+LOAD_COUNT = 0
+
+
+@profiled("configuration")
+def _load(home):
+    """Return the cache entry of the configuration, reading it only if changed"""
+    global LOAD_COUNT
+
+    file_path = config_file_path(home)
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        create_default_configuration(home)
+        stat = os.stat(file_path)
 
+    entry = _CACHE.get(file_path)
+    if entry and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+        return entry
 
-CONFIG_FILE_NAME = ".letsdo.yaml"
-TASK_FILE_NAME = "letsdo-task"
-HISTORY_FILE_NAME = "letsdo-history"
+    import yaml
+
+    with open(file_path, "r", encoding="utf-8") as stream:
+        config = yaml.safe_load(stream)
+    LOAD_COUNT += 1
+    LOGGER.debug("loaded configuration %s (%d loads)", file_path, LOAD_COUNT)
+
+    derived = {
+        "color": bool(config.get("color")),
+        "storage": config.get("storage", "csv"),
+        "parallel_threshold": int(config.get("parallel_threshold", DEFAULT_PARALLEL_THRESHOLD)),
+    }
+    if "data_directory" in config:
+        data_directory = config["data_directory"]
+        derived["task_file"] = os.path.join(data_directory, TASK_FILE_NAME)
+        derived["history_file"] = os.path.join(data_directory, HISTORY_FILE_NAME)
+        derived["database_file"] = os.path.join(data_directory, DATABASE_FILE_NAME)
+        derived["history_sources"] = _history_sources(
+            config.get("histories") or [], derived["history_file"]
+        )
+        save_data_directory(data_directory, stat.st_mtime_ns, home)
+    entry = (stat.st_mtime_ns, stat.st_size, config, derived)
+    _CACHE[file_path] = entry
+    return entry
+
+
+def _history_sources(entries, history_file):
+    """Return the (label, path) of the histories read by the reports
+
+    Entries are paths, or dictionaries with a path and a label. A path can be
+    a data directory, a CSV history or a SQLite (.db) history, labelled by
+    default with the name of its directory. The own history always comes
+    first, unlabelled unless listed with a label.
+    """
+    sources = []
+    own_label = None
+    for entry in entries:
+        label = None
+        if isinstance(entry, dict):
+            label = entry.get("label")
+            entry = entry.get("path")
+        if not entry:
+            LOGGER.warning("history source without path: %s", entry)
+            continue
+        path = os.path.expanduser(str(entry))
+        if os.path.isdir(path):
+            path = os.path.join(path, HISTORY_FILE_NAME)
+        label = str(label) if label is not None else None
+        if os.path.abspath(path) == os.path.abspath(history_file):
+            own_label = label
+            continue
+        if label is None:
+            label = os.path.basename(os.path.dirname(os.path.abspath(path)))
+        sources.append((label, path))
+    return [(own_label, history_file)] + sources
+
+
+def clear_configuration_cache():
+    """Forget all the loaded configurations"""
+    _CACHE.clear()
 
 
 def get_configuration(home="~"):
     """Returns the Yaml configuration"""
-    file_path = os.path.join(os.path.expanduser(home), CONFIG_FILE_NAME)
-    if not os.path.exists(file_path):
-        create_default_configuration(home)
-    with open(file_path, "r", encoding="utf-8") as stream:
-        return yaml.safe_load(stream)
+    return _load(home)[2]
 
 
 def create_default_configuration(home="~"):
+    import yaml
+
     default_config = {"color": True, "data_directory": f"{os.path.expanduser(home)}"}
-    file_path = os.path.join(os.path.expanduser(home), CONFIG_FILE_NAME)
+    file_path = config_file_path(home)
+    _CACHE.pop(file_path, None)
     with open(file_path, "w") as f:
         return yaml.dump(default_config, f)
 
 
 def get_task_file_path(home="~"):
     """Return the running task data file path"""
-    return os.path.join(get_configuration(home)["data_directory"], TASK_FILE_NAME)
+    return _load(home)[3]["task_file"]
 
 
 def get_history_file_path(home="~"):
     """Return task history file path"""
-    return os.path.join(get_configuration(home)["data_directory"], HISTORY_FILE_NAME)
+    return _load(home)[3]["history_file"]
+
+
+def get_database_file_path(home="~"):
+    """Return the SQLite history database path"""
+    return _load(home)[3]["database_file"]
+
+
+def get_history_sources(home="~"):
+    """Return the (label, path) of each history read by the reports, the own one first"""
+    return _load(home)[3]["history_sources"]
+
+
+def get_storage_backend(home="~"):
+    """Return the name of the history storage backend (csv or sqlite)"""
+    return _load(home)[3]["storage"]
+
+
+def get_parallel_threshold(home="~"):
+    """Return the history size from which it is decoded in parallel, 0 if never"""
+    return _load(home)[3]["parallel_threshold"]
+
+
+def is_color_enabled(home="~"):
+    """Return whether the output shall be colorized"""
+    return _load(home)[3]["color"]
 
 
 def autocomplete():
@@ -44,6 +157,7 @@ def autocomplete():
     - command line flags
     - contexts already used (words starting by @ in the task name)
     - tags already used (words starting by + in the task name)
+    - names of the recent tasks (after "lets do" and "lets goto")
 
     To enable this feature do either of the following:
         - put letsdo_completion file under /etc/bash_completion.d/ for
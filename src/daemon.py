@@ -0,0 +1,192 @@
+"""
+This module keeps the optional letsdo daemon and its client.
+
+    lets daemon          # serve the lets commands, e.g. from the session startup
+    lets daemon stop
+
+The daemon keeps the libraries imported and the configuration and the
+history caches in memory, and runs the do, stop, goto, cancel and see
+commands sent by lets over a Unix socket in the cache directory.
+The files are checked (size and mtime) at each request, so the changes made
+by hand or by a lets not going through the daemon are seen.
+
+When no daemon answers, lets runs the commands itself. Set LETSDO_NO_DAEMON
+to always run them in process.
+"""
+import io
+import json
+import os
+import signal
+import socket
+import sys
+from contextlib import contextmanager, redirect_stderr, redirect_stdout
+
+from log import LOGGER
+from paths import daemon_socket_path
+
+
+# Commands run by the daemon, the others need the terminal (editor, pager,
+# prompts) or are rare enough
+FORWARDED = ("do", "stop", "goto", "cancel", "see")
+
+# Seconds to wait for the daemon to accept a request
+CONNECT_TIMEOUT = 0.5
+
+
+def _send(connection, message):
+    connection.sendall(json.dumps(message).encode() + b"\n")
+
+
+def _receive(connection):
+    with connection.makefile("rb") as stream:
+        line = stream.readline()
+    if not line:
+        raise ConnectionError("connection closed by the daemon")
+    return json.loads(line)
+
+
+def _request(message, home="~"):
+    """Send a message to the daemon and return its answer, raises OSError without daemon"""
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.settimeout(CONNECT_TIMEOUT)
+        client.connect(daemon_socket_path(home))
+        # reports of large histories take their time
+        client.settimeout(None)
+        _send(client, message)
+        return _receive(client)
+    finally:
+        client.close()
+
+
+def forward(argv, home="~"):
+    """Run a lets command in the daemon, print its output and return its exit code
+
+    Returns None when the daemon cannot run the command (not running, command
+    not forwarded), the caller then runs it in process.
+    """
+    if not argv or argv[0] not in FORWARDED or "--pager" in argv:
+        return None
+    if os.environ.get("LETSDO_NO_DAEMON") or os.environ.get("LETSDO_PROFILE"):
+        return None
+
+    try:
+        answer = _request({"argv": argv}, home)
+    except (OSError, ValueError) as error:
+        LOGGER.debug("no daemon: %s", error)
+        return None
+
+    sys.stdout.write(answer["stdout"])
+    sys.stderr.write(answer["stderr"])
+    return answer["code"]
+
+
+def stop_daemon(home="~"):
+    """Ask the running daemon to stop, returns whether one was running"""
+    try:
+        _request({"stop": True}, home)
+    except (OSError, ValueError):
+        return False
+    return True
+
+
+@contextmanager
+def _log_to(stream):
+    """Write the log records to stream while in the block"""
+    import logging
+
+    handlers = [
+        handler
+        for handler in logging.getLogger().handlers
+        if isinstance(handler, logging.StreamHandler)
+    ]
+    streams = [handler.stream for handler in handlers]
+    for handler in handlers:
+        handler.stream = stream
+    try:
+        yield
+    finally:
+        for handler, previous in zip(handlers, streams):
+            handler.stream = previous
+
+
+def run(argv):
+    """Run a lets command, return (exit code, standard output, standard error)"""
+    import cli
+    from colors import refresh_painter
+
+    # the configuration may have changed since the last request
+    refresh_painter()
+    stdout, stderr = io.StringIO(), io.StringIO()
+    with redirect_stdout(stdout), redirect_stderr(stderr), _log_to(stderr):
+        try:
+            code = cli.run(argv)
+        except SystemExit as exit:
+            # docopt usage errors
+            code = exit.code
+            if isinstance(code, str):
+                print(code, file=sys.stderr)
+                code = 1
+        except Exception as error:  # the daemon outlives a failed command
+            LOGGER.exception("%s failed: %s", " ".join(argv), error)
+            code = 1
+    return code or 0, stdout.getvalue(), stderr.getvalue()
+
+
+def _bind(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # only the user can connect, from the moment the socket exists
+    umask = os.umask(0o077)
+    try:
+        server.bind(path)
+    finally:
+        os.umask(umask)
+    server.listen()
+    return server, os.stat(path).st_ino
+
+
+def serve(home="~"):
+    """Answer the requests of lets until asked to stop
+
+    Requests are served one at a time, in order of arrival.
+    """
+    import history
+
+    path = daemon_socket_path(home)
+    if stop_daemon(home):
+        LOGGER.info("replacing the running daemon")
+
+    history.keep_caches()
+    # pay the imports once
+    import app  # noqa: F401
+    import handlers  # noqa: F401
+
+    server, inode = _bind(path)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    LOGGER.info("serving on %s", path)
+    try:
+        while True:
+            connection, _ = server.accept()
+            with connection:
+                try:
+                    message = _receive(connection)
+                    if message.get("stop"):
+                        _send(connection, {"code": 0})
+                        return
+                    code, stdout, stderr = run(message["argv"])
+                    _send(connection, {"code": code, "stdout": stdout, "stderr": stderr})
+                except (OSError, ValueError, KeyError) as error:
+                    LOGGER.debug("bad request: %s", error)
+    finally:
+        server.close()
+        try:
+            # unless another daemon took over
+            if os.stat(path).st_ino == inode:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,217 @@
+"""
+This module keeps an index from each calendar day to the bytes of the
+history holding the tasks ended that day, so that date range queries read
+only the relevant part of the history.
+
+The index also records the offset of the last line of each task, which is
+enough to compute the task IDs without reading the rest of the history.
+Like the snapshot, it is extended when the history grows and rebuilt when
+the history is edited by hand.
+"""
+import os
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+
+from history import (
+    decode_line,
+    end_time_key,
+    iter_lines_reversed,
+    load_cache,
+    map_history,
+    time_key,
+)
+from log import LOGGER
+from names import identify
+
+
+INDEX_SUFFIX = ".days"
+
+MAGIC = b"LDDAYS"
+VERSION = 1
+# magic, version, history size, history mtime, head crc, tail crc, days, uids
+HEADER = struct.Struct("<6sHqqIIII")
+
+
+def index_path(history_path):
+    """Return the day index file path of the given history"""
+    return history_path + INDEX_SUFFIX
+
+
+class DayIndex(object):
+    """Byte ranges of the history by task end day"""
+
+    def __init__(self):
+        self.size = 0
+        self.mtime_ns = 0
+        self.head_crc = 0
+        self.tail_crc = 0
+        # day ordinal -> [offset of the first line, end of the last line]
+        self.days = {}
+        # task uid -> offset of the last line of the task
+        self.lasts = {}
+
+    def extend(self, data, offset):
+        """Index the history bytes in data, starting at the given offset"""
+        for line in data.split(b"\n"):
+            line_end = offset + len(line) + 1
+            record = None
+            if line.strip():
+                record = decode_line(line.decode("utf-8", errors="replace"))
+            if record:
+                name, _, end_time = record
+                self.lasts[identify(name).uid] = offset
+                if end_time:
+                    span = self.days.get(end_time.toordinal())
+                    if span is None:
+                        self.days[end_time.toordinal()] = [offset, line_end]
+                    else:
+                        span[0] = min(span[0], offset)
+                        span[1] = max(span[1], line_end)
+            offset = line_end
+
+    def byte_range(self, since, until=None):
+        """Return the (begin, end) offsets of the lines ended in [since, until)
+
+        until None means no upper bound. Returns None if no task ended in
+        the range.
+        """
+        days = sorted(self.days)
+        first = bisect_left(days, since.toordinal())
+        if until is None:
+            last = len(days)
+        else:
+            last = bisect_right(days, (until - timedelta(microseconds=1)).toordinal())
+        if first >= last:
+            return None
+        spans = [self.days[day] for day in days[first:last]]
+        return min(span[0] for span in spans), max(span[1] for span in spans)
+
+    def tids(self):
+        """Return the task ID of each task uid"""
+        by_recency = sorted(self.lasts, key=self.lasts.get, reverse=True)
+        return {uid: tid for tid, uid in enumerate(by_recency, 1)}
+
+    def dump(self, path):
+        """Write the index atomically to path"""
+        days = sorted(self.days)
+        uids = list(self.lasts)
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp_path, "wb") as ifile:
+            ifile.write(
+                HEADER.pack(
+                    MAGIC,
+                    VERSION,
+                    self.size,
+                    self.mtime_ns,
+                    self.head_crc,
+                    self.tail_crc,
+                    len(days),
+                    len(uids),
+                )
+            )
+            array("I", days).tofile(ifile)
+            array("Q", [self.days[day][0] for day in days]).tofile(ifile)
+            array("Q", [self.days[day][1] for day in days]).tofile(ifile)
+            ifile.write(b"".join(bytes.fromhex(uid) for uid in uids))
+            array("Q", [self.lasts[uid] for uid in uids]).tofile(ifile)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path):
+        """Read an index file, returns None if missing or unreadable"""
+        try:
+            with open(path, "rb") as ifile:
+                data = ifile.read()
+        except IOError:
+            return None
+
+        try:
+            (
+                magic,
+                version,
+                size,
+                mtime_ns,
+                head_crc,
+                tail_crc,
+                days_count,
+                uids_count,
+            ) = HEADER.unpack_from(data)
+            if magic != MAGIC or version != VERSION:
+                return None
+
+            index = DayIndex()
+            index.size, index.mtime_ns = size, mtime_ns
+            index.head_crc, index.tail_crc = head_crc, tail_crc
+
+            offset = HEADER.size
+            columns = []
+            for typecode, count in (("I", days_count), ("Q", days_count), ("Q", days_count)):
+                column = array(typecode)
+                end = offset + count * column.itemsize
+                column.frombytes(data[offset:end])
+                columns.append(column)
+                offset = end
+            for day, first, last in zip(*columns):
+                index.days[day] = [first, last]
+
+            end = offset + 32 * uids_count
+            digests = data[offset:end]
+            offset = end
+            lasts = array("Q")
+            end = offset + uids_count * lasts.itemsize
+            lasts.frombytes(data[offset:end])
+            offset = end
+            for pos, last in enumerate(lasts):
+                index.lasts[digests[32 * pos : 32 * (pos + 1)].hex()] = last
+
+            if offset != len(data):
+                return None
+            return index
+        except (struct.error, ValueError) as error:
+            LOGGER.debug("could not read day index: %s", error)
+            return None
+
+
+def load_day_index(history_path):
+    """Return the up-to-date DayIndex of the given history file"""
+    return load_cache(DayIndex, index_path(history_path), history_path)
+
+
+def update_day_index(history_path):
+    """Bring an existing day index up to date with the history"""
+    if os.path.exists(index_path(history_path)):
+        load_day_index(history_path)
+
+
+def iter_range_records(history_path, since, until=None):
+    """Yield the history records ended in [since, until), newest first
+
+    Records are (name, uid, tid, start_time, end_time) tuples, until None
+    means no upper bound. The lines appended out of order are found too,
+    the day index knows where each day is.
+    """
+    index = load_day_index(history_path)
+    span = index.byte_range(since, until)
+    if not span:
+        return
+
+    tids = index.tids()
+    since_key = time_key(since)
+    until_key = time_key(until) if until is not None else None
+    with map_history(history_path) as data:
+        for _, line in iter_lines_reversed(data, *span):
+            key = end_time_key(line)
+            if key is not None and (
+                key < since_key or (until_key is not None and key > until_key)
+            ):
+                continue
+            record = decode_line(line.decode("utf-8", errors="replace"))
+            if not record:
+                continue
+            name, start_time, end_time = record
+            if not end_time or end_time < since or (until is not None and end_time >= until):
+                continue
+            uid = identify(name).uid
+            yield name, uid, tids[uid], start_time, end_time
@@ -0,0 +1,169 @@
+"""
+This module exports the tasks matching a report query, for invoicing or any
+other tool:
+
+    lets export last month > june.csv
+    lets export +client --summary --format=ndjson
+    lets export 2024 --format=ics --output=2024.ics
+
+The queries are the ones of lets see, all exports the whole history.
+Records (or, with --summary and --day-by-day, the work time of each task
+and of each task by day) are written one by one as they are read, newest
+first, so memory does not grow with the number of records exported.
+
+The CSV and NDJSON rows have the FIELDS below, times are ISO 8601 wall-clock
+times. ICS exports are calendar events, one per record.
+"""
+import csv
+import json
+from datetime import datetime, timezone
+
+from app import get_task_summary, group_by_day, group_task_by, iter_tasks
+from query import compile_query
+
+
+FORMATS = ("csv", "ndjson", "ics")
+
+FIELDS = ("id", "uid", "date", "name", "start", "end", "seconds", "tags", "context", "source")
+
+ICS_TIME_FORMAT = "%Y%m%dT%H%M%S"
+# Octets of an ICS content line, longer lines are folded
+ICS_LINE_SIZE = 75
+
+
+def iter_query_tasks(query, summary=False, by_day=False):
+    """Yield the tasks matching a compiled query, or the totals of each task
+
+    When summary is true, yields the work time of each task, when by_day is
+    true, the work time of each task day by day, oldest day first.
+    """
+    since, until, tags, condition = query.since, query.until, query.tags, query.condition
+    if not summary and not by_day:
+        tasks = iter_tasks(since, until, tags)
+        return filter(condition, tasks) if condition else tasks
+
+    if condition is None:
+        totals = get_task_summary(since, until, tags=tags, by_day=by_day)
+    else:
+        tasks = filter(condition, iter_tasks(since, until, tags))
+        totals = group_by_day(tasks) if by_day else group_task_by(tasks, "name")
+    if by_day:
+        return (task for day in sorted(totals) for task in totals[day])
+    return iter(totals)
+
+
+def _iso(time):
+    return time.isoformat(timespec="minutes") if time else None
+
+
+def to_row(task):
+    """Return the exported fields of a task"""
+    return {
+        "id": task.tid,
+        "uid": task.uid,
+        "date": task.last_end_date,
+        "name": task.name,
+        "start": _iso(task.start_time),
+        "end": _iso(task.end_time),
+        "seconds": int(task.work_time.total_seconds()),
+        "tags": task.tags or [],
+        "context": task.context,
+        "source": task.source,
+    }
+
+
+def write_csv(tasks, stream):
+    """Write the tasks as CSV rows with a header, tags separated by spaces"""
+    writer = csv.writer(stream, lineterminator="\n")
+    writer.writerow(FIELDS)
+    count = 0
+    for task in tasks:
+        row = to_row(task)
+        row["tags"] = " ".join(row["tags"])
+        writer.writerow(["" if row[field] is None else row[field] for field in FIELDS])
+        count += 1
+    return count
+
+
+def write_ndjson(tasks, stream):
+    """Write the tasks as JSON objects, one per line"""
+    count = 0
+    for task in tasks:
+        stream.write(json.dumps(to_row(task), ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+
+def _ics_text(text):
+    """Escape an ICS text value"""
+    return (
+        text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+    )
+
+
+def _ics_line(line):
+    """Fold an ICS content line at ICS_LINE_SIZE octets, with CRLF"""
+    data = line.encode("utf-8")
+    if len(data) <= ICS_LINE_SIZE:
+        return line + "\r\n"
+    parts = []
+    size = ICS_LINE_SIZE
+    while data:
+        # do not split a UTF-8 sequence
+        cut = min(size, len(data))
+        while cut < len(data) and data[cut] & 0xC0 == 0x80:
+            cut -= 1
+        parts.append(data[:cut].decode("utf-8"))
+        data = data[cut:]
+        # continuation lines start with a space
+        size = ICS_LINE_SIZE - 1
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def write_ics(tasks, stream, now=None):
+    """Write the tasks as the events of an iCalendar, in floating local time"""
+    stamp = (now or datetime.now(timezone.utc)).strftime(ICS_TIME_FORMAT) + "Z"
+    stream.write(_ics_line("BEGIN:VCALENDAR"))
+    stream.write(_ics_line("VERSION:2.0"))
+    stream.write(_ics_line("PRODID:-//letsdo//export//EN"))
+    count = 0
+    for task in tasks:
+        if not task.end_time:
+            continue
+        start = task.start_time.strftime(ICS_TIME_FORMAT)
+        lines = [
+            "BEGIN:VEVENT",
+            "UID:%s-%s@letsdo" % (task.uid[:16], start),
+            "DTSTAMP:" + stamp,
+            "DTSTART:" + start,
+            "DTEND:" + task.end_time.strftime(ICS_TIME_FORMAT),
+            "SUMMARY:" + _ics_text(task.name),
+        ]
+        labels = (task.tags or []) + ([task.context] if task.context else [])
+        if labels:
+            lines.append("CATEGORIES:" + ",".join(_ics_text(label) for label in labels))
+        if task.source:
+            lines.append("DESCRIPTION:" + _ics_text(task.source))
+        lines.append("END:VEVENT")
+        stream.write("".join(_ics_line(line) for line in lines))
+        count += 1
+    stream.write(_ics_line("END:VCALENDAR"))
+    return count
+
+
+WRITERS = {"csv": write_csv, "ndjson": write_ndjson, "ics": write_ics}
+
+
+def export(query, stream, fmt="csv", summary=False, by_day=False, now=None):
+    """Write the tasks matching a report query to stream, returns how many
+
+    An empty query exports the whole history, see query.compile_query.
+    Raises ValueError on invalid queries, unknown formats and summaries
+    exported as calendar events.
+    """
+    if fmt not in WRITERS:
+        raise ValueError("unknown format '%s', use one of %s" % (fmt, ", ".join(FORMATS)))
+    if fmt == "ics" and (summary or by_day):
+        raise ValueError("calendars hold records, not summaries")
+    tasks = iter_query_tasks(compile_query(query, now), summary, by_day)
+    return WRITERS[fmt](tasks, stream)
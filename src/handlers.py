@@ -6,7 +6,7 @@ The Handler module provides a simple way to redirect incoming requests to specif
 
 import os
 from datetime import datetime
-from app import Task, guess_task_id_from_string, work_on
+from tasks import Task
 from configuration import autocomplete, create_default_configuration
 from typing import Tuple
 
@@ -24,6 +24,8 @@ def start_task_handler(description: str, start_str: str="") -> Tuple[bool, str]:
     if Task.get_running():
         return False, "Another task is already running"
 
+    from app import guess_task_id_from_string, work_on
+
     if description == "last":
         tid, is_ok = 1, True
     else:
@@ -84,6 +86,8 @@ def goto_task_handler(description: str) -> Tuple[bool, str]:
         if not is_ok:
             return False, msg
 
+    from app import guess_task_id_from_string, work_on
+
     tid, got_id = guess_task_id_from_string(description)
     if got_id:
         work_on(task_id=tid)
@@ -91,3 +95,84 @@ def goto_task_handler(description: str) -> Tuple[bool, str]:
     else:
         return Task(description).start(), ""
 
+
+
+def check_handler() -> Tuple[bool, str]:
+    """handles a request to check the caches of the history"""
+    from storage import get_storage
+
+    problems = get_storage().check()
+    if problems:
+        return False, "\n".join(problems)
+    return True, "history caches are consistent"
+
+
+def rebuild_handler() -> Tuple[bool, str]:
+    """handles a request to rebuild the caches of the history"""
+    from storage import get_storage
+
+    get_storage().rebuild()
+    return True, "history caches rebuilt"
+
+
+def archive_handler(monthly: bool) -> Tuple[bool, str]:
+    """handles a request to seal the closed periods of the history"""
+    from archive import archive_history
+    from storage import CsvStorage, get_own_storage
+
+    storage = get_own_storage()
+    if not isinstance(storage, CsvStorage):
+        return False, "only the CSV history can be archived"
+    if not storage.exists():
+        return False, "no history to archive"
+
+    segments = archive_history(storage.path, monthly)
+    if not segments:
+        return True, "nothing to archive"
+    # the history file was rewritten
+    storage.rebuild()
+    return True, "\n".join(
+        "%s: %d tasks" % (segment.path, segment.records) for segment in segments
+    )
+
+
+def export_handler(
+    query: str, fmt: str, output: str, summary: bool, by_day: bool
+) -> Tuple[bool, str]:
+    """handles a request to export the tasks matching a query"""
+    import sys
+    from export import export
+
+    if not output:
+        try:
+            export(query, sys.stdout, fmt, summary, by_day)
+            sys.stdout.flush()
+        except ValueError as error:
+            return False, "could not export: %s" % error
+        except BrokenPipeError:
+            # the reader quit early (e.g. head), the rest is not wanted
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, sys.stdout.fileno())
+        return True, ""
+
+    try:
+        # the formats choose their line endings
+        with open(output, "w", encoding="utf-8", newline="") as stream:
+            count = export(query, stream, fmt, summary, by_day)
+    except ValueError as error:
+        return False, "could not export: %s" % error
+    except OSError as error:
+        return False, "could not write %s: %s" % (output, error)
+    return True, "%d rows exported to %s" % (count, output)
+
+
+def daemon_handler(stop: bool) -> Tuple[bool, str]:
+    """handles a request to run or to stop the daemon"""
+    from daemon import serve, stop_daemon
+
+    if stop:
+        if stop_daemon():
+            return True, "daemon stopped"
+        return False, "no daemon running"
+    serve()
+    return True, "daemon stopped"
@@ -0,0 +1,354 @@
+"""
+This module keeps the functions that decode the tasks' history file
+"""
+import mmap
+import os
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+try:
+    import fcntl
+except ImportError:  # Windows, the writers are not serialized
+    fcntl = None
+
+from log import LOGGER
+from names import identify, parse_name, sanitize  # noqa: F401
+from timetoolkit import str2datetime
+
+
+# History times are naive, wall-clock datetimes. Epochs are the number of
+# seconds since 1970-01-01 00:00 on the same wall clock (no timezone applied)
+EPOCH = datetime(1970, 1, 1)
+
+# Size of the blocks read when scanning the history backwards
+BLOCK_SIZE = 64 * 1024
+# Length of the times written by Task.stop, e.g. "2022-06-05 12:00"
+TIME_SIZE = 16
+# Bytes at the beginning and at the end of the history used by the caches
+# to tell an append from an in-place edit
+CHECK_SIZE = 4096
+
+
+# Up-to-date caches by path, kept in memory by long running processes (see
+# keep_caches) instead of being read again at each load_cache
+_KEPT_CACHES = None
+
+
+# History files whose caches are only read, see mark_read_only
+_READ_ONLY = set()
+
+
+def mark_read_only(path):
+    """Never write the caches of a history, e.g. the history of another person
+
+    Its caches are still used when they are up to date, otherwise they are
+    made in memory only.
+    """
+    _READ_ONLY.add(os.path.abspath(path))
+
+
+def is_read_only(path):
+    """Tell whether path is a read only history or one of its caches"""
+    path = os.path.abspath(path)
+    return any(path == history or path.startswith(history + ".") for history in _READ_ONLY)
+
+
+def keep_caches():
+    """Keep the caches in memory from now on, e.g. in the daemon"""
+    global _KEPT_CACHES
+    if _KEPT_CACHES is None:
+        _KEPT_CACHES = {}
+
+
+def to_epoch(time):
+    """Convert a naive datetime to wall-clock epoch seconds"""
+    return (time - EPOCH) // timedelta(seconds=1)
+
+
+def from_epoch(seconds):
+    """Convert wall-clock epoch seconds to a naive datetime"""
+    return EPOCH + timedelta(seconds=seconds)
+
+
+def parse_time(string):
+    """Parse a history time
+
+    Task.stop always writes times as "%Y-%m-%d %H:%M", which is parsed by
+    position. Anything else goes through the generic str2datetime.
+    """
+    if not string:
+        return None
+    if (
+        len(string) == 16
+        and string[4] == "-"
+        and string[7] == "-"
+        and string[10] == " "
+        and string[13] == ":"
+    ):
+        year, month, day = string[0:4], string[5:7], string[8:10]
+        hour, minute = string[11:13], string[14:16]
+        if (year + month + day + hour + minute).isdigit():
+            try:
+                return datetime(
+                    int(year), int(month), int(day), int(hour), int(minute)
+                )
+            except ValueError:
+                pass
+    string = string.strip()
+    if not string:
+        return None
+    return str2datetime(string)
+
+
+def decode_line(line):
+    """Decode a history line
+
+    Supports both the current "date,name,start,end" format and the legacy
+    one with the worked time ("date,name,work,start,end").
+    Returns a (name, start_time, end_time) tuple, or None when the line does
+    not carry any task.
+    """
+    fields = line.strip().split(",")
+    if len(fields) < 2 or not fields[1]:
+        return None
+
+    # Take care of old history format with worked_time
+    if len(fields) == 4:
+        start_str, end_str = fields[2], fields[3]
+    elif len(fields) == 5:
+        start_str, end_str = fields[3], fields[4]
+    else:
+        raise Exception(
+            "History unexpected fields ({}: {})".format(len(fields), fields)
+        )
+
+    return parse_name(fields[1]).name, parse_time(start_str), parse_time(end_str)
+
+
+def region_crcs(hfile, size):
+    """Return the CRCs of the first and last CHECK_SIZE bytes among the first
+    size bytes of a binary file, and the last bytes themselves"""
+    hfile.seek(0)
+    head = hfile.read(min(size, CHECK_SIZE))
+    hfile.seek(max(0, size - CHECK_SIZE))
+    tail = hfile.read(min(size, CHECK_SIZE))
+    return zlib.crc32(head), zlib.crc32(tail), tail
+
+
+def is_appended(hfile, size, old_size, head_crc, tail_crc):
+    """Check whether a file of the given size only grew from old_size bytes
+
+    head_crc and tail_crc are the region_crcs of the file when it was
+    old_size bytes long.
+    """
+    if size <= old_size:
+        return False
+    old_head_crc, old_tail_crc, tail = region_crcs(hfile, old_size)
+    if old_size and not tail.endswith(b"\n"):
+        # the last line was incomplete, new bytes change that record
+        return False
+    return old_head_crc == head_crc and old_tail_crc == tail_crc
+
+
+def load_cache(cache_class, cache_path, history_path):
+    """Return the up-to-date cache of the given history file
+
+    cache_class instances keep the size, mtime_ns, head_crc and tail_crc of
+    the history they were built from, and provide extend(data, offset) to
+    process new history bytes, dump(path) and a static load(path) returning
+    None on errors. The cache is reused as is when the history did not
+    change, extended when the history only grew and rebuilt otherwise.
+    """
+    with open(history_path, "rb") as hfile:
+        stat = os.fstat(hfile.fileno())
+        cache = None
+        if _KEPT_CACHES is not None:
+            cache = _KEPT_CACHES.get(cache_path)
+        if not isinstance(cache, cache_class):
+            cache = cache_class.load(cache_path)
+        if cache and cache.size == stat.st_size and cache.mtime_ns == stat.st_mtime_ns:
+            if _KEPT_CACHES is not None:
+                _KEPT_CACHES[cache_path] = cache
+            return cache
+
+        if cache and is_appended(
+            hfile, stat.st_size, cache.size, cache.head_crc, cache.tail_crc
+        ):
+            LOGGER.debug("extending %s from byte %d", cache_path, cache.size)
+        else:
+            LOGGER.debug("rebuilding %s", cache_path)
+            cache = cache_class()
+
+        hfile.seek(cache.size)
+        cache.extend(hfile.read(stat.st_size - cache.size), cache.size)
+        cache.size, cache.mtime_ns = stat.st_size, stat.st_mtime_ns
+        cache.head_crc, cache.tail_crc = region_crcs(hfile, cache.size)[:2]
+
+    if not is_read_only(cache_path):
+        try:
+            cache.dump(cache_path)
+        except IOError as error:
+            LOGGER.debug("could not save %s: %s", cache_path, error)
+    if _KEPT_CACHES is not None:
+        _KEPT_CACHES[cache_path] = cache
+    return cache
+
+
+def read_lines_reversed(path, block_size=BLOCK_SIZE):
+    """Yield the non-empty lines of a file, last line first
+
+    The file is read backwards in blocks of block_size bytes, so the cost
+    depends on how many lines are consumed, not on the file size.
+    """
+    with open(path, "rb") as hfile:
+        position = hfile.seek(0, os.SEEK_END)
+        remainder = b""
+        while position > 0:
+            size = min(block_size, position)
+            position -= size
+            hfile.seek(position)
+            lines = (hfile.read(size) + remainder).split(b"\n")
+            # the first line might continue in the previous block
+            remainder = lines[0]
+            for line in reversed(lines[1:]):
+                if line.strip():
+                    yield line.decode("utf-8", errors="replace")
+        if remainder.strip():
+            yield remainder.decode("utf-8", errors="replace")
+
+
+@contextmanager
+def map_history(path):
+    """Memory map a history file read-only, gives b"" if the file is empty
+
+    Slices of the map are bytes, only the pages actually read are loaded.
+    """
+    with open(path, "rb") as hfile:
+        if not os.fstat(hfile.fileno()).st_size:
+            yield b""
+            return
+        with mmap.mmap(hfile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
+
+@contextmanager
+def locked_history(path, mode="a", **kwargs):
+    """Open a history file locked against the other writers until closed
+
+    The history is replaced while archiving it (see archive.archive_history),
+    it is opened again if it was replaced while waiting for the lock.
+    """
+    while True:
+        hfile = open(path, mode, **kwargs)
+        if fcntl is None:
+            break
+        fcntl.flock(hfile.fileno(), fcntl.LOCK_EX)
+        try:
+            if os.fstat(hfile.fileno()).st_ino == os.stat(path).st_ino:
+                break
+        except FileNotFoundError:
+            pass
+        hfile.close()
+    try:
+        yield hfile
+    finally:
+        hfile.close()
+
+
+def iter_lines_reversed(data, begin=0, end=None):
+    """Yield the (offset, line) of the non-empty lines of data[begin:end], last line first
+
+    Lines are bytes, without the newline. data can be a memory map.
+    """
+    position = len(data) if end is None else end
+    while position > begin:
+        newline = data.rfind(b"\n", begin, position)
+        line = data[newline + 1 if newline >= 0 else begin : position]
+        if line.strip():
+            yield (newline + 1 if newline >= 0 else begin), line
+        if newline < 0:
+            break
+        position = newline
+
+
+def time_key(time):
+    """Return the bytes of a time in the layout of the history, to the minute"""
+    return time.strftime("%Y-%m-%d %H:%M").encode()
+
+
+def end_time_key(line):
+    """Return the end time of a history line as bytes
+
+    The keys of the times written by Task.stop compare like the times
+    themselves. Returns None for the other layouts, which must be decoded.
+    """
+    key = line[line.rfind(b",") + 1 :].strip()
+    if (
+        len(key) == TIME_SIZE
+        and key[4:5] == b"-"
+        and key[7:8] == b"-"
+        and key[10:11] == b" "
+        and key[13:14] == b":"
+        and (key[0:4] + key[5:7] + key[8:10] + key[11:13] + key[14:16]).isdigit()
+    ):
+        return key
+    return None
+
+
+def iter_records_reversed(path, since=None, until=None, stop=None):
+    """Yield history records ended in [since, until), newest first
+
+    Records are (name, uid, tid, start_time, end_time) tuples. Task IDs are
+    assigned by recency, tasks with the same UID share the same ID. Reading
+    stops at the first record ended before stop.
+
+    The history is scanned as bytes in a memory map: the end times are
+    compared as bytes and only the names of the records out of the range are
+    decoded (for the task IDs), so memory does not grow with the history.
+    """
+    since_key = time_key(since) if since is not None else None
+    until_key = time_key(until) if until is not None else None
+    stop_key = time_key(stop) if stop is not None else None
+    tids = {}
+    # raw name -> name, for the records not decoded
+    names = {}
+    with map_history(path) as data:
+        for _, line in iter_lines_reversed(data):
+            key = end_time_key(line)
+            if key is not None and stop_key is not None and key < stop_key:
+                return
+            skipped = key is not None and (
+                (since_key is not None and key < since_key)
+                or (until_key is not None and key > until_key)
+            )
+            if skipped:
+                # out of the range, only the task ID counts
+                fields = line.strip().split(b",", 2)
+                if len(fields) < 2 or not fields[1]:
+                    continue
+                name = names.get(fields[1])
+                if name is None:
+                    name = names[fields[1]] = parse_name(
+                        fields[1].decode("utf-8", errors="replace")
+                    ).name
+            else:
+                record = decode_line(line.decode("utf-8", errors="replace"))
+                if not record:
+                    continue
+                name, start_time, end_time = record
+
+            uid = identify(name).uid
+            tid = tids.get(uid)
+            if tid is None:
+                tid = tids[uid] = len(tids) + 1
+            if skipped:
+                continue
+
+            if end_time and stop is not None and end_time < stop:
+                return
+            if since is not None and end_time and end_time < since:
+                continue
+            if until is not None and (not end_time or end_time >= until):
+                continue
+            yield name, uid, tid, start_time, end_time
@@ -5,14 +5,25 @@ import os
 import sys
 import logging
 
-try:
-    from raffaello import Raffaello
-    from raffaello import parse_string_request
+REQUEST = r'''\+[\w\-_\.]+=>color197 \@[\w\-_]+=>color046 \#[\w\-_]+=>color202 \d+[dms]=>color011 \d+h\s=>color011 \d{2,4}-\d{2}-\d{2,4}=>color011 \d{2,4}.\d{2}.\d{2,4}=>color011 w\d{2}=>color011 \d{2}:\d{2}=>color011'''
 
-    REQUEST = r'''\+[\w\-_\.]+=>color197 \@[\w\-_]+=>color046 \#[\w\-_]+=>color202 \d+[dms]=>color011 \d+h\s=>color011 \d{2,4}-\d{2}-\d{2,4}=>color011 \d{2,4}.\d{2}.\d{2,4}=>color011 w\d{2}=>color011 \d{2}:\d{2}=>color011'''
-    RAFFAELLO = Raffaello(parse_string_request(REQUEST))
-except ImportError as error:
-    RAFFAELLO = None
+# Raffaello is imported and its request compiled only when something
+# has to be painted. False means not initialized yet.
+_RAFFAELLO = False
+
+
+def get_raffaello():
+    '''Return the Raffaello painter, None if Raffaello is not available'''
+    global _RAFFAELLO
+    if _RAFFAELLO is False:
+        try:
+            from raffaello import Raffaello
+            from raffaello import parse_string_request
+
+            _RAFFAELLO = Raffaello(parse_string_request(REQUEST))
+        except ImportError:
+            _RAFFAELLO = None
+    return _RAFFAELLO
 
 if 'LETSDO_DEBUG' in os.environ:
     LEVEL = logging.DEBUG
@@ -24,8 +35,9 @@ LOGGER = logging.getLogger(__name__)
 
 def info(msg):
     '''Info level logging'''
-    if RAFFAELLO:
-        print(RAFFAELLO.paint(msg))
+    raffaello = get_raffaello()
+    if raffaello:
+        print(raffaello.paint(msg))
     else:
         print(msg)
 
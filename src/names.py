@@ -0,0 +1,86 @@
+"""
+This module keeps the normalization and the identity of the task names.
+
+A few hundred distinct names make up hundreds of thousands of history lines,
+so the normalized name, the uid, the context and the tags of a name are
+computed once and shared by all the records carrying it: parsing and memory
+scale with the distinct names, not with the history. The caches are bounded,
+the least recently used names are dropped past NAME_CACHE_SIZE.
+"""
+import re
+import sys
+from functools import lru_cache
+from hashlib import sha256
+
+
+# Distinct names kept by each cache
+NAME_CACHE_SIZE = 4096
+
+CONTEXT_PATTERN = re.compile(r"@[\w\-_]+")
+TAG_PATTERN = re.compile(r"\+[\w\-_]+")
+# tags and contexts
+LABEL_PATTERN = re.compile(r"[@+][\w\-_]+")
+
+LIST_PATTERN = re.compile(r"^[\-\*]")
+DATE_PATTERN = re.compile(r"^\s*\d+-\d+-\d+\s+")
+DAY_OF_YEAR_PATTERN = re.compile(r"^\s*\d+/\d+\s+")
+LINK_PATTERN = re.compile(r"\[(.*)\]\(.*\)")
+
+
+def sanitize(text):
+    """Remove symbols, dates and Markdown syntax from text"""
+    # plain names (the common case) have nothing to remove
+    first = text[:1]
+    if not (first in "-*" or first.isspace() or first.isdigit() or "[" in text):
+        return text
+
+    # remove initial list symbol (if any)
+    text = LIST_PATTERN.sub("", text)
+
+    # remove initial date (yyyy-mm-dd)
+    text = DATE_PATTERN.sub("", text)
+
+    # remove initial date (yy\date-of-year)
+    text = DAY_OF_YEAR_PATTERN.sub("", text)
+
+    # remove markdown links
+    link = LINK_PATTERN.search(text)
+    if link:
+        text = LINK_PATTERN.sub(link.group(1), text)
+
+    return text
+
+
+class TaskName(object):
+    """The identity of a normalized task name, shared by its records
+
+    tags is a list shared by all the records, it must not be modified.
+    """
+
+    __slots__ = ("name", "uid", "context", "tags", "labels")
+
+    def __init__(self, name):
+        self.name = sys.intern(name)
+        self.uid = sha256(name.encode()).hexdigest()
+        contexts = CONTEXT_PATTERN.findall(name)
+        # the context, if only one
+        self.context = contexts[0] if len(contexts) == 1 else None
+        # the projects (+), None if there are none
+        self.tags = TAG_PATTERN.findall(name) or None
+        # the tags and contexts
+        self.labels = frozenset(LABEL_PATTERN.findall(name))
+
+    def __repr__(self):
+        return "TaskName(%r)" % self.name
+
+
+@lru_cache(maxsize=NAME_CACHE_SIZE)
+def identify(name):
+    """Return the TaskName of a normalized name"""
+    return TaskName(name)
+
+
+@lru_cache(maxsize=NAME_CACHE_SIZE)
+def parse_name(raw):
+    """Return the TaskName of the name field of a history line"""
+    return identify(sanitize(raw).strip())
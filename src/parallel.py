@@ -0,0 +1,83 @@
+"""
+This module keeps the parallel decoding of large histories.
+
+Decoding the history (splitting the fields, parsing the times, cleaning the
+names) is the bulk of building the caches from scratch. Above a size
+threshold (parallel_threshold in the configuration, in bytes, 0 to never
+split) the history bytes are split at line boundaries and each part is
+decoded by a process of a pool, which also sums the work time totals of its
+part (see totals.Totals.merge). Smaller histories are decoded in place, they
+would not pay back the pool startup.
+"""
+import os
+
+from log import LOGGER
+
+
+# Parts smaller than this are not worth a process
+MIN_PART_SIZE = 256 * 1024
+
+
+def get_parallel_threshold():
+    """Return the history size from which decoding is parallel, 0 if never"""
+    from configuration import DEFAULT_PARALLEL_THRESHOLD, get_parallel_threshold as configured
+
+    try:
+        return configured()
+    except (OSError, ValueError) as error:
+        LOGGER.debug("could not read the parallel threshold: %s", error)
+        return DEFAULT_PARALLEL_THRESHOLD
+
+
+def split_lines(data, parts):
+    """Return the (begin, end) offsets of at most parts slices of data
+
+    Slices end after a newline (but the last one), so that no line is split.
+    """
+    size = len(data)
+    ranges = []
+    begin = 0
+    for index in range(1, parts):
+        end = data.find(b"\n", max(begin, size * index // parts)) + 1
+        if end <= begin:
+            break
+        ranges.append((begin, end))
+        begin = end
+    if begin < size:
+        ranges.append((begin, size))
+    return ranges
+
+
+def map_lines(function, data, threshold=None, workers=None):
+    """Return [function(part) for each part of data], computed by a process pool
+
+    data is split in line aligned parts (see split_lines), the results are in
+    the same order as the parts. Returns None when data is below the threshold
+    or cannot be decoded in parallel here, the caller then decodes it in place.
+    """
+    if threshold is None:
+        if len(data) < MIN_PART_SIZE:
+            return None
+        threshold = get_parallel_threshold()
+    if threshold <= 0 or len(data) < threshold:
+        return None
+
+    workers = workers or os.cpu_count() or 1
+    parts = min(workers, max(1, len(data) // MIN_PART_SIZE))
+    if parts < 2:
+        return None
+
+    import multiprocessing
+
+    # forked workers start in a few milliseconds, spawned ones import again
+    if "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+    else:
+        context = multiprocessing.get_context()
+    chunks = [data[begin:end] for begin, end in split_lines(data, parts)]
+    try:
+        with context.Pool(len(chunks)) as pool:
+            return pool.map(function, chunks)
+    except (OSError, ImportError) as error:
+        LOGGER.debug("could not decode in parallel: %s", error)
+        return None
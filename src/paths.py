@@ -0,0 +1,70 @@
+"""
+This module keeps the letsdo file names and a cached copy of the data
+directory, so that the fast paths (e.g. shell completion) can find the data
+files without loading the configuration.
+
+It must stay cheap to import.
+"""
+import os
+
+
+CONFIG_FILE_NAME = ".letsdo.yaml"
+TASK_FILE_NAME = "letsdo-task"
+HISTORY_FILE_NAME = "letsdo-history"
+DATABASE_FILE_NAME = "letsdo-history.db"
+
+# The data directory of the last loaded configuration, along with the
+# configuration mtime to tell whether it is still valid
+DATA_DIRECTORY_CACHE = os.path.join(".cache", "letsdo", "data_directory")
+# The Unix socket of the daemon, see daemon.py
+DAEMON_SOCKET = os.path.join(".cache", "letsdo", "daemon.sock")
+
+
+def config_file_path(home="~"):
+    """Return the configuration file path"""
+    return os.path.join(os.path.expanduser(home), CONFIG_FILE_NAME)
+
+
+def daemon_socket_path(home="~"):
+    """Return the Unix socket path of the daemon"""
+    return os.path.join(os.path.expanduser(home), DAEMON_SOCKET)
+
+
+def _data_directory_cache_path(home):
+    return os.path.join(os.path.expanduser(home), DATA_DIRECTORY_CACHE)
+
+
+def _read_data_directory_cache(home):
+    try:
+        with open(_data_directory_cache_path(home), encoding="utf-8") as cfile:
+            mtime_ns, data_directory = cfile.read().split("\n", 1)
+        return int(mtime_ns), data_directory
+    except (OSError, ValueError):
+        return None, None
+
+
+def save_data_directory(data_directory, config_mtime_ns, home="~"):
+    """Cache the data directory of the configuration with the given mtime"""
+    if _read_data_directory_cache(home) == (config_mtime_ns, data_directory):
+        return
+    path = _data_directory_cache_path(home)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp_path, "w", encoding="utf-8") as cfile:
+            cfile.write("%d\n%s" % (config_mtime_ns, data_directory))
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+
+def get_cached_data_directory(home="~"):
+    """Return the cached data directory, None if missing or stale"""
+    try:
+        config_mtime_ns = os.stat(config_file_path(home)).st_mtime_ns
+    except OSError:
+        return None
+    mtime_ns, data_directory = _read_data_directory_cache(home)
+    if mtime_ns != config_mtime_ns:
+        return None
+    return data_directory
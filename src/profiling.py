@@ -0,0 +1,201 @@
+"""
+This module keeps the opt-in instrumentation of the commands.
+
+Set LETSDO_PROFILE to have the wall time, the number of calls and the peak
+memory of each phase of the command (configuration, history reading,
+filtering, grouping, colorizing, rendering...):
+
+    LETSDO_PROFILE=1 lets see all            # breakdown on stderr
+    LETSDO_PROFILE=see.json lets see all     # breakdown as JSON
+
+Set also LETSDO_PROFILE_CPROFILE to a file path to dump the cProfile stats
+of the whole command there, e.g. for snakeviz or pstats.
+
+When LETSDO_PROFILE is not set, profiled() returns the functions untouched
+and phase() does nothing.
+"""
+import os
+import sys
+import time
+
+
+PROFILE = os.environ.get("LETSDO_PROFILE", "")
+CPROFILE = os.environ.get("LETSDO_PROFILE_CPROFILE", "")
+ENABLED = bool(PROFILE or CPROFILE)
+
+
+class Phase(object):
+    """Totals of a named phase"""
+
+    __slots__ = ("name", "depth", "calls", "seconds", "peak")
+
+    def __init__(self, name, depth):
+        self.name = name
+        self.depth = depth
+        self.calls = 0
+        self.seconds = 0.0
+        # peak memory above the memory in use when the phase began, in bytes
+        self.peak = 0
+
+
+class Profiler(object):
+    """Collects the phases of a command, in order of first entry"""
+
+    def __init__(self):
+        import tracemalloc
+
+        self.tracemalloc = tracemalloc
+        self.phases = {}
+        # [phase, begin time, memory at begin, peak seen so far] of the
+        # active phases, innermost last
+        self.stack = []
+        self.begin = time.perf_counter()
+        self.cprofile = None
+        if CPROFILE:
+            import cProfile
+
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+        tracemalloc.start()
+
+    def _traced_peak(self):
+        """Return the peak since the last reset, and reset it"""
+        current, peak = self.tracemalloc.get_traced_memory()
+        # Python < 3.9 only has the peak of the whole command
+        reset_peak = getattr(self.tracemalloc, "reset_peak", None)
+        if reset_peak:
+            reset_peak()
+        return current, peak
+
+    def enter(self, name):
+        current, peak = self._traced_peak()
+        if self.stack:
+            self.stack[-1][3] = max(self.stack[-1][3], peak)
+        phase = self.phases.get(name)
+        if phase is None:
+            phase = self.phases[name] = Phase(name, len(self.stack))
+        self.stack.append([phase, time.perf_counter(), current, current])
+
+    def exit(self):
+        phase, begin, memory, peak = self.stack.pop()
+        phase.calls += 1
+        phase.seconds += time.perf_counter() - begin
+        _, traced_peak = self._traced_peak()
+        peak = max(peak, traced_peak)
+        phase.peak = max(phase.peak, peak - memory)
+        if self.stack:
+            self.stack[-1][3] = max(self.stack[-1][3], peak)
+
+    def report(self):
+        """Return the profile as a JSON serializable dictionary"""
+        return {
+            "command": sys.argv[1:],
+            "total_ms": (time.perf_counter() - self.begin) * 1000,
+            "phases": [
+                {
+                    "name": phase.name,
+                    "depth": phase.depth,
+                    "calls": phase.calls,
+                    "wall_ms": phase.seconds * 1000,
+                    "peak_kib": phase.peak / 1024,
+                }
+                for phase in self.phases.values()
+            ],
+        }
+
+    def finish(self):
+        """Stop profiling and write the results"""
+        self.tracemalloc.stop()
+        if self.cprofile:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(CPROFILE)
+
+        report = self.report()
+        if PROFILE.endswith(".json"):
+            import json
+
+            with open(PROFILE, "w", encoding="utf-8") as pfile:
+                json.dump(report, pfile, indent=2)
+        elif PROFILE:
+            sys.stderr.write(format_report(report))
+
+
+def format_report(report):
+    """Return the compact text breakdown of a profile report"""
+    lines = [
+        "letsdo profile: %s (%.1f ms)" % (" ".join(report["command"]), report["total_ms"]),
+        "%-32s %7s %10s %10s" % ("phase", "calls", "wall ms", "peak KiB"),
+    ]
+    for phase in report["phases"]:
+        lines.append(
+            "%-32s %7d %10.1f %10.1f"
+            % (
+                "  " * phase["depth"] + phase["name"],
+                phase["calls"],
+                phase["wall_ms"],
+                phase["peak_kib"],
+            )
+        )
+    return "\n".join(lines) + "\n"
+
+
+_PROFILER = None
+
+
+def get_profiler():
+    """Return the profiler of this command, starting it on first use"""
+    global _PROFILER
+    if _PROFILER is None:
+        import atexit
+
+        _PROFILER = Profiler()
+        atexit.register(_PROFILER.finish)
+    return _PROFILER
+
+
+class _Phase(object):
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        get_profiler().enter(self.name)
+
+    def __exit__(self, *exc_info):
+        get_profiler().exit()
+
+
+class _NoPhase(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NO_PHASE = _NoPhase()
+
+
+def phase(name):
+    """Return a context manager accounting its block in the named phase"""
+    if ENABLED:
+        return _Phase(name)
+    return _NO_PHASE
+
+
+def profiled(name):
+    """Decorator accounting each call of the function in the named phase"""
+
+    def decorator(function):
+        if not ENABLED:
+            return function
+
+        def wrapper(*args, **kwargs):
+            with _Phase(name):
+                return function(*args, **kwargs)
+
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        wrapper.__wrapped__ = function
+        return wrapper
+
+    return decorator
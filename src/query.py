@@ -0,0 +1,282 @@
+"""
+This module compiles the queries of the reports.
+
+A query is made of an optional date range, tags and contexts (see
+tagindex.parse_tag_query) and some text to find in the task names:
+
+    lets see 2019-08                  # a month, 19-08 works as well
+    lets see 2024-01-01..2024-03-31   # both days included
+    lets see 2024-01..                # from January 2024 on
+    lets see +project last week
+    lets see review this month
+
+The range is a half-open [since, until) interval of end times, also given as
+epoch seconds. The storage answers the range and the tags, only the text is
+matched record by record.
+"""
+import re
+from datetime import datetime, timedelta
+
+from history import to_epoch
+from names import LABEL_PATTERN
+from tagindex import OR_WORDS, find_tags, parse_tag_query
+
+
+RANGE_SEPARATOR = ".."
+
+MONTHS = (
+    "january",
+    "february",
+    "march",
+    "april",
+    "may",
+    "june",
+    "july",
+    "august",
+    "september",
+    "october",
+    "november",
+    "december",
+)
+
+YEAR_PATTERN = re.compile(r"(\d{4})$")
+MONTH_PATTERN = re.compile(r"(\d{4})[-/](\d{1,2})$")
+# YY-MM, or MM-DD of this year when the second number is not a month
+SHORT_PATTERN = re.compile(r"(\d{2})[-/](\d{2})$")
+DAY_PATTERN = re.compile(r"(\d{2}|\d{4})[-/](\d{1,2})[-/](\d{1,2})$")
+
+
+class Query(object):
+    """A compiled report query
+
+    start and end are the bounds of the end times in epoch seconds, None when
+    unbounded; since and until are the same bounds as datetimes.
+    """
+
+    def __init__(self, since=None, until=None, tags=None, text=None, title=None):
+        self.since = since
+        self.until = until
+        self.start = to_epoch(since) if since is not None else None
+        self.end = to_epoch(until) if until is not None else None
+        self.tags = tags
+        self.text = text
+        self.title = title
+
+    @property
+    def condition(self):
+        """Return the predicate of the records left to the caller, None if any record fits
+
+        The range and the tags are answered by the storage.
+        """
+        if not self.text:
+            return None
+        text = self.text
+        return lambda task: text in task.name
+
+    def matches(self, name, time):
+        """Tell whether a task named name, active at time, matches the whole query"""
+        if self.start is not None or self.end is not None:
+            if time is None:
+                return False
+            epoch = to_epoch(time)
+            if self.start is not None and epoch < self.start:
+                return False
+            if self.end is not None and epoch >= self.end:
+                return False
+        if self.tags:
+            tags = find_tags(name)
+            if not any(all(tag in tags for tag in alternative) for alternative in self.tags):
+                return False
+        return not self.text or self.text in name
+
+    def __repr__(self):
+        return "Query(since=%r, until=%r, tags=%r, text=%r)" % (
+            self.since,
+            self.until,
+            self.tags,
+            self.text,
+        )
+
+
+def _day(time):
+    return time.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _month(year, month):
+    """Return the [since, until) range of a month"""
+    since = datetime(year, month, 1)
+    return since, (since + timedelta(days=32)).replace(day=1)
+
+
+def _year(year):
+    return datetime(year, 1, 1), datetime(year + 1, 1, 1)
+
+
+def _full_year(digits):
+    if len(digits) == 2:
+        return datetime.strptime(digits, "%y").year
+    return int(digits)
+
+
+def _month_index(word):
+    """Return the number of a month name or abbreviation (jul, july...), None if word is not one"""
+    if len(word) >= 3:
+        for index, month in enumerate(MONTHS, 1):
+            if month.startswith(word):
+                return index
+    return None
+
+
+def _named_period(words, now):
+    """Return (since, until, title) of a relative period, None if words are not one"""
+    today = _day(now)
+    phrase = " ".join(words)
+    if phrase in ("today", "now"):
+        return today, today + timedelta(days=1), today.strftime("%Y-%m-%d")
+    if phrase == "yesterday":
+        yesterday = today - timedelta(days=1)
+        return yesterday, today, yesterday.strftime("%Y-%m-%d")
+
+    last = words[0] == "last"
+    if words[0] in ("this", "last"):
+        words = words[1:]
+    if len(words) != 1:
+        return None
+
+    word = words[0]
+    if word == "week":
+        monday = today - timedelta(days=today.weekday() + (7 if last else 0))
+        return monday, monday + timedelta(days=7), "week %s" % monday.strftime("%V")
+    if word == "month":
+        year, month = now.year, now.month
+        if last:
+            year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+        return _month(year, month) + ("%d-%02d" % (year, month),)
+    if word == "year":
+        year = now.year - 1 if last else now.year
+        return _year(year) + (str(year),)
+
+    month = _month_index(word)
+    if month is not None:
+        # the most recent one, not the one to come
+        year = now.year
+        if month > now.month or (last and month == now.month):
+            year -= 1
+        return _month(year, month) + ("%d-%02d" % (year, month),)
+    return None
+
+
+def _dated_period(term, now):
+    """Return (since, until, title) of a year, month or day, None if term is not one"""
+    match = DAY_PATTERN.match(term)
+    if match:
+        since = datetime(_full_year(match.group(1)), int(match.group(2)), int(match.group(3)))
+        return since, since + timedelta(days=1), since.strftime("%Y-%m-%d")
+    match = MONTH_PATTERN.match(term)
+    if match:
+        year, month = int(match.group(1)), int(match.group(2))
+        return _month(year, month) + ("%d-%02d" % (year, month),)
+    match = SHORT_PATTERN.match(term)
+    if match:
+        first, second = int(match.group(1)), int(match.group(2))
+        if second <= 12:
+            year = _full_year(match.group(1))
+            return _month(year, second) + ("%d-%02d" % (year, second),)
+        since = datetime(now.year, first, second)
+        return since, since + timedelta(days=1), since.strftime("%Y-%m-%d")
+    match = YEAR_PATTERN.match(term)
+    if match:
+        year = int(match.group(1))
+        return _year(year) + (str(year),)
+    return None
+
+
+def parse_period(term, now=None):
+    """Return the (since, until, title) of the period named by term, None if it is not a date
+
+    Periods are days, ISO weeks, months and years, given as dates (2019-08-20,
+    19-08, 2019...) or relative to now (today, last week, July...). Other
+    dates in natural language are the days they fall in.
+    """
+    now = now or datetime.now()
+    words = term.lower().split()
+    if not words:
+        return None
+    try:
+        period = _dated_period(term.strip(), now) or _named_period(words, now)
+    except ValueError:
+        # e.g. month 13, not a date
+        return None
+    if period:
+        return period
+
+    from timetoolkit import str2datetime
+
+    try:
+        day = _day(str2datetime(term))
+    except ValueError:
+        return None
+    return day, day + timedelta(days=1), day.strftime("%Y-%m-%d")
+
+
+def _parse_range(text, now):
+    first, last = (bound.strip() for bound in text.split(RANGE_SEPARATOR, 1))
+    since, until = None, None
+    titles = []
+    for bound, is_first in ((first, True), (last, False)):
+        titles.append(bound)
+        if not bound:
+            continue
+        period = parse_period(bound, now)
+        if period is None:
+            raise ValueError("'%s' is not a date" % bound)
+        if is_first:
+            since = period[0]
+        else:
+            until = period[1]
+        titles[-1] = period[2]
+    if since is not None and until is not None and since >= until:
+        raise ValueError("'%s' is an empty range" % text)
+    return since, until, RANGE_SEPARATOR.join(titles)
+
+
+def _split_tags(words):
+    """Return the tag query in words and the remaining words"""
+    tags = parse_tag_query(" ".join(words))
+    if tags:
+        return tags, []
+
+    # a bare "+" or "@" is text, e.g. "doc + review"
+    tag_words = [word for word in words if LABEL_PATTERN.fullmatch(word)]
+    others = [word for word in words if not LABEL_PATTERN.fullmatch(word)]
+    if tag_words and not any(word.lower() in OR_WORDS for word in others):
+        return parse_tag_query(" ".join(tag_words)), others
+    return None, words
+
+
+def compile_query(query, now=None):
+    """Compile the query of a report, None or empty selects the whole history
+
+    Raises ValueError when a bound of an explicit range is not a date.
+    """
+    if not query or not query.strip():
+        return Query(title="all")
+
+    now = now or datetime.now()
+    tags, words = _split_tags(query.split())
+    rest = " ".join(words)
+    since, until, text, title = None, None, None, query.strip()
+
+    if RANGE_SEPARATOR in rest:
+        since, until, range_title = _parse_range(rest, now)
+    elif rest:
+        period = parse_period(rest, now)
+        if period is None:
+            text = rest
+        else:
+            since, until, range_title = period
+    if since is not None or until is not None:
+        if not tags:
+            title = range_title
+
+    return Query(since, until, tags=tags, text=text, title=title)
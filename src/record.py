@@ -0,0 +1,152 @@
+"""
+This module keeps the type of the tasks read from the history.
+
+History records are many and read-only: unlike the running Task they have no
+instance dictionary, the fields derived from the end time are computed only
+when first used and the ones derived from the name are shared by the records
+of the same task (see names.py).
+"""
+from datetime import datetime, timedelta
+
+from names import identify
+
+# Marks the derived fields not computed yet
+_UNSET = object()
+
+
+class HistoryRecord(object):
+    """An immutable task of the history"""
+
+    __slots__ = (
+        "name",
+        "tid",
+        "source",
+        "start_time",
+        "end_time",
+        "_work_time",
+        "_uid",
+        "_week_no",
+        "_last_end_date",
+    )
+
+    def __init__(
+        self, name, start_time, end_time, tid=None, uid=None, work_time=None, source=None
+    ):
+        init = object.__setattr__
+        init(self, "name", name)
+        init(self, "tid", tid)
+        # label of the history the record comes from, see storage.MergedStorage
+        init(self, "source", source)
+        init(self, "start_time", start_time or datetime.now())
+        init(self, "end_time", end_time)
+        init(self, "_work_time", work_time)
+        init(self, "_uid", uid)
+        for slot in ("_week_no", "_last_end_date"):
+            init(self, slot, _UNSET)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("history records are immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("history records are immutable")
+
+    def _cache(self, slot, value):
+        object.__setattr__(self, slot, value)
+        return value
+
+    def with_work_time(self, work_time):
+        """Return a copy of this record with the given work time"""
+        record = HistoryRecord(
+            self.name,
+            self.start_time,
+            self.end_time,
+            tid=self.tid,
+            uid=self._uid,
+            work_time=work_time,
+            source=self.source,
+        )
+        for slot in ("_week_no", "_last_end_date"):
+            object.__setattr__(record, slot, getattr(self, slot))
+        return record
+
+    @property
+    def work_time(self):
+        if self._work_time is None:
+            if self.end_time:
+                return self._cache("_work_time", self.end_time - self.start_time)
+            return self._cache("_work_time", timedelta())
+        return self._work_time
+
+    @property
+    def uid(self):
+        if self._uid is None:
+            return self._cache("_uid", identify(self.name).uid)
+        return self._uid
+
+    @property
+    def week_no(self):
+        if self._week_no is _UNSET:
+            week_no = self.end_time.strftime("%V") if self.end_time else None
+            return self._cache("_week_no", week_no)
+        return self._week_no
+
+    @property
+    def last_end_date(self):
+        """The last day when this task was active"""
+        if self._last_end_date is _UNSET:
+            date = self.end_time.strftime("%Y-%m-%d") if self.end_time else None
+            return self._cache("_last_end_date", date)
+        return self._last_end_date
+
+    @property
+    def context(self):
+        """The context (@) of the task, if only one"""
+        return identify(self.name).context
+
+    @property
+    def tags(self):
+        """The projects (+) of the task, None if there are none
+
+        The list is shared by the records of the task, it must not be modified.
+        """
+        return identify(self.name).tags
+
+    def __repr__(self):
+        start_str = "None"
+        end_str = "None"
+        work_str = "in progress"
+
+        if self.start_time:
+            start_str = "%s" % self.start_time.strftime("%H:%M")
+
+        if self.end_time:
+            end_str = "%s" % self.end_time.strftime("%H:%M")
+            work_str = "%s" % str(self.work_time).split(".")[0]
+
+        if self.tid is not None:
+            return "[%d:%s] - %s| %s (%s -> %s) - %s" % (
+                self.tid,
+                self.uid,
+                self.last_end_date,
+                work_str,
+                start_str,
+                end_str,
+                self.name,
+            )
+
+        return "[%s] - %s| %s (%s -> %s) - %s" % (
+            self.uid,
+            self.last_end_date,
+            work_str,
+            start_str,
+            end_str,
+            self.name,
+        )
+
+    def __eq__(self, other):
+        return self.name == other.name
+
+    def __ne__(self, other):
+        return self.name != other.name
+
+    __hash__ = None
@@ -0,0 +1,194 @@
+"""
+This module keeps the streaming renderer of the report tables.
+
+terminaltables measures every cell before printing the first line, which
+is fine for a day or a week of tasks but not for a whole history. The
+StreamingTable prints each row as soon as it gets it: the column widths
+come from bounds known in advance (e.g. the longest task name) and from a
+first window of rows.
+
+The output looks like the terminaltables one, with unicode box drawing
+characters (or ASCII ones), and can go through a pager.
+"""
+import os
+import re
+import subprocess
+import sys
+import unicodedata
+from contextlib import contextmanager, redirect_stdout
+
+# Rows buffered to measure the columns before printing anything
+WINDOW_SIZE = 100
+
+DEFAULT_PAGER = "less -R"
+
+ANSI_PATTERN = re.compile(r"\x1b\[[\d;]*m")
+
+# top left, top, top right, vertical, left tee, horizontal, right tee,
+# bottom left, bottom, bottom right
+UNICODE_BORDERS = "┌─┐│├─┤└─┘"
+ASCII_BORDERS = "+-+|+-++-+"
+
+
+def visible_width(string):
+    """Return the width of string on a terminal, escape sequences excluded"""
+    if "\x1b" in string:
+        string = ANSI_PATTERN.sub("", string)
+    if string.isascii():
+        return len(string)
+    return sum(2 if unicodedata.east_asian_width(char) in ("F", "W") else 1 for char in string)
+
+
+def _justify(string, width, justify):
+    missing = width - visible_width(string)
+    if missing <= 0:
+        return string
+    if justify == "right":
+        return " " * missing + string
+    if justify == "center":
+        left = missing // 2
+        return " " * left + string + " " * (missing - left)
+    return string + " " * missing
+
+
+def _fold(string, width):
+    """Split string in lines no wider than width, escape sequences excluded
+
+    A color still open at the end of a line is closed there and opened again
+    on the next line, so that it does not spill over the borders.
+    """
+    if visible_width(string) <= width:
+        return [string]
+    lines = []
+    line, line_width, color = "", 0, ""
+    position = 0
+    while position < len(string):
+        match = ANSI_PATTERN.match(string, position)
+        if match:
+            line += match.group()
+            color = "" if match.group() in ("\x1b[0m", "\x1b[m") else match.group()
+            position = match.end()
+            continue
+        char = string[position]
+        char_width = visible_width(char)
+        if line_width + char_width > width and line_width:
+            lines.append(line + ("\x1b[0m" if color else ""))
+            line, line_width = color, 0
+        line += char
+        line_width += char_width
+        position += 1
+    lines.append(line)
+    return lines
+
+
+class StreamingTable(object):
+    """A table printed row by row
+
+    widths are the minimum widths of the columns, the first WINDOW_SIZE
+    rows can only make them larger. Cells spanning more lines (e.g. wrapped
+    task names) are supported, the cells of the later rows wider than their
+    column are folded on more lines.
+    """
+
+    def __init__(self, headers, widths=None, justify=None, title=None, ascii=False, stream=None):
+        self.headers = [str(header) for header in headers]
+        self.widths = [visible_width(header) for header in self.headers]
+        if widths:
+            self.widths = [max(pair) for pair in zip(self.widths, widths)]
+        self.justify = justify or ["left"] * len(self.headers)
+        self.title = title
+        self.borders = ASCII_BORDERS if ascii else UNICODE_BORDERS
+        self.stream = stream or sys.stdout
+        self.window = []
+        self.started = False
+
+    def _line(self, cells):
+        vertical = self.borders[3]
+        # shorter rows (e.g. the footer) are padded with empty cells
+        cells = list(cells) + [""] * (len(self.headers) - len(cells))
+        columns = [
+            [part for line in str(cell).split("\n") for part in _fold(line, width)]
+            for cell, width in zip(cells, self.widths)
+        ]
+        height = max(len(lines) for lines in columns)
+        output = []
+        for index in range(height):
+            parts = []
+            for lines, width, justify in zip(columns, self.widths, self.justify):
+                text = lines[index] if index < len(lines) else ""
+                parts.append(" " + _justify(text, width, justify) + " ")
+            output.append(vertical + "".join(parts) + vertical)
+        return "\n".join(output) + "\n"
+
+    def _rule(self, left, horizontal, right, title=None):
+        inner = sum(self.widths) + 2 * len(self.widths)
+        if title:
+            title = title[:inner]
+            return left + title + horizontal * (inner - visible_width(title)) + right + "\n"
+        return left + horizontal * inner + right + "\n"
+
+    def _start(self, footer=None):
+        for row in self.window + ([footer] if footer else []):
+            for column, cell in enumerate(row):
+                width = max(visible_width(line) for line in str(cell).split("\n"))
+                if width > self.widths[column]:
+                    self.widths[column] = width
+        self.started = True
+        self.stream.write(self._rule(*self.borders[0:3], title=self.title))
+        self.stream.write(self._line(self.headers))
+        self.stream.write(self._rule(*self.borders[4:7]))
+        for row in self.window:
+            self.stream.write(self._line(row))
+        self.window = []
+
+    def add_row(self, cells):
+        """Print a row, or keep it until the first window is full"""
+        if self.started:
+            self.stream.write(self._line(cells))
+            return
+        self.window.append(cells)
+        if len(self.window) >= WINDOW_SIZE:
+            self._start()
+
+    def close(self, footer=None):
+        """Print the remaining rows, the footer row and the bottom border"""
+        if not self.started:
+            self._start(footer)
+        if footer:
+            self.stream.write(self._rule(*self.borders[4:7]))
+            self.stream.write(self._line(footer))
+        self.stream.write(self._rule(*self.borders[7:10]))
+        self.stream.flush()
+
+
+@contextmanager
+def pager(enabled=True):
+    """Redirect the standard output to the pager while in the block
+
+    The pager is $PAGER (less -R by default), used only when enabled and the
+    output is a terminal. Output stops quietly when the pager quits.
+    """
+    if not enabled or not sys.stdout.isatty():
+        yield
+        return
+
+    command = os.environ.get("PAGER") or DEFAULT_PAGER
+    try:
+        process = subprocess.Popen(
+            command, shell=True, stdin=subprocess.PIPE, universal_newlines=True, encoding="utf-8"
+        )
+    except OSError:
+        yield
+        return
+
+    try:
+        with redirect_stdout(process.stdin):
+            yield
+    except BrokenPipeError:
+        pass
+    finally:
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        process.wait()
@@ -0,0 +1,219 @@
+"""
+This module keeps a binary snapshot of the decoded history next to the
+history file.
+
+The snapshot is validated against the history size and modification time.
+When the history only grew (the usual case, Task.stop appends one line), only
+the new bytes are decoded. Any other change rebuilds the snapshot from scratch.
+
+The task IDs come from the position of the last record of each name, which
+the new records update, so an append does not walk the older records.
+"""
+import os
+import struct
+from array import array
+
+from history import decode_line, to_epoch, from_epoch, load_cache
+from log import LOGGER
+from names import identify
+from parallel import map_lines
+
+
+SNAPSHOT_SUFFIX = ".snapshot"
+
+MAGIC = b"LDSNAP"
+VERSION = 3
+# magic, version, history size, history mtime, head crc, tail crc, names, records
+HEADER = struct.Struct("<6sHqqIIII")
+NAME_HEADER = struct.Struct("<32sI")
+# Marker for missing start/end times
+NO_TIME = -(2**63)
+
+
+def snapshot_path(history_path):
+    """Return the snapshot file path of the given history"""
+    return history_path + SNAPSHOT_SUFFIX
+
+
+class Snapshot(object):
+    """Decoded history records, stored by column in history file order"""
+
+    def __init__(self):
+        self.size = 0
+        self.mtime_ns = 0
+        self.head_crc = 0
+        self.tail_crc = 0
+        self.names = []
+        self.uids = []
+        self.name_ids = array("I")
+        self.starts = array("q")
+        self.ends = array("q")
+        # position of the last record of each name, for the task IDs
+        self.lasts = array("I")
+        self._name_index = {}
+
+    def __len__(self):
+        return len(self.name_ids)
+
+    def add(self, name, start_time, end_time):
+        """Append a decoded record"""
+        name_id = self._name_index.get(name)
+        if name_id is None:
+            name_id = len(self.names)
+            self._name_index[name] = name_id
+            self.names.append(name)
+            self.uids.append(identify(name).uid)
+            self.lasts.append(0)
+
+        self.lasts[name_id] = len(self.name_ids)
+        self.name_ids.append(name_id)
+        self.starts.append(to_epoch(start_time) if start_time else NO_TIME)
+        self.ends.append(to_epoch(end_time) if end_time else NO_TIME)
+
+    def decode(self, data):
+        """Decode and append the records in the given history bytes"""
+        for line in data.split(b"\n"):
+            if not line.strip():
+                continue
+            record = decode_line(line.decode("utf-8", errors="replace"))
+            if record:
+                self.add(*record)
+
+    def merge(self, names, uids, lasts, name_ids, starts, ends):
+        """Append the columns of a partial snapshot, see _decode_part"""
+        base = len(self.name_ids)
+        global_ids = []
+        for name, uid, last in zip(names, uids, lasts):
+            name_id = self._name_index.get(name)
+            if name_id is None:
+                name_id = self._name_index[name] = len(self.names)
+                self.names.append(name)
+                self.uids.append(uid)
+                self.lasts.append(0)
+            self.lasts[name_id] = base + last
+            global_ids.append(name_id)
+        self.name_ids.extend(global_ids[name_id] for name_id in name_ids)
+        self.starts.extend(starts)
+        self.ends.extend(ends)
+
+    def extend(self, data, offset=0):
+        """Decode and append the records in the given history bytes
+
+        Large histories are decoded by parts in parallel, see parallel.map_lines.
+        """
+        parts = map_lines(_decode_part, data)
+        if parts is None:
+            self.decode(data)
+        else:
+            for part in parts:
+                self.merge(*part)
+
+    def tids(self):
+        """Return the task ID of each name, by recency of its last record"""
+        by_recency = sorted(range(len(self.lasts)), key=self.lasts.__getitem__, reverse=True)
+        tids = [0] * len(by_recency)
+        for tid, name_id in enumerate(by_recency, 1):
+            tids[name_id] = tid
+        return tids
+
+    def records(self):
+        """Yield (name, uid, tid, start_time, end_time) newest first"""
+        names, uids, tids = self.names, self.uids, self.tids()
+        for pos in range(len(self.name_ids) - 1, -1, -1):
+            name_id = self.name_ids[pos]
+            start, end = self.starts[pos], self.ends[pos]
+            yield (
+                names[name_id],
+                uids[name_id],
+                tids[name_id],
+                from_epoch(start) if start != NO_TIME else None,
+                from_epoch(end) if end != NO_TIME else None,
+            )
+
+    def dump(self, path):
+        """Write the snapshot atomically to path"""
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp_path, "wb") as sfile:
+            sfile.write(
+                HEADER.pack(
+                    MAGIC,
+                    VERSION,
+                    self.size,
+                    self.mtime_ns,
+                    self.head_crc,
+                    self.tail_crc,
+                    len(self.names),
+                    len(self.name_ids),
+                )
+            )
+            for name, uid in zip(self.names, self.uids):
+                encoded = name.encode()
+                sfile.write(NAME_HEADER.pack(bytes.fromhex(uid), len(encoded)))
+                sfile.write(encoded)
+            self.lasts.tofile(sfile)
+            for column in (self.name_ids, self.starts, self.ends):
+                column.tofile(sfile)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path):
+        """Read a snapshot file, returns None if missing or unreadable"""
+        try:
+            with open(path, "rb") as sfile:
+                data = sfile.read()
+        except IOError:
+            return None
+
+        try:
+            (
+                magic,
+                version,
+                size,
+                mtime_ns,
+                head_crc,
+                tail_crc,
+                names_count,
+                records_count,
+            ) = HEADER.unpack_from(data)
+            if magic != MAGIC or version != VERSION:
+                return None
+
+            snap = Snapshot()
+            snap.size, snap.mtime_ns = size, mtime_ns
+            snap.head_crc, snap.tail_crc = head_crc, tail_crc
+            offset = HEADER.size
+            for name_id in range(names_count):
+                uid, length = NAME_HEADER.unpack_from(data, offset)
+                offset += NAME_HEADER.size
+                name = data[offset : offset + length].decode()
+                offset += length
+                snap.names.append(name)
+                snap.uids.append(uid.hex())
+                snap._name_index[name] = name_id
+
+            end = offset + names_count * snap.lasts.itemsize
+            snap.lasts.frombytes(data[offset:end])
+            offset = end
+            for attr in ("name_ids", "starts", "ends"):
+                column = getattr(snap, attr)
+                end = offset + records_count * column.itemsize
+                column.frombytes(data[offset:end])
+                offset = end
+            if offset != len(data):
+                return None
+            return snap
+        except (struct.error, ValueError, UnicodeDecodeError) as error:
+            LOGGER.debug("could not read history snapshot: %s", error)
+            return None
+
+
+def _decode_part(data):
+    """Return the columns of the records in a part of the history, in a worker"""
+    snap = Snapshot()
+    snap.decode(data)
+    return snap.names, snap.uids, snap.lasts, snap.name_ids, snap.starts, snap.ends
+
+
+def load_snapshot(history_path):
+    """Return the up-to-date Snapshot of the given history file"""
+    return load_cache(Snapshot, snapshot_path(history_path), history_path)
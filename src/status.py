@@ -0,0 +1,152 @@
+"""
+This module answers lets status, the running task for shell prompts and
+status bars:
+
+    lets status                            # Working on 'write +doc' for 1h 12m 5s
+    lets status --format=json              # {"running": true, "name": ...}
+    lets status --format='{name} {hours}:{minutes:02}'
+    lets status --watch                    # refreshed in place every second
+
+Any format other than plain and json is a template with the name, start,
+elapsed (seconds), hours, minutes and seconds fields. Nothing is printed
+by the templates when no task is running. The exit code is 0 when a task is
+running, 1 otherwise.
+
+It runs at every prompt, so it must stay cheap to import: only the running
+task file and the cached data directory are read.
+"""
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+from paths import TASK_FILE_NAME, get_cached_data_directory
+
+
+USAGE = "usage: lets status [--format=plain|json|<template>] [--watch]"
+
+# Seconds between two refreshes of --watch
+WATCH_INTERVAL = 1
+
+# (path, mtime_ns, size) -> (name, start time) of the last running task read
+_LAST = {}
+
+
+def task_file_path(home="~"):
+    """Return the running task file path, from the cached data directory if possible"""
+    data_directory = get_cached_data_directory(home)
+    if data_directory is None:
+        from configuration import get_task_file_path
+
+        return get_task_file_path(home)
+    return os.path.join(data_directory, TASK_FILE_NAME)
+
+
+def _parse_start(string):
+    try:
+        # as written by Task, e.g. "2022-06-05 11:00:00"
+        return datetime.fromisoformat(string)
+    except ValueError:
+        from timetoolkit import str2datetime
+
+        return str2datetime(string)
+
+
+def read_running(path):
+    """Return the (name, start time) of the running task, None if no task is running"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    running = _LAST.get(key)
+    if running is None:
+        try:
+            with open(path, encoding="utf-8") as tfile:
+                data = json.load(tfile)
+            running = (data["name"], _parse_start(data["start"]))
+        except (OSError, ValueError, KeyError):
+            return None
+        _LAST.clear()
+        _LAST[key] = running
+    return running
+
+
+def render(running, fmt="plain", now=None):
+    """Return the status line of the running task in the given format"""
+    if running is None:
+        if fmt == "plain":
+            return "No task running"
+        if fmt == "json":
+            return json.dumps({"running": False})
+        return ""
+
+    name, start = running
+    elapsed = max(0, int(((now or datetime.now()) - start).total_seconds()))
+    hours, rest = divmod(elapsed, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if fmt == "plain":
+        return "Working on '%s' for %dh %dm %ds" % (name, hours, minutes, seconds)
+
+    fields = {
+        "name": name,
+        "start": start.strftime("%Y-%m-%d %H:%M"),
+        "elapsed": elapsed,
+        "hours": hours,
+        "minutes": minutes,
+        "seconds": seconds,
+    }
+    if fmt == "json":
+        return json.dumps(dict(fields, running=True))
+    return fmt.format(**fields)
+
+
+def _watch(path, fmt):
+    # in place on a terminal, one line per refresh for the status bars
+    in_place = sys.stdout.isatty()
+    try:
+        while True:
+            line = render(read_running(path), fmt)
+            if in_place:
+                sys.stdout.write("\r\x1b[K" + line)
+            else:
+                sys.stdout.write(line + "\n")
+            sys.stdout.flush()
+            time.sleep(WATCH_INTERVAL)
+    except KeyboardInterrupt:
+        if in_place:
+            sys.stdout.write("\n")
+        return 0
+
+
+def main(argv, home="~"):
+    """Print the status of the running task, see the module documentation"""
+    fmt, watch = "plain", False
+    args = iter(argv)
+    for arg in args:
+        if arg == "--watch":
+            watch = True
+        elif arg.startswith("--format="):
+            fmt = arg[len("--format=") :]
+        elif arg == "--format":
+            fmt = next(args, "plain")
+        else:
+            sys.stderr.write(USAGE + "\n")
+            return 1
+
+    try:
+        render(("", datetime.now()), fmt)
+    except (KeyError, IndexError, ValueError) as error:
+        sys.stderr.write("invalid status format '%s': %s\n" % (fmt, error))
+        return 1
+
+    path = task_file_path(home)
+    if watch:
+        return _watch(path, fmt)
+
+    running = read_running(path)
+    line = render(running, fmt)
+    if line:
+        sys.stdout.write(line + "\n")
+    return 0 if running else 1
@@ -0,0 +1,686 @@
+"""
+This module keeps the storage backends of the tasks' history.
+
+The default backend is the CSV history file. The SQLite backend keeps the
+same records in a database with indexes on end time, uid and tags, and it is
+selected with "storage: sqlite" in the configuration.
+
+Backends yield history records as (name, uid, tid, start_time, end_time)
+tuples, newest first. Task IDs are assigned by recency over the whole
+history, tasks with the same UID share the same ID.
+
+When the configuration lists several histories (e.g. one per person or per
+machine), the merged storage reads them all at once and appends the label of
+the source history to each record and each aggregate. Tasks are only
+appended to the own history.
+"""
+import os
+from datetime import datetime
+from itertools import zip_longest
+
+from archive import (
+    check_segments,
+    extend_tids,
+    iter_history_lines,
+    iter_sealed_records,
+    load_manifest,
+    rebuild_manifest,
+)
+from configuration import (
+    get_history_file_path,
+    get_database_file_path,
+    get_history_sources,
+    get_storage_backend,
+)
+from dayindex import index_path, iter_range_records, load_day_index
+from history import (
+    decode_line,
+    iter_records_reversed,
+    locked_history,
+    mark_read_only,
+    to_epoch,
+    from_epoch,
+)
+from log import LOGGER
+from names import identify
+from snapshot import load_snapshot, snapshot_path
+from tagindex import (
+    find_tags,
+    index_path as tag_index_path,
+    iter_tagged_records,
+    load_tag_index,
+)
+from totals import check_totals, load_totals, record_append, totals_path, journal_path
+from vocabulary import Vocabulary, load_vocabulary, update_vocabulary, vocabulary_path
+
+
+# Rows inserted per transaction when importing a CSV history
+IMPORT_BATCH_SIZE = 10000
+
+
+def _in_range(records, since, until):
+    """Yield the records ended in [since, until), either bound may be None"""
+    if since is None and until is None:
+        yield from records
+        return
+    for record in records:
+        end_time = record[4]
+        if end_time is None:
+            continue
+        if since is not None and end_time < since:
+            continue
+        if until is not None and end_time >= until:
+            continue
+        yield record
+
+
+def _sum_aggregates(parts, tids, by_day):
+    """Sum the aggregates of the same task (and day) over several parts of a history
+
+    The most recent part comes first, it gives the last start and end time.
+    tids are the task IDs of the whole history.
+    """
+    totals = {}
+    for rows in parts:
+        for row in rows:
+            key = (row[4].toordinal(), row[1]) if by_day else row[1]
+            total = totals.get(key)
+            if total is None:
+                totals[key] = row[:2] + (tids[row[1]],) + row[3:]
+            else:
+                totals[key] = total[:5] + (total[5] + row[5],)
+    rows = totals.values()
+    if by_day:
+        rows = sorted(rows, key=lambda row: row[4].toordinal())
+    return iter(rows)
+
+
+class CsvStorage(object):
+    """History stored in the letsdo-history CSV file"""
+
+    # aggregates come from the totals next to the history
+    can_aggregate = True
+
+    def __init__(self, path, read_only=False):
+        self.path = path
+        if read_only:
+            # the caches are used when up to date, never written
+            mark_read_only(path)
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def append(self, name, start_time, end_time, date):
+        """Store a task in history
+
+        The line is journaled for the totals in constant time. The vocabulary
+        is written again for the shell completion, it holds the tags and the
+        last names only (see vocabulary.RECENT_NAMES) so its cost does not
+        grow with the history. The day and tag indexes, which grow with the
+        history, are extended with the new line the next time they are read.
+        """
+        start_time_str = str(start_time).split(".")[0][:-3]
+        end_time_str = str(end_time).split(".")[0][:-3]
+        report_line = "{date},{name},{start_time},{stop_time}\n".format(
+            date=date,
+            name=name,
+            start_time=start_time_str,
+            stop_time=end_time_str,
+        )
+        with locked_history(self.path, "a", encoding="utf-8") as cfile:
+            offset = cfile.seek(0, os.SEEK_END)
+            cfile.writelines(report_line)
+            cfile.flush()
+            record_append(self.path, offset, report_line)
+        update_vocabulary(self.path)
+
+    def load_vocabulary(self):
+        """Return the up-to-date vocabulary.Vocabulary, None without history"""
+        if not self.exists():
+            return None
+        return load_vocabulary(self.path)
+
+    def iter_records(self, since=None, until=None):
+        """Yield the records ended in [since, until), reading as little as possible"""
+        if since is not None:
+            # through the day index, which finds the lines appended out of
+            # order (e.g. lets stop <time>) wherever they are
+            records = iter_range_records(self.path, since, until)
+        else:
+            records = iter_records_reversed(self.path, until=until)
+        yield from self._with_tids(records)
+        yield from self._sealed_records(since, until)
+
+    def iter_tagged_records(self, alternatives, since=None, until=None):
+        """Yield the records ended in [since, until) matching a tag query, through the tag index"""
+        records = _in_range(iter_tagged_records(self.path, alternatives), since, until)
+        yield from self._with_tids(records)
+        yield from self._sealed_records(since, until, alternatives)
+
+    def all_records(self):
+        """Yield all the records, through the history snapshot"""
+        yield from self._with_tids(load_snapshot(self.path).records())
+        yield from self._sealed_records()
+
+    def _with_tids(self, records):
+        """Give the records of the history file their task ID in the whole history
+
+        The caches of the history file only know its own tasks, the IDs differ
+        once a part of the history is sealed.
+        """
+        if not load_manifest(self.path):
+            return records
+        tids = self.tids()
+        return (record[:2] + (tids[record[1]],) + record[3:] for record in records)
+
+    def _sealed_records(self, since=None, until=None, tags=None):
+        """Yield the records of the sealed segments, see archive.iter_sealed_records"""
+        segments = load_manifest(self.path)
+        if not any(segment.overlaps(since, until) for segment in segments):
+            return
+        yield from iter_sealed_records(segments, self.tids(), since, until, tags)
+
+    def tids(self):
+        """Return the task ID of each task uid"""
+        return extend_tids(self.path, load_day_index(self.path))
+
+    def aggregate(self, since=None, until=None, tags=None, by_day=False):
+        """Return an iterator on the work time of each task ended in [since, until)
+
+        See totals.Totals.summarize, the sealed segments in the range add
+        their own totals. Raises ValueError when the bounds are not midnights.
+        """
+        rows = load_totals(self.path).summarize(since, until, tags, by_day)
+        segments = load_manifest(self.path)
+        if not segments:
+            return rows
+        parts = [rows] + [
+            segment.load_totals().summarize(since, until, tags, by_day)
+            for segment in segments
+            if segment.overlaps(since, until) and not (tags and not segment.has_tags(tags))
+        ]
+        return _sum_aggregates(parts, self.tids(), by_day)
+
+    def check(self):
+        """Return the inconsistencies between the caches and the history"""
+        return check_totals(self.path) + check_segments(self.path)
+
+    def rebuild(self):
+        """Rebuild the caches next to the history, e.g. after editing it"""
+        caches = (
+            ((snapshot_path(self.path),), load_snapshot),
+            ((index_path(self.path),), load_day_index),
+            ((tag_index_path(self.path),), load_tag_index),
+            ((vocabulary_path(self.path),), load_vocabulary),
+            ((totals_path(self.path), journal_path(self.path)), load_totals),
+        )
+        for paths, load in caches:
+            for path in paths:
+                if os.path.exists(path):
+                    os.remove(path)
+            load(self.path)
+        rebuild_manifest(self.path)
+
+
+class SqliteStorage(object):
+    """History stored in a SQLite database"""
+
+    can_aggregate = True
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS history (
+        id INTEGER PRIMARY KEY,
+        uid TEXT NOT NULL,
+        name TEXT NOT NULL,
+        start INTEGER,
+        end INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS history_end ON history (end);
+    CREATE INDEX IF NOT EXISTS history_uid ON history (uid, id);
+    CREATE TABLE IF NOT EXISTS tags (
+        history_id INTEGER NOT NULL REFERENCES history (id),
+        tag TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS tags_tag ON tags (tag, history_id);
+    """
+
+    def __init__(self, path, csv_path=None, read_only=False):
+        import sqlite3
+        from urllib.request import pathname2url
+
+        self.sqlite3 = sqlite3
+        self.path = path
+        self.csv_path = csv_path
+        is_new = not os.path.exists(path)
+        try:
+            if read_only:
+                # neither created nor written when it does not exist
+                self.connection = sqlite3.connect(
+                    "file:%s?mode=ro" % pathname2url(os.path.abspath(path)), uri=True
+                )
+                self.connection.execute("SELECT 1 FROM history LIMIT 1")
+                return
+            self.connection = sqlite3.connect(path)
+            self.connection.executescript(self.SCHEMA)
+        except sqlite3.Error as error:
+            raise IOError("could not open %s: %s" % (path, error))
+
+        if is_new and csv_path and (os.path.exists(csv_path) or load_manifest(csv_path)):
+            LOGGER.info("importing %s in %s", csv_path, path)
+            self.import_csv(csv_path)
+
+    def exists(self):
+        return True
+
+    def _insert(self, cursor, name, start_time, end_time):
+        uid = identify(name).uid
+        cursor.execute(
+            "INSERT INTO history (uid, name, start, end) VALUES (?, ?, ?, ?)",
+            (
+                uid,
+                name,
+                to_epoch(start_time) if start_time else None,
+                to_epoch(end_time) if end_time else None,
+            ),
+        )
+        tags = find_tags(name)
+        if tags:
+            cursor.executemany(
+                "INSERT INTO tags (history_id, tag) VALUES (?, ?)",
+                [(cursor.lastrowid, tag) for tag in tags],
+            )
+
+    def append(self, name, start_time, end_time, date=None):
+        """Store a task in history"""
+        before = self._stat()
+        try:
+            with self.connection:
+                self._insert(self.connection.cursor(), name, start_time, end_time)
+        except self.sqlite3.Error as error:
+            raise IOError(error)
+        self.load_vocabulary(before, name)
+
+    def _stat(self):
+        stat = os.stat(self.path)
+        return stat.st_size, stat.st_mtime_ns
+
+    def load_vocabulary(self, before=None, name=None):
+        """Return the up-to-date vocabulary.Vocabulary of the database
+
+        It is kept at the vocabulary path of the CSV history, where the shell
+        completion looks for it. When name was just appended and the
+        vocabulary was up to date before (the database size and mtime), it
+        is only added.
+        """
+        if self.csv_path is None:
+            return None
+        path = vocabulary_path(self.csv_path)
+        vocabulary = Vocabulary.load(path)
+        if vocabulary is not None and vocabulary.source == self.path:
+            known = (vocabulary.size, vocabulary.mtime_ns)
+            if name is not None and known == before:
+                vocabulary.add(name)
+            elif name is None and known == self._stat():
+                return vocabulary
+            else:
+                vocabulary = None
+        if vocabulary is None:
+            vocabulary = Vocabulary(self.path)
+            try:
+                for (task_name,) in self.connection.execute("SELECT name FROM history ORDER BY id"):
+                    vocabulary.add(task_name)
+            except self.sqlite3.Error as error:
+                raise IOError(error)
+        vocabulary.size, vocabulary.mtime_ns = self._stat()
+        try:
+            vocabulary.dump(path)
+        except IOError as error:
+            LOGGER.debug("could not save %s: %s", path, error)
+        return vocabulary
+
+    def tids(self):
+        """Return the task ID of each task uid"""
+        tids = {}
+        rows = self.connection.execute(
+            "SELECT uid FROM history GROUP BY uid ORDER BY MAX(id) DESC"
+        )
+        for tid, (uid,) in enumerate(rows, 1):
+            tids[uid] = tid
+        return tids
+
+    @staticmethod
+    def _range(since, until):
+        clauses, params = [], []
+        if since is not None:
+            clauses.append("end >= ?")
+            params.append(to_epoch(since))
+        if until is not None:
+            clauses.append("end < ?")
+            params.append(to_epoch(until))
+        if not clauses:
+            return "", params
+        return " WHERE " + " AND ".join(clauses), params
+
+    def iter_records(self, since=None, until=None):
+        """Yield the records ended in [since, until)"""
+        where, params = self._range(since, until)
+        try:
+            tids = self.tids()
+            rows = self.connection.execute(
+                "SELECT name, uid, start, end FROM history%s ORDER BY id DESC" % where,
+                params,
+            )
+            for name, uid, start, end in rows:
+                yield (
+                    name,
+                    uid,
+                    tids[uid],
+                    from_epoch(start) if start is not None else None,
+                    from_epoch(end) if end is not None else None,
+                )
+        except self.sqlite3.Error as error:
+            raise IOError(error)
+
+    @staticmethod
+    def _tagged(alternatives):
+        """Return the query of the history ids matching a tag query
+
+        Each alternative selects the records having all of its tags.
+        """
+        selects, params = [], []
+        for tags in alternatives:
+            tags = sorted(set(tags))
+            selects.append(
+                "SELECT history_id FROM tags WHERE tag IN (%s) "
+                "GROUP BY history_id HAVING COUNT(*) = ?" % ", ".join("?" * len(tags))
+            )
+            params.extend(tags)
+            params.append(len(tags))
+        return " UNION ".join(selects), params
+
+    def iter_tagged_records(self, alternatives, since=None, until=None):
+        """Yield the records ended in [since, until) matching a tag query"""
+        where, params = self._range(since, until)
+        tagged, tag_params = self._tagged(alternatives)
+        where += (" AND " if where else " WHERE ") + "id IN (%s)" % tagged
+        params.extend(tag_params)
+        try:
+            tids = self.tids()
+            rows = self.connection.execute(
+                "SELECT name, uid, start, end FROM history%s ORDER BY id DESC" % where,
+                params,
+            )
+            for name, uid, start, end in rows:
+                yield (
+                    name,
+                    uid,
+                    tids[uid],
+                    from_epoch(start) if start is not None else None,
+                    from_epoch(end) if end is not None else None,
+                )
+        except self.sqlite3.Error as error:
+            raise IOError(error)
+
+    def all_records(self):
+        """Yield all the records"""
+        return self.iter_records()
+
+    def check(self):
+        """Return the inconsistencies of the database, it has no caches"""
+        return []
+
+    def rebuild(self):
+        """Nothing to rebuild, the database has no caches"""
+
+    def aggregate(self, since=None, until=None, tags=None, by_day=False):
+        """Yield the work time of each task ended in [since, until)
+
+        Items are (name, uid, tid, start_time, end_time, seconds) tuples, where
+        start and end time are the ones of the most recent occurrence. When
+        tags is given only the tasks matching the tag query are considered.
+        When by_day is true, tasks are summed day by day, oldest day first.
+        """
+        where, params = self._range(since, until)
+        where += (" AND " if where else " WHERE ") + "end IS NOT NULL"
+        if tags:
+            tagged, tag_params = self._tagged(tags)
+            where += " AND id IN (%s)" % tagged
+            params.extend(tag_params)
+        group, order = "uid", "MAX(id) DESC"
+        if by_day:
+            group, order = "day, uid", "day, MAX(id) DESC"
+        try:
+            tids = self.tids()
+            # SQLite takes the bare columns from the row with MAX(id)
+            rows = self.connection.execute(
+                "SELECT name, uid, start, end, date(end, 'unixepoch') AS day, "
+                "MAX(id), SUM(end - start) FROM history%s GROUP BY %s ORDER BY %s"
+                % (where, group, order),
+                params,
+            )
+            for name, uid, start, end, _, _, seconds in rows:
+                yield (
+                    name,
+                    uid,
+                    tids[uid],
+                    from_epoch(start) if start is not None else None,
+                    from_epoch(end) if end is not None else None,
+                    seconds or 0,
+                )
+        except self.sqlite3.Error as error:
+            raise IOError(error)
+
+    def import_csv(self, csv_path):
+        """Append the records of a CSV history and of its sealed segments, streaming them"""
+        count = 0
+        cursor = self.connection.cursor()
+        for line in iter_history_lines(csv_path):
+            record = decode_line(line) if line.strip() else None
+            if not record:
+                continue
+            self._insert(cursor, *record)
+            count += 1
+            if count % IMPORT_BATCH_SIZE == 0:
+                self.connection.commit()
+        self.connection.commit()
+        return count
+
+    def export_csv(self, stream):
+        """Write all the records to stream in the CSV history format"""
+        count = 0
+        rows = self.connection.execute(
+            "SELECT name, start, end FROM history ORDER BY id"
+        )
+        for name, start, end in rows:
+            start_str = from_epoch(start).strftime("%Y-%m-%d %H:%M") if start is not None else ""
+            end_str = from_epoch(end).strftime("%Y-%m-%d %H:%M") if end is not None else ""
+            stream.write("%s,%s,%s,%s\n" % (end_str[:10], name, start_str, end_str))
+            count += 1
+        return count
+
+
+def _end_time(record):
+    return record[4] or datetime.min
+
+
+class MergedStorage(object):
+    """Several histories read as one, the own history first
+
+    The records of the sources are sorted together by end time, newest
+    first, in memory: a history is not sorted by end time when lines were
+    appended out of order. Each record and aggregate ends with the label of
+    its source. The merged storage is read only, tasks are appended to the
+    own storage.
+
+    The other histories are opened read only on first use, their caches are
+    never written. A history which cannot be opened or read is skipped with
+    a warning, the others are still read.
+
+    Task IDs are interleaved, the most recent task of each source first, and
+    tasks with the same UID share the same ID whatever their source.
+    """
+
+    can_aggregate = True
+
+    def __init__(self, own, others, own_label=None):
+        self.own = own
+        self.own_label = own_label
+        self.path = own.path
+        # (label, path) of the other histories
+        self.others = others
+        # (label, storage) of the histories opened and readable so far
+        self._sources = None
+
+    def _open(self):
+        if self._sources is None:
+            self._sources = [(self.own_label, self.own)]
+            for label, path in self.others:
+                try:
+                    self._sources.append((label, open_history(path)))
+                except IOError as error:
+                    LOGGER.warning("skipping the history %s: %s", label, error)
+        return self._sources
+
+    def _skip(self, label, storage, error):
+        """Stop reading a history which failed"""
+        LOGGER.warning("skipping the history %s: %s", label, error)
+        self._sources = [source for source in self._sources if source[1] is not storage]
+
+    def exists(self):
+        return any(storage.exists() for _, storage in self._open())
+
+    def _existing(self):
+        return [(label, storage) for label, storage in self._open() if storage.exists()]
+
+    def _read(self, label, storage, read):
+        """Return read(storage), None when another history cannot be read"""
+        if storage is self.own:
+            return read(storage)
+        try:
+            return read(storage)
+        except IOError as error:
+            self._skip(label, storage, error)
+            return None
+
+    def _guarded(self, label, storage, records):
+        """Yield the records, stopping when another history cannot be read"""
+        if storage is self.own:
+            yield from records
+            return
+        try:
+            yield from records
+        except IOError as error:
+            self._skip(label, storage, error)
+
+    def tids(self):
+        """Return the task ID of each task uid over all the histories"""
+        by_recency = []
+        for label, storage in self._existing():
+            tids = self._read(label, storage, lambda storage: storage.tids())
+            if tids is not None:
+                by_recency.append(sorted(tids, key=tids.get))
+        tids = {}
+        for uids in zip_longest(*by_recency):
+            for uid in uids:
+                if uid is not None and uid not in tids:
+                    tids[uid] = len(tids) + 1
+        return tids
+
+    def _merge(self, read):
+        """Merge the records read(storage) of the histories by end time, newest first"""
+        tids = self.tids()
+        records = []
+        for label, storage in self._existing():
+            for record in self._guarded(label, storage, read(storage)):
+                records.append(record[:2] + (tids[record[1]],) + record[3:] + (label,))
+        records.sort(key=_end_time, reverse=True)
+        return iter(records)
+
+    def iter_records(self, since=None, until=None):
+        """Yield the records ended in [since, until), with the label of their history"""
+        return self._merge(lambda storage: storage.iter_records(since, until))
+
+    def iter_tagged_records(self, alternatives, since=None, until=None):
+        """Yield the records ended in [since, until) matching a tag query, with their label"""
+        return self._merge(
+            lambda storage: storage.iter_tagged_records(alternatives, since, until)
+        )
+
+    def all_records(self):
+        """Yield all the records, with the label of their history"""
+        return self._merge(lambda storage: storage.all_records())
+
+    def aggregate(self, since=None, until=None, tags=None, by_day=False):
+        """Return the work time of each task of each history, the most recent first
+
+        See the backends, items end with the label of the history. Raises
+        ValueError when a backend cannot aggregate the range.
+        """
+        tids = self.tids()
+        rows = []
+        for label, storage in self._existing():
+            # raises before any row is used when a backend cannot aggregate
+            aggregates = self._read(
+                label,
+                storage,
+                lambda storage: list(storage.aggregate(since, until, tags=tags, by_day=by_day)),
+            )
+            for row in aggregates or ():
+                rows.append(row[:2] + (tids[row[1]],) + row[3:] + (label,))
+        # the backends do not sort their aggregates by end time
+        rows.sort(key=_end_time, reverse=True)
+        return iter(rows)
+
+    def check(self):
+        """Return the inconsistencies of each history"""
+        problems = []
+        for label, storage in self._existing():
+            prefix = "%s: " % (label or storage.path)
+            problems.extend(prefix + problem for problem in storage.check())
+        return problems
+
+    def rebuild(self):
+        """Rebuild the caches of the own history, the others are read only"""
+        self.own.rebuild()
+
+
+_STORAGES = {}
+
+
+def _sqlite_storage(path, csv_path=None, read_only=False):
+    if path not in _STORAGES:
+        _STORAGES[path] = SqliteStorage(path, csv_path=csv_path, read_only=read_only)
+    return _STORAGES[path]
+
+
+def open_history(path):
+    """Open another history read only, raises IOError when it cannot be read"""
+    if path.endswith(".db"):
+        return _sqlite_storage(path, read_only=True)
+    if not os.path.exists(path) and not load_manifest(path):
+        raise IOError("no history at %s" % path)
+    return CsvStorage(path, read_only=True)
+
+
+def get_own_storage(home="~"):
+    """Return the storage of the own history, the one tasks are appended to"""
+    backend = get_storage_backend(home)
+    if backend == "sqlite":
+        return _sqlite_storage(
+            get_database_file_path(home), csv_path=get_history_file_path(home)
+        )
+    if backend != "csv":
+        LOGGER.warning("unknown storage '%s', using csv", backend)
+    return CsvStorage(get_history_file_path(home))
+
+
+def get_storage():
+    """Return the storage of the histories read by the reports
+
+    See MergedStorage when the configuration lists other histories.
+    """
+    storage = get_own_storage()
+    sources = get_history_sources()
+    if len(sources) == 1:
+        return storage
+    return MergedStorage(storage, sources[1:], own_label=sources[0][0])
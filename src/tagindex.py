@@ -0,0 +1,205 @@
+"""
+This module keeps an inverted index from each +tag and @context to the
+history lines of the tasks using it, so that tag queries do not need to scan
+the whole history.
+
+Tag queries are words separated by spaces (all of them are required) and
+alternatives separated by "or" or "|", e.g. "+letsdo @home or +review".
+"""
+import os
+import struct
+from array import array
+
+from dayindex import load_day_index
+from history import decode_line, load_cache
+from log import LOGGER
+from names import LABEL_PATTERN, identify
+
+
+INDEX_SUFFIX = ".tags"
+
+MAGIC = b"LDTAGS"
+VERSION = 1
+# magic, version, history size, history mtime, head crc, tail crc, tags, postings
+HEADER = struct.Struct("<6sHqqIIII")
+TAG_HEADER = struct.Struct("<HI")
+
+OR_WORDS = ("or", "|")
+
+
+def index_path(history_path):
+    """Return the tag index file path of the given history"""
+    return history_path + INDEX_SUFFIX
+
+
+def find_tags(name):
+    """Return the set of tags and contexts in a task name"""
+    return identify(name).labels
+
+
+def parse_tag_query(query):
+    """Parse a tag query into a list of alternatives, each a list of tags
+
+    e.g. "+a +b or @c" -> [["+a", "+b"], ["@c"]]
+    Returns None if the query is not made of tags only.
+    """
+    if not query:
+        return None
+
+    alternatives = [[]]
+    for word in query.split():
+        if word.lower() in OR_WORDS:
+            alternatives.append([])
+        elif LABEL_PATTERN.fullmatch(word):
+            alternatives[-1].append(word)
+        else:
+            return None
+
+    if not all(alternatives):
+        return None
+    return alternatives
+
+
+class TagIndex(object):
+    """Offsets of the history lines by tag"""
+
+    def __init__(self):
+        self.size = 0
+        self.mtime_ns = 0
+        self.head_crc = 0
+        self.tail_crc = 0
+        # tag -> offsets of the lines with the tag, in history order
+        self.postings = {}
+
+    def extend(self, data, offset):
+        """Index the history bytes in data, starting at the given offset"""
+        for line in data.split(b"\n"):
+            # cheap check before decoding the line
+            if b"@" in line or b"+" in line:
+                record = decode_line(line.decode("utf-8", errors="replace"))
+                if record:
+                    for tag in find_tags(record[0]):
+                        postings = self.postings.get(tag)
+                        if postings is None:
+                            postings = self.postings[tag] = array("Q")
+                        postings.append(offset)
+            offset += len(line) + 1
+
+    def lookup(self, alternatives):
+        """Return the sorted offsets of the lines matching the tag query"""
+        offsets = set()
+        for tags in alternatives:
+            matches = None
+            # intersect starting from the shortest postings
+            for tag in sorted(tags, key=lambda tag: len(self.postings.get(tag, ()))):
+                postings = self.postings.get(tag, ())
+                matches = set(postings) if matches is None else matches.intersection(postings)
+                if not matches:
+                    break
+            offsets.update(matches or ())
+        return sorted(offsets)
+
+    def dump(self, path):
+        """Write the index atomically to path"""
+        tags = sorted(self.postings)
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp_path, "wb") as ifile:
+            ifile.write(
+                HEADER.pack(
+                    MAGIC,
+                    VERSION,
+                    self.size,
+                    self.mtime_ns,
+                    self.head_crc,
+                    self.tail_crc,
+                    len(tags),
+                    sum(len(self.postings[tag]) for tag in tags),
+                )
+            )
+            for tag in tags:
+                encoded = tag.encode()
+                ifile.write(TAG_HEADER.pack(len(encoded), len(self.postings[tag])))
+                ifile.write(encoded)
+            for tag in tags:
+                self.postings[tag].tofile(ifile)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path):
+        """Read an index file, returns None if missing or unreadable"""
+        try:
+            with open(path, "rb") as ifile:
+                data = ifile.read()
+        except IOError:
+            return None
+
+        try:
+            (
+                magic,
+                version,
+                size,
+                mtime_ns,
+                head_crc,
+                tail_crc,
+                tags_count,
+                postings_count,
+            ) = HEADER.unpack_from(data)
+            if magic != MAGIC or version != VERSION:
+                return None
+
+            index = TagIndex()
+            index.size, index.mtime_ns = size, mtime_ns
+            index.head_crc, index.tail_crc = head_crc, tail_crc
+
+            offset = HEADER.size
+            tags = []
+            for _ in range(tags_count):
+                length, count = TAG_HEADER.unpack_from(data, offset)
+                offset += TAG_HEADER.size
+                tags.append((data[offset : offset + length].decode(), count))
+                offset += length
+            for tag, count in tags:
+                postings = array("Q")
+                end = offset + count * postings.itemsize
+                postings.frombytes(data[offset:end])
+                index.postings[tag] = postings
+                offset = end
+
+            if offset != len(data) or sum(count for _, count in tags) != postings_count:
+                return None
+            return index
+        except (struct.error, ValueError, UnicodeDecodeError) as error:
+            LOGGER.debug("could not read tag index: %s", error)
+            return None
+
+
+def load_tag_index(history_path):
+    """Return the up-to-date TagIndex of the given history file"""
+    return load_cache(TagIndex, index_path(history_path), history_path)
+
+
+def update_tag_index(history_path):
+    """Bring an existing tag index up to date with the history"""
+    if os.path.exists(index_path(history_path)):
+        load_tag_index(history_path)
+
+
+def iter_tagged_records(history_path, alternatives):
+    """Yield the history records matching the tag query, newest first
+
+    Records are (name, uid, tid, start_time, end_time) tuples.
+    """
+    offsets = load_tag_index(history_path).lookup(alternatives)
+    if not offsets:
+        return
+
+    tids = load_day_index(history_path).tids()
+    with open(history_path, "rb") as hfile:
+        for offset in reversed(offsets):
+            hfile.seek(offset)
+            record = decode_line(hfile.readline().decode("utf-8", errors="replace"))
+            if not record:
+                continue
+            name, start_time, end_time = record
+            uid = identify(name).uid
+            yield name, uid, tids[uid], start_time, end_time
@@ -1,20 +1,19 @@
 import os
-import re
 import json
-import hashlib
 from datetime import datetime, timedelta
 
-from log import LOGGER, RAFFAELLO
-from configuration import get_configuration, get_task_file_path, get_history_file_path
+from log import LOGGER
+from names import identify
+from colors import paint
+from configuration import get_task_file_path
 from timetoolkit import str2datetime
+from storage import get_own_storage
 from typing import Optional
 
 
 def _p(msg):
     """Colorize message"""
-    if msg and get_configuration()["color"] and RAFFAELLO:
-        return RAFFAELLO.paint(str(msg))
-    return msg
+    return paint(msg)
 
 
 class Task(object):
@@ -24,7 +23,6 @@ class Task(object):
         self.context = None
         self.tags = None
         self.__parse_name(name.strip())
-        self.uid = self.__hash()
         self.tid = tid
 
         # Adjust Task's start time with a string representing a
@@ -34,11 +32,16 @@ class Task(object):
         self.start_time = start_str
 
         if end_str:
-            self.end_time = str2datetime(end_str.strip())
-            self.work_time = self.end_time - self.start_time
-            self.week_no = self.end_time.strftime("%V")
+            self.__set_end_time(str2datetime(end_str.strip()))
+        else:
+            self.__set_end_time(None)
+
+    def __set_end_time(self, end_time):
+        self.end_time = end_time
+        if end_time:
+            self.work_time = end_time - self.start_time
+            self.week_no = end_time.strftime("%V")
         else:
-            self.end_time = None
             self.work_time = timedelta()
             self.week_no = None
 
@@ -101,19 +104,9 @@ class Task(object):
             date = datetime.today()
 
         work_time_str = str(stop_time - task.start_time).split(".")[0][:-3]
-        start_time_str = str(task.start_time).split(".")[0][:-3]
-        stop_time_str = str(stop_time).split(".")[0][:-3]
-
-        report_line = "{date},{name},{start_time},{stop_time}\n".format(
-            date=date,
-            name=task.name,
-            start_time=start_time_str,
-            stop_time=stop_time_str,
-        )
 
         try:
-            with open(get_history_file_path(), mode="a", encoding="utf-8") as cfile:
-                cfile.writelines(report_line)
+            get_own_storage().append(task.name, task.start_time, stop_time, date)
         except IOError as error:
             LOGGER.error("Could not save report: %s", error)
             return None
@@ -166,10 +159,6 @@ class Task(object):
         LOGGER.warning("Another task is running")
         return True
 
-    def __hash(self):
-        gen = hashlib.sha256(self.name.encode())
-        return gen.hexdigest()
-
     def __create(self):
         try:
             with open(get_task_file_path(), "w") as cfile:
@@ -190,15 +179,13 @@ class Task(object):
     def __parse_name(self, name):
         # Sanitizing name (commas are still used to separate infos and cannot
         # be used in task's name
-        name = name.replace(",", " ")
-        self.name = name
+        task_name = identify(name.replace(",", " "))
+        self.name = task_name.name
+        self.uid = task_name.uid
         # Storing contexts (@) and projects (+)
-        matches = re.findall(r"@[\w\-_]+", name)
-        if len(matches) == 1:
-            self.context = matches[0]
-        matches = re.findall(r"\+[\w\-_]+", name)
-        if len(matches) >= 1:
-            self.tags = matches
+        self.context = task_name.context
+        if task_name.tags:
+            self.tags = list(task_name.tags)
 
     def __repr__(self):
         start_str = "None"
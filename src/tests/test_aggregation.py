@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vi: set ft=python :
+from datetime import datetime, timedelta
+from record import HistoryRecord
+from aggregation import aggregate, by_date_and_uid
+
+
+def _task(name, start, end):
+    return HistoryRecord(name, start, end)
+
+
+def test_aggregate_by_uid():
+    tasks = [
+        _task("a", datetime(2022, 1, 3, 9), datetime(2022, 1, 3, 10)),
+        _task("b", datetime(2022, 1, 2, 9), datetime(2022, 1, 2, 9, 30)),
+        _task("a", datetime(2022, 1, 1, 9), datetime(2022, 1, 1, 9, 15)),
+    ]
+    groups = list(aggregate(tasks).values())
+    assert [group.task.name for group in groups] == ["a", "b"]
+    assert groups[0].work_time == timedelta(hours=1, minutes=15)
+    assert groups[0].count == 2
+    assert groups[0].first_time == datetime(2022, 1, 1, 9, 15)
+    assert groups[0].last_time == datetime(2022, 1, 3, 10)
+
+
+def test_aggregate_keeps_whole_days():
+    tasks = [_task("long", datetime(2022, 1, 1, 9), datetime(2022, 1, 3, 10))]
+    group = list(aggregate(tasks).values())[0]
+    assert group.work_time == timedelta(days=2, hours=1)
+
+
+def test_aggregate_by_date_and_uid():
+    tasks = [
+        _task("a", datetime(2022, 1, 2, 9), datetime(2022, 1, 2, 10)),
+        _task("a", datetime(2022, 1, 1, 9), datetime(2022, 1, 1, 10)),
+        _task("a", datetime(2022, 1, 1, 11), datetime(2022, 1, 1, 12)),
+    ]
+    groups = aggregate(tasks, key=by_date_and_uid)
+    assert [date for date, _ in groups] == ["2022-01-02", "2022-01-01"]
+    assert [group.count for group in groups.values()] == [1, 2]
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+# vi: set ft=python :
+"""Unittest for archive module"""
+import os
+import gzip
+import unittest
+import tempfile
+import threading
+from datetime import datetime
+from unittest import mock
+
+from archive import archive_history, check_segments, load_manifest, segment_path
+from history import locked_history
+from storage import CsvStorage, SqliteStorage
+
+HISTORY = (
+    "2021-03-01,task one @home,2021-03-01 11:00,2021-03-01 12:00\n"
+    "2021-11-02,task two +tag,2021-11-02 12:00,2021-11-02 12:30\n"
+    "2022-02-07,task three +tag,2022-02-07 09:00,2022-02-07 09:30\n"
+    "2022-06-07,task one @home,2022-06-07 09:00,2022-06-07 10:00\n"
+    "2023-01-09,task four,2023-01-09 09:00,2023-01-09 09:15\n"
+    # appended late, out of order
+    "2022-12-31,task five,2022-12-31 22:00,2022-12-31 23:00\n"
+    "2023-01-10,task two +tag,2023-01-10 09:00,2023-01-10 09:15\n"
+)
+
+NOW = datetime(2023, 2, 1)
+
+
+class TestArchive(unittest.TestCase):
+    """Test the history sealed in segments gives the same records"""
+
+    def setUp(self):
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.test_dir.name, "letsdo-history")
+        with open(self.path, "w", encoding="utf-8") as hfile:
+            hfile.write(HISTORY)
+        self.storage = CsvStorage(self.path)
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def queries(self):
+        return [
+            list(self.storage.all_records()),
+            list(self.storage.iter_records()),
+            list(self.storage.iter_records(datetime(2021, 11, 1), datetime(2022, 7, 1))),
+            list(self.storage.iter_records(datetime(2022, 6, 1))),
+            list(self.storage.iter_records(until=datetime(2022, 1, 1))),
+            list(self.storage.iter_tagged_records([["+tag"]])),
+            list(self.storage.iter_tagged_records([["@home"]], until=datetime(2022, 1, 1))),
+        ]
+
+    def test_archive(self):
+        """Test the closed years are sealed and the current one is kept"""
+        segments = archive_history(self.path, now=NOW)
+        self.assertEqual([segment.period for segment in segments], ["2021", "2022"])
+        with open(self.path, encoding="utf-8") as hfile:
+            lines = HISTORY.splitlines(True)
+            self.assertEqual(hfile.read(), lines[4] + lines[6])
+        with gzip.open(segment_path(self.path, "2021"), "rt", encoding="utf-8") as sfile:
+            self.assertEqual(sfile.read(), "".join(HISTORY.splitlines(True)[:2]))
+
+        sealed = load_manifest(self.path)
+        self.assertEqual([segment.period for segment in sealed], ["2022", "2021"])
+        self.assertEqual(
+            (sealed[0].first, sealed[0].last, sealed[0].records, sealed[0].seconds),
+            (datetime(2022, 2, 7, 9, 30), datetime(2022, 12, 31, 23), 3, 9000),
+        )
+        self.assertEqual(sealed[0].tags, {"+tag", "@home"})
+        self.assertEqual(archive_history(self.path, now=NOW), [])
+        self.assertEqual(check_segments(self.path), [])
+
+    def test_same_records(self):
+        """Test queries give the same records, task IDs included, once sealed"""
+        before = self.queries()
+        archive_history(self.path, now=NOW)
+        # only the lines out of order move, with their segment
+        self.assertEqual(
+            [sorted(query) for query in self.queries()], [sorted(query) for query in before]
+        )
+        tids = {record[0]: record[2] for record in before[0]}
+        self.assertEqual((tids["task four"], tids["task five"]), (3, 2))
+
+        # tasks appended since come first, the recency of the others is kept
+        with open(self.path, "a", encoding="utf-8") as hfile:
+            hfile.write("2023-01-11,task four,2023-01-11 09:00,2023-01-11 09:15\n")
+        tids = {record[0]: record[2] for record in self.storage.all_records()}
+        self.assertEqual(
+            [tids[name] for name in ("task four", "task two +tag", "task five")], [1, 2, 3]
+        )
+
+    def test_monthly(self):
+        """Test the closed months are sealed, late tasks join their segment"""
+        archive_history(self.path, monthly=True, now=NOW)
+        self.assertEqual(
+            [segment.period for segment in load_manifest(self.path)],
+            ["2023-01", "2022-12", "2022-06", "2022-02", "2021-11", "2021-03"],
+        )
+        with open(self.path, "a", encoding="utf-8") as hfile:
+            hfile.write("2022-02-08,late,2022-02-08 09:00,2022-02-08 10:00\n")
+        archive_history(self.path, now=NOW)
+        sealed = {segment.period: segment for segment in load_manifest(self.path)}
+        self.assertEqual(sealed["2022-02"].records, 2)
+        self.assertNotIn("2022", sealed)
+        self.assertEqual(os.path.getsize(self.path), 0)
+        records = self.storage.iter_records(datetime(2022, 2, 1), datetime(2022, 3, 1))
+        self.assertEqual([record[0] for record in records], ["late", "task three +tag"])
+
+    def test_overlapping_segments_only(self):
+        """Test only the segments in range are read"""
+        archive_history(self.path, now=NOW)
+        os.remove(segment_path(self.path, "2021"))
+        records = list(self.storage.iter_records(datetime(2022, 1, 1), datetime(2022, 7, 1)))
+        self.assertEqual([record[0] for record in records], ["task one @home", "task three +tag"])
+        self.assertEqual(
+            len(list(self.storage.iter_tagged_records([["+tag"]], datetime(2022, 1, 1)))), 2
+        )
+        # no sealed task has this tag
+        self.assertEqual(list(self.storage.iter_tagged_records([["@work"]])), [])
+        with self.assertRaises(OSError):
+            list(self.storage.all_records())
+        self.assertEqual(len(check_segments(self.path)), 1)
+
+    def test_aggregate(self):
+        """Test the summaries of sealed ranges come from the totals of the segments"""
+        queries = [
+            (None, None, None, False),
+            (datetime(2022, 1, 1), datetime(2023, 2, 1), None, False),
+            (datetime(2021, 1, 1), datetime(2023, 2, 1), [["+tag"]], False),
+            (datetime(2022, 6, 1), datetime(2023, 2, 1), None, True),
+        ]
+        before = [sorted(self.storage.aggregate(*query)) for query in queries]
+        archive_history(self.path, now=NOW)
+        # the segments are not read again
+        for period in ("2021", "2022"):
+            os.remove(segment_path(self.path, period))
+        self.assertEqual([sorted(self.storage.aggregate(*query)) for query in queries], before)
+        rows = self.storage.aggregate(datetime(2022, 6, 1), datetime(2023, 2, 1), by_day=True)
+        self.assertEqual([row[4].day for row in rows], [7, 31, 9, 10])
+
+    def test_locked_append(self):
+        """Test a task stopped while archiving waits and goes to the new history"""
+        with locked_history(self.path, "rb"):
+            thread = threading.Thread(
+                target=self.storage.append,
+                args=("task six", datetime(2023, 1, 12, 9), datetime(2023, 1, 12, 10), NOW.date()),
+            )
+            thread.start()
+            thread.join(0.2)
+            self.assertTrue(thread.is_alive())
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as hfile:
+                hfile.write(HISTORY.splitlines(True)[-1])
+            os.replace(tmp_path, self.path)
+        thread.join()
+        with open(self.path, encoding="utf-8") as hfile:
+            self.assertEqual(hfile.read().count("\n"), 2)
+
+    def test_interrupted(self):
+        """Test an archive interrupted before the manifest counts no task twice"""
+        expected = sorted(self.storage.all_records())
+        with mock.patch("archive.dump_manifest", side_effect=OSError("interrupted")):
+            with self.assertRaises(OSError):
+                archive_history(self.path, now=NOW)
+        self.assertEqual(load_manifest(self.path), [])
+        self.assertEqual(len(check_segments(self.path)), 2)
+        self.storage.rebuild()
+        self.assertEqual(check_segments(self.path), [])
+        self.assertEqual(
+            sorted(record[:2] + record[3:] for record in self.storage.all_records()),
+            [record[:2] + record[3:] for record in expected],
+        )
+
+    def test_check(self):
+        """Test a segment edited by hand is reported, and accounted again by rebuild"""
+        archive_history(self.path, now=NOW)
+        self.storage.rebuild()
+        with gzip.open(segment_path(self.path, "2022"), "at", encoding="utf-8") as sfile:
+            sfile.write("2022-12-01,task six,2022-12-01 09:00,2022-12-01 10:00\n")
+        self.assertEqual(len(self.storage.check()), 1)
+        self.storage.rebuild()
+        self.assertEqual(self.storage.check(), [])
+        self.assertEqual(load_manifest(self.path)[0].records, 4)
+
+    def test_sqlite_import(self):
+        """Test a new database imports the sealed segments too"""
+        expected = sorted(record[:2] + record[3:] for record in self.storage.all_records())
+        archive_history(self.path, now=NOW)
+        sqlite = SqliteStorage(os.path.join(self.test_dir.name, "letsdo-history.db"), self.path)
+        try:
+            # segments are imported first, the IDs follow the import order
+            records = sorted(record[:2] + record[3:] for record in sqlite.all_records())
+            self.assertEqual(records, expected)
+        finally:
+            sqlite.connection.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
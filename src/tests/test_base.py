@@ -2,9 +2,10 @@
 # -*- coding: utf-8 -*-
 """Tests for letsdo"""
 import os
+import glob
 import unittest
 from time import sleep
-from datetime import timedelta
+from datetime import datetime, timedelta
 
 from tasks import Task
 from configuration import (
@@ -17,6 +18,12 @@ from configuration import (
 from app import work_on
 from app import group_task_by
 from app import get_tasks
+from snapshot import snapshot_path
+from dayindex import index_path
+from tagindex import index_path as tag_index_path
+from completion import vocabulary_path
+from totals import journal_path, totals_path
+from archive import SEGMENT_SUFFIX, manifest_path
 
 
 class TestLetsdo(unittest.TestCase):
@@ -28,12 +35,24 @@ class TestLetsdo(unittest.TestCase):
         self.conf = get_configuration()
 
     def tearDown(self):
-        if os.path.exists(get_history_file_path()):
-            os.remove(get_history_file_path())
-        if os.path.exists(get_task_file_path()):
-            os.remove(get_task_file_path())
-        if os.path.exists(self.config_file):
-            os.remove(self.config_file)
+        history = get_history_file_path()
+        paths = [
+            history,
+            snapshot_path(history),
+            index_path(history),
+            tag_index_path(history),
+            vocabulary_path(history),
+            totals_path(history),
+            journal_path(history),
+            manifest_path(history),
+            get_task_file_path(),
+            self.config_file,
+        ]
+        # the sealed segments and their totals
+        paths += glob.glob(glob.escape(history) + ".*" + SEGMENT_SUFFIX + "*")
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
 
     def test_group_task_by(self):
         """Test group_task_by"""
@@ -53,6 +72,28 @@ class TestLetsdo(unittest.TestCase):
         self.assertEqual(real[1].name, "group 2")
         self.assertEqual(real[1].work_time, timedelta(minutes=1))
 
+    def test_get_tasks_since(self):
+        """Test get_tasks stops reading history at the lower bound"""
+        with open(get_history_file_path(), "w", encoding="utf-8") as fdata:
+            fdata.write("2022-06-03,old,2022-06-03 10:00,2022-06-03 11:00\n")
+            fdata.write("2022-06-05,new,2022-06-05 10:00,2022-06-05 11:00\n")
+            fdata.write("2022-06-06,newer,2022-06-06 10:00,2022-06-06 11:00\n")
+
+        tasks = get_tasks(since=datetime(2022, 6, 5))
+        self.assertEqual([task.name for task in tasks], ["newer", "new"])
+        self.assertEqual([task.tid for task in tasks], [1, 2])
+
+    def test_get_tasks_in_range(self):
+        """Test get_tasks reads only the requested days"""
+        with open(get_history_file_path(), "w", encoding="utf-8") as fdata:
+            fdata.write("2022-06-03,old,2022-06-03 10:00,2022-06-03 11:00\n")
+            fdata.write("2022-06-05,new,2022-06-05 10:00,2022-06-05 11:00\n")
+            fdata.write("2022-06-06,old,2022-06-06 10:00,2022-06-06 11:00\n")
+
+        tasks = get_tasks(since=datetime(2022, 6, 3), until=datetime(2022, 6, 6))
+        self.assertEqual([task.name for task in tasks], ["new", "old"])
+        self.assertEqual([task.tid for task in tasks], [2, 1])
+
     def test_continue_task_by_index(self):
         """test continue_task_by_index"""
         for i in range(3):
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vi: set ft=python :
+import colors
+from colors import Painter
+from log import REQUEST
+
+RED = {"open_color_tag": "<r>", "close_color_tag": "</r>"}
+BLUE = {"open_color_tag": "<b>", "close_color_tag": "</b>"}
+
+
+def test_paint_in_one_pass():
+    painter = Painter([(r"\+[\w\-_\.]+", RED), (r"\d+[dms]", BLUE)])
+    assert painter.paint("write +doc in 5m ") == "write <r>+doc</r> in <b>5m</b>"
+    # the tags added by a pattern are not painted again by the next ones
+    assert painter.paint("+d5m") == "<r>+d5m</r>"
+    assert painter.paint("nothing") == "nothing"
+
+
+def test_paint_cache():
+    painter = Painter([(r"\+[\w\-_\.]+", RED)])
+    assert painter.paint("+doc") is painter.paint("+doc")
+    assert list(painter.cache) == ["+doc"]
+
+
+def test_paint_request():
+    from raffaello import parse_string_request
+
+    painter = Painter(parse_string_request(REQUEST))
+    painted = painter.paint("05-06-2022 w23 +doc @home 12:30")
+    for word in ("05-06-2022", "w23", "+doc", "@home", "12:30"):
+        assert "%s\x1b[0m" % word in painted
+    # escape sequences are never painted again
+    assert "\x1b[0m\x1b[0m" not in painted
+
+
+def test_refresh_painter(monkeypatch):
+    monkeypatch.setattr(colors, "is_color_enabled", lambda: False)
+    colors.reset_painter()
+    assert colors.get_painter() is None
+    colors.refresh_painter()
+    assert colors.get_painter() is None
+    # the color setting changed
+    monkeypatch.setattr(colors, "is_color_enabled", lambda: True)
+    colors.refresh_painter()
+    assert isinstance(colors.get_painter(), Painter)
+    colors.reset_painter()
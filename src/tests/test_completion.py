@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+# vi: set ft=python :
+"""Unittest for completion module"""
+import os
+import sys
+import json
+import time
+import unittest
+import tempfile
+import subprocess
+from datetime import datetime, timedelta
+
+from completion import complete, is_fresh, read_vocabulary, vocabulary_path
+from storage import get_own_storage
+from vocabulary import load_vocabulary
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HISTORY = (
+    "2022-06-05,write +doc @home,2022-06-05 11:00,2022-06-05 12:00\n"
+    "2022-06-05,review +doc +code,2022-06-05 12:00,2022-06-05 12:30\n"
+    "2022-06-06,fix +code @office,2022-06-06 09:00,2022-06-06 10:00\n"
+)
+
+IMPORTS = """
+import sys, json
+sys.argv = ["lets", "__complete"] + sys.argv[1:]
+import cli
+try:
+    cli.main()
+finally:
+    sys.stderr.write(json.dumps(sorted(sys.modules)))
+"""
+
+HEAVY_MODULES = ("configuration", "yaml", "history", "docopt", "app", "tasks", "storage")
+
+# Completion budget in milliseconds over the interpreter startup, loose
+# enough for loaded machines, the imports are checked by test_imports
+BUDGET = 100
+
+
+class TestCompletion(unittest.TestCase):
+    """Test for the shell completion endpoint"""
+
+    def setUp(self):
+        self.home = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.home.name, ".letsdo.yaml"), "w") as cfile:
+            cfile.write("color: true\ndata_directory: %s\n" % self.home.name)
+        self.history = os.path.join(self.home.name, "letsdo-history")
+        with open(self.history, "w", encoding="utf-8") as hfile:
+            hfile.write(HISTORY)
+
+    def tearDown(self):
+        self.home.cleanup()
+
+    def test_complete_tags(self):
+        """Test tags and contexts are completed most recent first"""
+        self.assertEqual(complete("+", self.home.name), ["+code", "+doc"])
+        self.assertEqual(complete("@", self.home.name), ["@office", "@home"])
+        self.assertEqual(complete("+d", self.home.name), ["+doc"])
+        self.assertEqual(complete("@x", self.home.name), [])
+
+    def test_complete_names(self):
+        """Test words without a tag sign complete the recent task names"""
+        self.assertEqual(complete("r", self.home.name), ["review +doc +code"])
+        self.assertEqual(
+            complete("", self.home.name),
+            ["fix +code @office", "review +doc +code", "write +doc @home"],
+        )
+
+    def test_complete_after_append(self):
+        """Test the vocabulary follows the history"""
+        load_vocabulary(self.history)
+        self.assertTrue(os.path.exists(vocabulary_path(self.history)))
+        with open(self.history, "a", encoding="utf-8") as hfile:
+            hfile.write("2022-06-07,write +doc,2022-06-07 09:00,2022-06-07 10:00\n")
+        load_vocabulary(self.history)
+        self.assertEqual(complete("+", self.home.name), ["+doc", "+code"])
+        self.assertEqual(complete("w", self.home.name), ["write +doc", "write +doc @home"])
+
+    def test_complete_after_edit(self):
+        """Test the vocabulary is made again when the history was edited by hand"""
+        self.assertEqual(complete("w", self.home.name), ["write +doc @home"])
+        with open(self.history, "w", encoding="utf-8") as hfile:
+            hfile.write(HISTORY.replace("write +doc @home", "wrote +doc"))
+        self.assertEqual(complete("w", self.home.name), ["wrote +doc"])
+        self.assertEqual(complete("@", self.home.name), ["@office"])
+
+    def test_complete_sqlite(self):
+        """Test the tasks stored in SQLite are completed"""
+        with open(os.path.join(self.home.name, ".letsdo.yaml"), "a") as cfile:
+            cfile.write("storage: sqlite\n")
+        storage = get_own_storage(self.home.name)
+        self.assertEqual(complete("f", self.home.name), ["fix +code @office"])
+        storage.append("format +doc @lab", datetime(2022, 6, 8, 9), datetime(2022, 6, 8, 10))
+        # kept up to date by the append
+        header = read_vocabulary(vocabulary_path(self.history))[0]
+        self.assertTrue(is_fresh(header, self.history))
+        self.assertEqual(complete("f", self.home.name), ["format +doc @lab", "fix +code @office"])
+        self.assertEqual(complete("@", self.home.name), ["@lab", "@office", "@home"])
+        storage.connection.close()
+
+    def test_complete_without_history(self):
+        """Test there is nothing to complete without history"""
+        os.remove(self.history)
+        self.assertEqual(complete("+", self.home.name), [])
+
+    def complete_imports(self, word):
+        env = dict(os.environ, HOME=self.home.name, PYTHONPATH=SRC)
+        proc = subprocess.run(
+            [sys.executable, "-c", IMPORTS, word], env=env, capture_output=True, text=True
+        )
+        return proc.stdout.split(), json.loads(proc.stderr.splitlines()[-1])
+
+    def test_imports(self):
+        """Test completion from a fresh vocabulary does not load the heavy modules"""
+        # the first run loads the configuration and builds the vocabulary
+        output, _ = self.complete_imports("+d")
+        self.assertEqual(output, ["+doc"])
+
+        output, modules = self.complete_imports("+d")
+        self.assertEqual(output, ["+doc"])
+        for module in HEAVY_MODULES:
+            self.assertNotIn(module, modules)
+
+    def run_best(self, args, runs=5):
+        env = dict(os.environ, HOME=self.home.name, PYTHONPATH=SRC)
+        best = None
+        for _ in range(runs):
+            begin = time.perf_counter()
+            proc = subprocess.run(
+                [sys.executable] + args, env=env, capture_output=True, text=True
+            )
+            elapsed = (time.perf_counter() - begin) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        return best, proc.stdout
+
+    def test_latency(self):
+        """Test completion on ten years of history stays within budget"""
+        end_time = datetime(2012, 1, 1, 9, 0)
+        with open(self.history, "w", encoding="utf-8") as hfile:
+            for day in range(3650):
+                for task in range(4):
+                    end_time += timedelta(hours=1)
+                    name = "task %d +project%d @context%d" % (task, day % 50, task)
+                    hfile.write(
+                        "%s,%s,%s,%s\n"
+                        % (
+                            end_time.date(),
+                            name,
+                            (end_time - timedelta(minutes=30)).strftime("%Y-%m-%d %H:%M"),
+                            end_time.strftime("%Y-%m-%d %H:%M"),
+                        )
+                    )
+                end_time += timedelta(hours=20)
+
+        cli = os.path.join(SRC, "cli.py")
+        # the first run loads the configuration and builds the vocabulary
+        _, output = self.run_best([cli, "__complete", "+project4"], runs=1)
+        self.assertIn("+project49", output.split())
+
+        bare, _ = self.run_best(["-c", "pass"])
+        elapsed, output = self.run_best([cli, "__complete", "+project4"])
+        self.assertIn("+project49", output.split())
+        self.assertLess(elapsed - bare, BUDGET)
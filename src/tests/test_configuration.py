@@ -4,11 +4,14 @@
 import os
 import unittest
 import tempfile
+import configuration
 from configuration import (
     create_default_configuration,
     get_configuration,
     get_task_file_path,
+    get_history_sources,
     CONFIG_FILE_NAME,
+    HISTORY_FILE_NAME,
     TASK_FILE_NAME
 )
 
@@ -40,3 +43,47 @@ class TestConfiguration(unittest.TestCase):
     def test_create_default_configuration_if_does_not_exist(self):
         """ Test the creation of a default configuration file if it does not exist already """
         self.assertIsNotNone(get_configuration(self.test_dir.name))
+
+    def test_configuration_is_loaded_once(self):
+        """Test configuration is read from disk only when it changes"""
+        create_default_configuration(self.test_dir.name)
+        get_configuration(self.test_dir.name)
+        loads = configuration.LOAD_COUNT
+        for _ in range(10):
+            get_configuration(self.test_dir.name)
+            get_task_file_path(self.test_dir.name)
+        self.assertEqual(configuration.LOAD_COUNT, loads)
+
+        config_file = os.path.join(self.test_dir.name, CONFIG_FILE_NAME)
+        with open(config_file, "w", encoding="utf-8") as cfile:
+            cfile.write("color: false\ndata_directory: /tmp/letsdo-other\n")
+        self.assertEqual(
+            get_task_file_path(self.test_dir.name),
+            os.path.join("/tmp/letsdo-other", TASK_FILE_NAME),
+        )
+        self.assertEqual(configuration.LOAD_COUNT, loads + 1)
+
+    def test_history_sources(self):
+        """Test the histories listed in the configuration, the own one first"""
+        home = self.test_dir.name
+        laptop = os.path.join(home, "laptop")
+        os.mkdir(laptop)
+        with open(os.path.join(home, CONFIG_FILE_NAME), "w", encoding="utf-8") as cfile:
+            cfile.write(
+                "data_directory: %s\n"
+                "histories:\n"
+                "  - %s\n"
+                "  - {path: /shared/alice/letsdo-history.db, label: alice}\n"
+                "  - {path: %s, label: me}\n" % (home, laptop, home)
+            )
+        self.assertEqual(
+            get_history_sources(home),
+            [
+                ("me", os.path.join(home, HISTORY_FILE_NAME)),
+                ("laptop", os.path.join(laptop, HISTORY_FILE_NAME)),
+                ("alice", "/shared/alice/letsdo-history.db"),
+            ],
+        )
+
+        create_default_configuration(home)
+        self.assertEqual(get_history_sources(home), [(None, os.path.join(home, HISTORY_FILE_NAME))])
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+# vi: set ft=python :
+"""Tests for the daemon and its client"""
+import os
+import stat
+import sys
+import time
+import unittest
+import tempfile
+import subprocess
+
+from paths import daemon_socket_path
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs a command through the daemon, exits with 99 if lets had to run it
+CLIENT = """
+import sys
+from daemon import forward
+code = forward(sys.argv[1:])
+sys.exit(99 if code is None else code)
+"""
+
+
+class TestDaemon(unittest.TestCase):
+    """Test the commands are run by the daemon when it is running"""
+
+    def setUp(self):
+        self.home = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.home.name, ".letsdo.yaml"), "w") as cfile:
+            cfile.write("color: false\ndata_directory: %s\n" % self.home.name)
+        self.env = dict(os.environ, HOME=self.home.name, PYTHONPATH=SRC)
+        self.env.pop("LETSDO_NO_DAEMON", None)
+        self.env.pop("LETSDO_PROFILE", None)
+        self.socket = daemon_socket_path(self.home.name)
+
+    def tearDown(self):
+        self.home.cleanup()
+
+    def lets(self, *args):
+        return subprocess.run(
+            [sys.executable, os.path.join(SRC, "cli.py")] + list(args),
+            env=self.env,
+            capture_output=True,
+            text=True,
+            timeout=60,
+        )
+
+    def client(self, *args):
+        return subprocess.run(
+            [sys.executable, "-c", CLIENT] + list(args),
+            env=self.env,
+            capture_output=True,
+            text=True,
+            timeout=60,
+        )
+
+    def test_no_daemon(self):
+        """Test commands are run in process without daemon"""
+        self.assertEqual(self.client("see", "all").returncode, 99)
+        self.assertEqual(self.lets("see", "all").returncode, 0)
+
+    def test_serve(self):
+        """Test commands sent to the daemon, then stopping it"""
+        daemon = subprocess.Popen(
+            [sys.executable, os.path.join(SRC, "cli.py"), "daemon"],
+            env=self.env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            for _ in range(100):
+                if os.path.exists(self.socket):
+                    break
+                time.sleep(0.1)
+            self.assertTrue(os.path.exists(self.socket))
+            self.assertEqual(stat.S_IMODE(os.stat(self.socket).st_mode) & 0o077, 0)
+
+            self.assertEqual(self.client("do", "write", "+doc", "--time=9:00").returncode, 0)
+            proc = self.client("stop", "10:00")
+            self.assertEqual(proc.returncode, 0)
+            self.assertIn("stopped task: write +doc", proc.stdout)
+            proc = self.client("see", "all")
+            self.assertEqual(proc.returncode, 0)
+            self.assertIn("write +doc", proc.stdout)
+            self.assertNotIn("\x1b[", proc.stdout)
+            # configuration changes are seen by the next request
+            with open(os.path.join(self.home.name, ".letsdo.yaml"), "a") as cfile:
+                cfile.write("color: true\n")
+            self.assertIn("\x1b[", self.client("see", "all").stdout)
+            # usage errors come back as errors
+            self.assertEqual(self.client("see", "--unknown").returncode, 1)
+            # not forwarded
+            self.assertEqual(self.client("config").returncode, 99)
+
+            self.assertEqual(self.lets("daemon", "stop").returncode, 0)
+            self.assertEqual(daemon.wait(timeout=10), 0)
+            self.assertFalse(os.path.exists(self.socket))
+        finally:
+            if daemon.poll() is None:
+                daemon.kill()
+                daemon.wait()
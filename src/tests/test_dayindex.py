@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+# vi: set ft=python :
+"""Unittest for dayindex module"""
+import os
+import unittest
+import tempfile
+from datetime import datetime
+
+from dayindex import (
+    DayIndex,
+    load_day_index,
+    update_day_index,
+    index_path,
+    iter_range_records,
+)
+
+LINES = [
+    b"2022-06-05,task one,2022-06-05 11:00,2022-06-05 12:00\n",
+    b"2022-06-05,task two,2022-06-05 12:00,2022-06-05 12:30\n",
+    b"2022-06-07,task one,2022-06-07 09:00,2022-06-07 10:00\n",
+]
+
+
+class TestDayIndex(unittest.TestCase):
+    """Test for the history day index"""
+
+    def setUp(self):
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.history = os.path.join(self.test_dir.name, "letsdo-history")
+        with open(self.history, "wb") as hfile:
+            hfile.write(b"".join(LINES))
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def test_byte_range(self):
+        """Test days are mapped to their history bytes"""
+        index = load_day_index(self.history)
+        self.assertEqual(
+            index.byte_range(datetime(2022, 6, 5), datetime(2022, 6, 6)),
+            (0, len(LINES[0]) + len(LINES[1])),
+        )
+        self.assertEqual(
+            index.byte_range(datetime(2022, 6, 6), datetime(2022, 6, 8)),
+            (len(LINES[0]) + len(LINES[1]), len(b"".join(LINES))),
+        )
+        self.assertIsNone(index.byte_range(datetime(2022, 6, 8), datetime(2022, 7, 1)))
+
+    def test_reload(self):
+        """Test the index is saved and read back"""
+        first = load_day_index(self.history)
+        second = DayIndex.load(index_path(self.history))
+        self.assertEqual(first.days, second.days)
+        self.assertEqual(first.lasts, second.lasts)
+
+    def test_update(self):
+        """Test the index is extended on append and rebuilt on edit"""
+        update_day_index(self.history)
+        self.assertFalse(os.path.exists(index_path(self.history)))
+
+        load_day_index(self.history)
+        with open(self.history, "ab") as hfile:
+            hfile.write(b"2022-06-08,task two,2022-06-08 09:00,2022-06-08 10:00\n")
+        update_day_index(self.history)
+        index = DayIndex.load(index_path(self.history))
+        self.assertIn(datetime(2022, 6, 8).toordinal(), index.days)
+
+        with open(self.history, "wb") as hfile:
+            hfile.write(LINES[2])
+        index = load_day_index(self.history)
+        self.assertEqual(list(index.days), [datetime(2022, 6, 7).toordinal()])
+
+    def test_iter_range_records(self):
+        """Test records in range come with the task IDs of the whole history"""
+        records = list(
+            iter_range_records(self.history, datetime(2022, 6, 5), datetime(2022, 6, 6))
+        )
+        self.assertEqual([(r[0], r[2]) for r in records], [("task two", 2), ("task one", 1)])
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+# vi: set ft=python :
+"""Unittest for export module"""
+import os
+import io
+import sys
+import csv
+import json
+import unittest
+import tempfile
+import subprocess
+from datetime import datetime
+
+from export import write_csv, write_ics, write_ndjson
+from record import HistoryRecord
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HISTORY = (
+    "2022-06-05,task one @home,2022-06-05 11:00,2022-06-05 12:00\n"
+    "2022-06-05,task two +tag,2022-06-05 12:00,2022-06-05 12:30\n"
+    "2022-06-07,task one @home,2022-06-07 09:00,2022-06-07 09:30\n"
+)
+
+TASKS = [
+    HistoryRecord(
+        "write +doc, then +review @home",
+        datetime(2022, 6, 5, 11),
+        datetime(2022, 6, 5, 12, 30),
+        tid=1,
+        source="laptop",
+    ),
+    HistoryRecord("plain", datetime(2022, 6, 4, 9), datetime(2022, 6, 4, 9, 15), tid=2),
+]
+
+
+class TestExport(unittest.TestCase):
+    """Test the export formats and the lets export command"""
+
+    def setUp(self):
+        self.home = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.home.name, ".letsdo.yaml"), "w") as cfile:
+            cfile.write("color: false\ndata_directory: %s\n" % self.home.name)
+        with open(os.path.join(self.home.name, "letsdo-history"), "w") as hfile:
+            hfile.write(HISTORY)
+
+    def tearDown(self):
+        self.home.cleanup()
+
+    def lets(self, *args):
+        env = dict(os.environ, HOME=self.home.name, PYTHONPATH=SRC)
+        return subprocess.run(
+            [sys.executable, os.path.join(SRC, "cli.py"), "export"] + list(args),
+            env=env,
+            cwd=self.home.name,
+            capture_output=True,
+            text=True,
+        )
+
+    def test_csv(self):
+        """Test CSV rows are normalized"""
+        stream = io.StringIO()
+        self.assertEqual(write_csv(iter(TASKS), stream), 2)
+        rows = list(csv.DictReader(io.StringIO(stream.getvalue())))
+        self.assertEqual(
+            rows[0],
+            {
+                "id": "1",
+                "uid": TASKS[0].uid,
+                "date": "2022-06-05",
+                "name": "write +doc, then +review @home",
+                "start": "2022-06-05T11:00",
+                "end": "2022-06-05T12:30",
+                "seconds": "5400",
+                "tags": "+doc +review",
+                "context": "@home",
+                "source": "laptop",
+            },
+        )
+        self.assertEqual((rows[1]["tags"], rows[1]["context"], rows[1]["source"]), ("", "", ""))
+
+    def test_ndjson(self):
+        """Test one JSON object per record"""
+        stream = io.StringIO()
+        write_ndjson(iter(TASKS), stream)
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        row = json.loads(lines[1])
+        self.assertEqual((row["name"], row["seconds"], row["tags"]), ("plain", 900, []))
+        self.assertIsNone(row["source"])
+
+    def test_ics(self):
+        """Test records are calendar events, with escaped and folded lines"""
+        stream = io.StringIO()
+        long_task = HistoryRecord("é" * 50, datetime(2022, 6, 6, 9), datetime(2022, 6, 6, 10))
+        write_ics(iter(TASKS + [long_task]), stream, now=datetime(2022, 6, 8))
+        text = stream.getvalue()
+        self.assertTrue(text.startswith("BEGIN:VCALENDAR\r\n"))
+        self.assertTrue(text.endswith("END:VCALENDAR\r\n"))
+        self.assertEqual(text.count("BEGIN:VEVENT"), 3)
+        self.assertIn("SUMMARY:write +doc\\, then +review @home\r\n", text)
+        self.assertIn("DTSTART:20220605T110000\r\nDTEND:20220605T123000\r\n", text)
+        self.assertIn("CATEGORIES:+doc,+review,@home\r\n", text)
+        for line in text.split("\r\n"):
+            self.assertLessEqual(len(line.encode()), 75)
+        unfolded = text.replace("\r\n ", "")
+        self.assertIn("SUMMARY:" + "é" * 50 + "\r\n", unfolded)
+
+    def test_command(self):
+        """Test lets export takes the queries of lets see"""
+        proc = self.lets("all")
+        self.assertEqual(proc.returncode, 0)
+        self.assertEqual(len(proc.stdout.splitlines()), 4)
+
+        proc = self.lets("@home", "--summary", "--format=ndjson")
+        rows = [json.loads(line) for line in proc.stdout.splitlines()]
+        self.assertEqual(
+            [(row["name"], row["seconds"]) for row in rows], [("task one @home", 5400)]
+        )
+
+        proc = self.lets("2022-06-05", "--format=ics", "-o", "june.ics")
+        self.assertEqual(proc.returncode, 0)
+        self.assertIn("2 rows exported", proc.stderr)
+        with open(os.path.join(self.home.name, "june.ics"), newline="") as ifile:
+            self.assertEqual(ifile.read().count("BEGIN:VEVENT\r\n"), 2)
+
+        proc = self.lets("all", "--summary", "--format=ics")
+        self.assertEqual((proc.returncode, proc.stdout), (1, ""))
+
+    def test_broken_pipe(self):
+        """Test a reader quitting early is not an error"""
+        with open(os.path.join(self.home.name, "letsdo-history"), "a") as hfile:
+            hfile.write(HISTORY.splitlines(True)[0] * 5000)
+        env = dict(os.environ, HOME=self.home.name, PYTHONPATH=SRC)
+        proc = subprocess.Popen(
+            [sys.executable, os.path.join(SRC, "cli.py"), "export", "all", "--format=ics"],
+            env=env,
+            cwd=self.home.name,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        self.assertEqual(proc.stdout.readline(), b"BEGIN:VCALENDAR\r\n")
+        proc.stdout.close()
+        self.assertEqual(proc.wait(timeout=60), 0)
+        self.assertEqual(proc.stderr.read(), b"")
+        proc.stderr.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vi: set ft=python :
+from datetime import datetime
+from history import (
+    decode_line,
+    parse_time,
+    sanitize,
+    end_time_key,
+    read_lines_reversed,
+    iter_lines_reversed,
+    iter_records_reversed,
+)
+
+
+def test_parse_time():
+    assert datetime(2022, 4, 2, 10, 2) == parse_time("2022-04-02 10:02")
+    # not in the history layout, handled by str2datetime
+    assert datetime(2022, 4, 2, 10, 2) == parse_time("22/04/02 10:02")
+    assert datetime(2022, 4, 2, 10, 2) == parse_time(" 2022-04-02 10:02 ")
+    assert parse_time("") is None
+
+
+def test_decode_line():
+    assert ("write +doc", datetime(2022, 4, 2, 10, 2), datetime(2022, 4, 2, 11, 0)) == (
+        decode_line("2022-04-02,write +doc,2022-04-02 10:02,2022-04-02 11:00\n")
+    )
+
+
+def test_decode_legacy_line():
+    assert ("write", datetime(2017, 4, 2, 10, 2), datetime(2017, 4, 2, 11, 0)) == (
+        decode_line("2017-04-02,write,0:58,2017-04-02 10:02,2017-04-02 11:00\n")
+    )
+
+
+def test_decode_line_without_name():
+    assert decode_line("2022-04-02,,2022-04-02 10:02,2022-04-02 11:00\n") is None
+
+
+def test_sanitize():
+    assert "plain name" == sanitize("plain name")
+    assert " item" == sanitize("- item")
+    assert "task" == sanitize("2022-04-02 task")
+    assert "see link" == sanitize("see [link](http://example.com)")
+
+
+def test_read_lines_reversed(tmp_path):
+    path = tmp_path / "history"
+    lines = ["line %d with some text" % i for i in range(100)]
+    path.write_text("\n".join(lines) + "\n\n")
+    # tiny blocks to split lines across block boundaries
+    assert list(read_lines_reversed(str(path), block_size=7)) == lines[::-1]
+
+
+def test_iter_records_reversed(tmp_path):
+    path = tmp_path / "history"
+    path.write_text(
+        "2022-04-01,a,2022-04-01 10:00,2022-04-01 11:00\n"
+        "2022-04-02,b,2022-04-02 10:00,2022-04-02 11:00\n"
+        "2022-04-03,a,2022-04-03 10:00,2022-04-03 11:00\n"
+    )
+    records = list(iter_records_reversed(str(path)))
+    assert [(name, tid) for name, _, tid, _, _ in records] == [
+        ("a", 1),
+        ("b", 2),
+        ("a", 1),
+    ]
+
+
+def test_iter_lines_reversed():
+    data = b"first\n\nsecond line\nthird"
+    assert list(iter_lines_reversed(data)) == [(19, b"third"), (7, b"second line"), (0, b"first")]
+    assert list(iter_lines_reversed(data, 7, 19)) == [(7, b"second line")]
+    assert list(iter_lines_reversed(b"")) == []
+
+
+def test_end_time_key():
+    assert end_time_key(b"2022-04-01,a,2022-04-01 10:00,2022-04-01 11:00") == b"2022-04-01 11:00"
+    assert end_time_key(b"2017-04-02,a,0:58,2017-04-02 10:02,2017-04-02 11:00 ") == (
+        b"2017-04-02 11:00"
+    )
+    # decoded by str2datetime
+    assert end_time_key(b"2022-04-01,a,22/04/01 10:00,22/04/01 11:00") is None
+
+
+def test_iter_records_reversed_range(tmp_path):
+    path = tmp_path / "history"
+    path.write_text(
+        "2022-04-01,a,2022-04-01 10:00,2022-04-01 11:00\n"
+        "2022-04-02,b,2022-04-02 10:00,2022-04-02 11:00\n"
+        "2022-04-03,c,22/04/03 10:00,22/04/03 11:00\n"
+        "2022-04-04,d,2022-04-04 10:00,2022-04-04 11:00\n"
+    )
+    since, until = datetime(2022, 4, 2), datetime(2022, 4, 4)
+    records = list(iter_records_reversed(str(path), since, until))
+    # task IDs count the records out of the range too
+    assert [(name, tid) for name, _, tid, _, _ in records] == [("c", 2), ("b", 3)]
+    records = list(iter_records_reversed(str(path), until=until))
+    assert [name for name, _, _, _, _ in records] == ["c", "b", "a"]
+    records = list(iter_records_reversed(str(path), since, stop=datetime(2022, 4, 3)))
+    assert [name for name, _, _, _, _ in records] == ["d", "c"]
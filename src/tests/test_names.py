@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vi: set ft=python :
+from hashlib import sha256
+
+from history import decode_line
+from names import NAME_CACHE_SIZE, identify, parse_name, sanitize
+from tasks import Task
+
+
+def test_identity():
+    task_name = identify("write +doc +letsdo @home")
+    assert task_name.uid == sha256(b"write +doc +letsdo @home").hexdigest()
+    assert task_name.context == "@home"
+    assert task_name.tags == ["+doc", "+letsdo"]
+    assert task_name.labels == {"+doc", "+letsdo", "@home"}
+    plain = identify("plain @one @two")
+    assert (plain.context, plain.tags, plain.labels) == (None, None, {"@one", "@two"})
+
+
+def test_parse_name_sanitizes():
+    assert parse_name("- 2022-04-02 see [link](http://example.com) ").name == "see link"
+    assert parse_name("plain name").name == "plain name"
+    assert sanitize("* item") == " item"
+
+
+def test_names_are_shared():
+    first = decode_line("2022-06-05,write +doc,2022-06-05 11:00,2022-06-05 12:00\n")
+    second = decode_line("2022-06-06,write +doc,2022-06-06 11:00,2022-06-06 12:00\n")
+    assert first[0] is second[0]
+    assert parse_name("write +doc") is identify("write +doc")
+
+
+def test_cache_is_bounded():
+    for number in range(NAME_CACHE_SIZE + 10):
+        identify("task %d" % number)
+    info = identify.cache_info()
+    assert info.maxsize == NAME_CACHE_SIZE
+    assert info.currsize <= NAME_CACHE_SIZE
+    # dropped names are computed again
+    assert identify("task 0").uid == sha256(b"task 0").hexdigest()
+
+
+def test_task_tags_are_its_own():
+    task = Task("write +doc")
+    task.tags.append("+other")
+    assert identify("write +doc").tags == ["+doc"]
+    assert task.uid == identify("write +doc").uid
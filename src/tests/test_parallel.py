@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# vi: set ft=python :
+"""Unittest for parallel module"""
+import unittest
+
+from parallel import map_lines, split_lines
+from snapshot import Snapshot, _decode_part
+from totals import SECTIONS, Totals, _account_part
+
+HISTORY = b"".join(
+    b"2022-06-%02d,task %d +tag%d,2022-06-%02d 11:00,2022-06-%02d 12:00\n"
+    % (day, day % 7, day % 3, day, day)
+    for day in range(1, 29)
+)
+
+
+class TestParallel(unittest.TestCase):
+    """Test the parallel decoding of the history"""
+
+    def test_split_lines(self):
+        """Test parts end at line boundaries and cover the whole data"""
+        for parts in (1, 2, 3, 7, 100):
+            ranges = split_lines(HISTORY, parts)
+            self.assertLessEqual(len(ranges), parts)
+            self.assertEqual(b"".join(HISTORY[begin:end] for begin, end in ranges), HISTORY)
+            for begin, end in ranges[:-1]:
+                self.assertEqual(HISTORY[end - 1 : end], b"\n")
+        self.assertEqual(split_lines(b"no newline", 4), [(0, 10)])
+
+    def test_threshold(self):
+        """Test small histories are decoded in place"""
+        self.assertIsNone(map_lines(len, HISTORY, threshold=len(HISTORY) + 1, workers=4))
+        self.assertIsNone(map_lines(len, HISTORY, threshold=0, workers=4))
+        self.assertIsNone(map_lines(len, HISTORY, threshold=1, workers=1))
+
+    def test_merge(self):
+        """Test merged parts give the records and task IDs of a sequential decoding"""
+        expected = Snapshot()
+        expected.decode(HISTORY)
+
+        merged = Snapshot()
+        for begin, end in split_lines(HISTORY, 4):
+            merged.merge(*_decode_part(HISTORY[begin:end]))
+        self.assertEqual(merged.names, expected.names)
+        self.assertEqual(list(merged.records()), list(expected.records()))
+
+    def test_merge_totals(self):
+        """Test merged parts give the totals of a sequential accounting"""
+        expected = Totals()
+        expected.account(HISTORY)
+
+        merged = Totals()
+        for begin, end in split_lines(HISTORY, 4):
+            merged.merge(*_account_part(HISTORY[begin:end]))
+        self.assertEqual(
+            (merged.records, merged.uids, merged.names, merged.lasts),
+            (expected.records, expected.uids, expected.names, expected.lasts),
+        )
+        for kind, period in SECTIONS:
+            self.assertEqual(merged.section(kind, period), expected.section(kind, period))
+        self.assertEqual(list(merged.summarize()), list(expected.summarize()))
+
+    def test_pool(self):
+        """Test the parts decoded by the pool come back in order"""
+        data = HISTORY * 400
+        lengths = map_lines(len, data, threshold=1, workers=2)
+        self.assertEqual(len(lengths), 2)
+        self.assertEqual(sum(lengths), len(data))
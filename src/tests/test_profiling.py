@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+# vi: set ft=python :
+"""Tests for the per-phase profiling of the commands"""
+import os
+import sys
+import json
+import unittest
+import tempfile
+import subprocess
+
+import profiling
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HISTORY = (
+    "2022-06-05,write +doc @home,2022-06-05 11:00,2022-06-05 12:00\n"
+    "2022-06-05,review +doc +code,2022-06-05 12:00,2022-06-05 12:30\n"
+)
+
+
+class TestProfiling(unittest.TestCase):
+    """Test the LETSDO_PROFILE instrumentation"""
+
+    def setUp(self):
+        self.home = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.home.name, ".letsdo.yaml"), "w") as cfile:
+            cfile.write("color: true\ndata_directory: %s\n" % self.home.name)
+        with open(os.path.join(self.home.name, "letsdo-history"), "w") as hfile:
+            hfile.write(HISTORY)
+
+    def tearDown(self):
+        self.home.cleanup()
+
+    def run_lets(self, env, *args):
+        env = dict(os.environ, HOME=self.home.name, PYTHONPATH=SRC, **env)
+        return subprocess.run(
+            [sys.executable, os.path.join(SRC, "cli.py")] + list(args),
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+
+    def test_disabled(self):
+        """Test functions are left untouched when profiling is off"""
+        if profiling.ENABLED:
+            self.skipTest("LETSDO_PROFILE is set")
+
+        def function():
+            pass
+
+        self.assertIs(profiling.profiled("phase")(function), function)
+
+    def test_json_report(self):
+        """Test the phases of lets see are written as JSON"""
+        report_path = os.path.join(self.home.name, "profile.json")
+        proc = self.run_lets({"LETSDO_PROFILE": report_path}, "see", "all")
+        self.assertEqual(proc.returncode, 0, proc.stderr)
+
+        with open(report_path) as rfile:
+            report = json.load(rfile)
+        self.assertEqual(report["command"], ["see", "all"])
+        phases = {phase["name"]: phase for phase in report["phases"]}
+        for name in ("cli.main", "configuration", "do_report", "get_task_summary", "report_task"):
+            self.assertIn(name, phases)
+        self.assertEqual(phases["cli.main"]["depth"], 0)
+        self.assertEqual(phases["do_report"]["calls"], 1)
+        self.assertGreaterEqual(phases["cli.main"]["wall_ms"], phases["do_report"]["wall_ms"])
+
+    def test_text_report(self):
+        """Test the breakdown is printed on stderr"""
+        proc = self.run_lets({"LETSDO_PROFILE": "1"}, "see", "all")
+        self.assertIn("letsdo profile: see all", proc.stderr)
+        self.assertIn("report_task", proc.stderr)
+        self.assertNotIn("letsdo profile", proc.stdout)
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+# vi: set ft=python :
+"""Unittest for query module"""
+import unittest
+from datetime import datetime
+
+from query import compile_query, parse_period
+from record import HistoryRecord
+
+NOW = datetime(2026, 10, 17, 10, 30)
+
+
+class TestQuery(unittest.TestCase):
+    """Test the compilation of the report queries"""
+
+    def assertPeriod(self, term, since, until, title):
+        self.assertEqual(parse_period(term, NOW), (since, until, title))
+
+    def test_dates(self):
+        """Test years, months and days"""
+        self.assertPeriod("2019", datetime(2019, 1, 1), datetime(2020, 1, 1), "2019")
+        self.assertPeriod("2019-08", datetime(2019, 8, 1), datetime(2019, 9, 1), "2019-08")
+        self.assertPeriod("19-12", datetime(2019, 12, 1), datetime(2020, 1, 1), "2019-12")
+        self.assertPeriod("07-13", datetime(2026, 7, 13), datetime(2026, 7, 14), "2026-07-13")
+        self.assertPeriod(
+            "17/07/13", datetime(2017, 7, 13), datetime(2017, 7, 14), "2017-07-13"
+        )
+        self.assertIsNone(parse_period("2019-13", NOW))
+
+    def test_relative_periods(self):
+        """Test periods relative to now"""
+        self.assertPeriod("today", datetime(2026, 10, 17), datetime(2026, 10, 18), "2026-10-17")
+        self.assertPeriod(
+            "yesterday", datetime(2026, 10, 16), datetime(2026, 10, 17), "2026-10-16"
+        )
+        self.assertPeriod("this week", datetime(2026, 10, 12), datetime(2026, 10, 19), "week 42")
+        self.assertPeriod("last week", datetime(2026, 10, 5), datetime(2026, 10, 12), "week 41")
+        self.assertPeriod("last month", datetime(2026, 9, 1), datetime(2026, 10, 1), "2026-09")
+        self.assertPeriod("last year", datetime(2025, 1, 1), datetime(2026, 1, 1), "2025")
+        # the most recent month with that name
+        self.assertPeriod("December", datetime(2025, 12, 1), datetime(2026, 1, 1), "2025-12")
+        self.assertPeriod("last oct", datetime(2025, 10, 1), datetime(2025, 11, 1), "2025-10")
+
+    def test_ranges(self):
+        """Test explicit ranges, both ends included"""
+        query = compile_query("2024-01-01..2024-03-31", NOW)
+        self.assertEqual((query.since, query.until), (datetime(2024, 1, 1), datetime(2024, 4, 1)))
+        self.assertEqual((query.start, query.end), (1704067200, 1711929600))
+        self.assertEqual(query.title, "2024-01-01..2024-03-31")
+
+        query = compile_query("2024-02..", NOW)
+        self.assertEqual((query.since, query.until), (datetime(2024, 2, 1), None))
+        query = compile_query("..2023", NOW)
+        self.assertEqual((query.since, query.until), (None, datetime(2024, 1, 1)))
+
+        with self.assertRaises(ValueError):
+            compile_query("2024-03..2024-01", NOW)
+        with self.assertRaises(ValueError):
+            compile_query("2024..someday", NOW)
+
+    def test_predicates(self):
+        """Test tags and text along with a range"""
+        query = compile_query("+doc @home last week", NOW)
+        self.assertEqual(query.tags, [["+doc", "@home"]])
+        self.assertEqual(query.since, datetime(2026, 10, 5))
+        self.assertIsNone(query.condition)
+        self.assertTrue(query.matches("write +doc @home", datetime(2026, 10, 9, 12)))
+        self.assertFalse(query.matches("write +doc @home", datetime(2026, 10, 12)))
+        self.assertFalse(query.matches("write +doc", datetime(2026, 10, 9, 12)))
+
+        query = compile_query("write +doc", NOW)
+        self.assertEqual((query.tags, query.text), ([["+doc"]], "write"))
+        self.assertTrue(query.condition(HistoryRecord("write +doc", NOW, NOW)))
+        self.assertFalse(query.condition(HistoryRecord("review +doc", NOW, NOW)))
+
+        query = compile_query("+a or +b", NOW)
+        self.assertEqual((query.tags, query.text), ([["+a"], ["+b"]], None))
+
+        # bare signs are text, in their place
+        query = compile_query("doc + review", NOW)
+        self.assertEqual((query.tags, query.text), (None, "doc + review"))
+        self.assertTrue(query.condition(HistoryRecord("doc + review", NOW, NOW)))
+        query = compile_query("call @ home +work", NOW)
+        self.assertEqual((query.tags, query.text), ([["+work"]], "call @ home"))
+
+    def test_whole_history(self):
+        """Test an empty query selects everything"""
+        query = compile_query(None, NOW)
+        self.assertEqual((query.since, query.until, query.tags, query.text), (None,) * 4)
+        self.assertTrue(query.matches("anything", None))
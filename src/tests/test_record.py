@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vi: set ft=python :
+from datetime import datetime, timedelta
+
+import pytest
+
+from record import HistoryRecord
+from tasks import Task
+
+START = datetime(2022, 6, 5, 11, 0)
+END = datetime(2022, 6, 5, 12, 30)
+
+
+def test_derived_fields_match_task():
+    name = "write +doc +letsdo @home"
+    record = HistoryRecord(name, START, END, tid=3)
+    task = Task(name, START.strftime("%Y-%m-%d %H:%M"), END.strftime("%Y-%m-%d %H:%M"), tid=3)
+    for field in ("uid", "week_no", "last_end_date", "context", "tags", "work_time"):
+        assert getattr(record, field) == getattr(task, field)
+    assert repr(record) == repr(task)
+
+
+def test_derived_fields_without_tags_and_end():
+    record = HistoryRecord("plain", START, None)
+    assert record.context is None
+    assert record.tags is None
+    assert record.week_no is None
+    assert record.last_end_date is None
+    assert record.work_time == timedelta()
+
+
+def test_record_is_immutable():
+    record = HistoryRecord("plain", START, END)
+    with pytest.raises(AttributeError):
+        record.name = "other"
+    with pytest.raises(AttributeError):
+        record.work_time = timedelta()
+    with pytest.raises(AttributeError):
+        record.note = "no instance dictionary"
+
+
+def test_with_work_time():
+    record = HistoryRecord("plain +doc", START, END, tid=1, uid="abc")
+    assert record.tags == ["+doc"]
+    total = record.with_work_time(timedelta(hours=3))
+    assert total.work_time == timedelta(hours=3)
+    assert record.work_time == timedelta(hours=1, minutes=30)
+    assert (total.name, total.tid, total.uid, total.tags) == ("plain +doc", 1, "abc", ["+doc"])
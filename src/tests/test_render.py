@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vi: set ft=python :
+import io
+
+from terminaltables import AsciiTable
+
+import render
+from render import StreamingTable, visible_width
+
+HEADER = ["ID", "Last update", "Work time", "Description"]
+ROWS = [
+    [1, "05-06-2022 w22", " 1h 00m 66%", "write +doc @home"],
+    [12, "05-06-2022 w22", " 0h 30m 33%", "review +doc\n⤷ and +code"],
+]
+FOOTER = [2, "activities,", "total time:", " 1h 30m"]
+JUSTIFY = ["right", "center", "right", "left"]
+
+
+def test_same_output_as_terminaltables():
+    table = AsciiTable([HEADER] + ROWS + [FOOTER], " today ")
+    table.inner_column_border = False
+    table.inner_footing_row_border = True
+    for column, justify in enumerate(JUSTIFY):
+        table.justify_columns[column] = justify
+
+    stream = io.StringIO()
+    streaming = StreamingTable(HEADER, justify=JUSTIFY, title=" today ", ascii=True, stream=stream)
+    for row in ROWS:
+        streaming.add_row(row)
+    streaming.close(FOOTER)
+    assert stream.getvalue() == table.table + "\n"
+
+
+def test_rows_printed_after_first_window(monkeypatch):
+    monkeypatch.setattr(render, "WINDOW_SIZE", 2)
+    stream = io.StringIO()
+    table = StreamingTable(["name"], widths=[3], stream=stream)
+    table.add_row(["a"])
+    assert stream.getvalue() == ""
+    table.add_row(["abcd"])
+    # the window sets the width, the later rows are folded to it
+    table.add_row(["abcdefgh"])
+    lines = stream.getvalue().splitlines()
+    assert lines == [
+        "┌──────┐",
+        "│ name │",
+        "├──────┤",
+        "│ a    │",
+        "│ abcd │",
+        "│ abcd │",
+        "│ efgh │",
+    ]
+    table.close()
+    assert stream.getvalue().splitlines()[-1] == "└──────┘"
+
+
+def test_fold_colors():
+    red, reset = "\x1b[31m", "\x1b[0m"
+    lines = render._fold(red + "abcdef" + reset + "g", 4)
+    assert lines == [red + "abcd" + reset, red + "ef" + reset + "g"]
+    assert [visible_width(line) for line in lines] == [4, 3]
+    assert render._fold("漢字漢", 4) == ["漢字", "漢"]
+
+
+def test_visible_width():
+    assert visible_width("abc") == 3
+    assert visible_width("\x1b[38;5;11m12:30\x1b[0m") == 5
+    assert visible_width("⤷ 漢字") == 6
+
+
+def test_streamed_report_as_table(capsys):
+    from datetime import datetime, timedelta
+    from app import report_task
+    from tasks import Task
+
+    tasks = []
+    end_time = datetime(2022, 6, 5, 9, 0)
+    # more tasks than the first window, with short task IDs
+    for index in range(3 * render.WINDOW_SIZE):
+        end_time += timedelta(hours=1)
+        start_time = end_time - timedelta(minutes=30)
+        tasks.append(Task(
+            "task %d" % index,
+            start_time.strftime("%Y-%m-%d %H:%M"),
+            end_time.strftime("%Y-%m-%d %H:%M"),
+            tid=index % 9 + 1,
+        ))
+    report_task(tasks, "all", detailed=True, ascii=True, stream=False)
+    table = capsys.readouterr().out
+    report_task(tasks, "all", detailed=True, ascii=True, stream=True)
+    assert capsys.readouterr().out == table
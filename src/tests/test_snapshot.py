@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# vi: set ft=python :
+"""Unittest for snapshot module"""
+import os
+import unittest
+import tempfile
+from datetime import datetime
+
+from snapshot import load_snapshot, snapshot_path
+
+
+class TestSnapshot(unittest.TestCase):
+    """Test for the history binary snapshot"""
+
+    def setUp(self):
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.history = os.path.join(self.test_dir.name, "letsdo-history")
+        self.write(
+            "2022-06-05,task one,2022-06-05 11:00,2022-06-05 12:00\n"
+            "2022-06-05,task two +tag,2022-06-05 12:00,2022-06-05 12:30\n"
+        )
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def write(self, text, mode="w"):
+        with open(self.history, mode, encoding="utf-8") as hfile:
+            hfile.write(text)
+
+    def test_build(self):
+        """Test snapshot creation from the history"""
+        snap = load_snapshot(self.history)
+        self.assertTrue(os.path.exists(snapshot_path(self.history)))
+        records = list(snap.records())
+        self.assertEqual(len(records), 2)
+        name, _, tid, start, end = records[0]
+        self.assertEqual(name, "task two +tag")
+        self.assertEqual(tid, 1)
+        self.assertEqual(start, datetime(2022, 6, 5, 12, 0))
+        self.assertEqual(end, datetime(2022, 6, 5, 12, 30))
+
+    def test_reload(self):
+        """Test a valid snapshot is read back as is"""
+        first = list(load_snapshot(self.history).records())
+        second = list(load_snapshot(self.history).records())
+        self.assertEqual(first, second)
+
+    def test_append(self):
+        """Test appended lines extend the snapshot and update task IDs"""
+        load_snapshot(self.history)
+        self.write("2022-06-06,task one,2022-06-06 09:00,2022-06-06 10:00\n", "a")
+        records = list(load_snapshot(self.history).records())
+        self.assertEqual(len(records), 3)
+        self.assertEqual([r[0] for r in records], ["task one", "task two +tag", "task one"])
+        self.assertEqual([r[2] for r in records], [1, 2, 1])
+
+    def test_in_place_edit(self):
+        """Test an edited history rebuilds the snapshot"""
+        load_snapshot(self.history)
+        self.write(
+            "2022-06-05,task 1,2022-06-05 11:00,2022-06-05 12:00\n"
+            "2022-06-05,task two +tag,2022-06-05 12:00,2022-06-05 12:30\n"
+            "2022-06-06,task three,2022-06-06 09:00,2022-06-06 10:00\n"
+        )
+        records = list(load_snapshot(self.history).records())
+        self.assertEqual(
+            [r[0] for r in records], ["task three", "task two +tag", "task 1"]
+        )
+
+    def test_corrupted_snapshot(self):
+        """Test a corrupted snapshot is rebuilt"""
+        load_snapshot(self.history)
+        with open(snapshot_path(self.history), "wb") as sfile:
+            sfile.write(b"garbage")
+        self.assertEqual(len(load_snapshot(self.history)), 2)
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# vi: set ft=python :
+"""Tests for the modules imported by each command"""
+import os
+import sys
+import json
+import unittest
+import tempfile
+import subprocess
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = """
+import sys, json
+sys.argv = ["lets"] + json.loads(sys.argv[1])
+import cli
+try:
+    cli.main()
+finally:
+    sys.stderr.write(json.dumps(sorted(sys.modules)))
+"""
+
+HEAVY_MODULES = ("terminaltables", "parsedatetime", "raffaello", "app")
+
+
+class TestStartup(unittest.TestCase):
+    """Light commands must not pay for the reporting libraries"""
+
+    def setUp(self):
+        self.home = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.home.name, ".letsdo.yaml"), "w") as cfile:
+            cfile.write("color: true\ndata_directory: %s\n" % self.home.name)
+
+    def tearDown(self):
+        self.home.cleanup()
+
+    def imported_modules(self, *args):
+        env = dict(os.environ, HOME=self.home.name, PYTHONPATH=SRC)
+        proc = subprocess.run(
+            [sys.executable, "-c", SCRIPT, json.dumps(args)],
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        return json.loads(proc.stderr.splitlines()[-1])
+
+    def test_stop_imports(self):
+        """Test lets stop does not import the reporting libraries"""
+        modules = self.imported_modules("stop")
+        for module in HEAVY_MODULES:
+            self.assertNotIn(module, modules)
+
+    def test_cancel_imports(self):
+        """Test lets cancel does not import the reporting libraries"""
+        modules = self.imported_modules("cancel")
+        for module in HEAVY_MODULES:
+            self.assertNotIn(module, modules)
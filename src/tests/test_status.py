@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# vi: set ft=python :
+"""Unittest for status module"""
+import os
+import sys
+import json
+import unittest
+import tempfile
+import subprocess
+from datetime import datetime
+
+from status import read_running, render
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORTS = """
+import sys, json
+sys.argv = ["lets", "status"] + sys.argv[1:]
+import cli
+try:
+    cli.main()
+finally:
+    sys.stderr.write(json.dumps(sorted(sys.modules)))
+"""
+
+HEAVY_MODULES = ("configuration", "yaml", "history", "docopt", "app", "tasks")
+
+
+class TestStatus(unittest.TestCase):
+    """Test for the running task status endpoint"""
+
+    def setUp(self):
+        self.home = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.home.name, ".letsdo.yaml"), "w") as cfile:
+            cfile.write("color: true\ndata_directory: %s\n" % self.home.name)
+        self.task_file = os.path.join(self.home.name, "letsdo-task")
+
+    def tearDown(self):
+        self.home.cleanup()
+
+    def start(self, name, start):
+        with open(self.task_file, "w", encoding="utf-8") as tfile:
+            json.dump({"name": name, "start": start}, tfile)
+
+    def lets(self, *args):
+        env = dict(os.environ, HOME=self.home.name, PYTHONPATH=SRC)
+        return subprocess.run(
+            [sys.executable, os.path.join(SRC, "cli.py"), "status"] + list(args),
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+
+    def test_render(self):
+        """Test the plain, JSON and template formats"""
+        running = ("write +doc", datetime(2022, 6, 5, 11, 0))
+        now = datetime(2022, 6, 5, 12, 2, 3)
+        self.assertEqual(render(running, now=now), "Working on 'write +doc' for 1h 2m 3s")
+        self.assertEqual(
+            json.loads(render(running, "json", now)),
+            {
+                "running": True,
+                "name": "write +doc",
+                "start": "2022-06-05 11:00",
+                "elapsed": 3723,
+                "hours": 1,
+                "minutes": 2,
+                "seconds": 3,
+            },
+        )
+        self.assertEqual(render(running, "{name} {hours}:{minutes:02}", now), "write +doc 1:02")
+        self.assertEqual(render(None), "No task running")
+        self.assertEqual(json.loads(render(None, "json")), {"running": False})
+        self.assertEqual(render(None, "{name}"), "")
+
+    def test_read_running(self):
+        """Test the running task file is read back, as written by Task"""
+        self.assertIsNone(read_running(self.task_file))
+        self.start("write +doc", "2022-06-05 11:00:00.123456")
+        self.assertEqual(
+            read_running(self.task_file), ("write +doc", datetime(2022, 6, 5, 11, 0, 0, 123456))
+        )
+
+    def test_command(self):
+        """Test lets status exit codes and formats"""
+        proc = self.lets()
+        self.assertEqual((proc.returncode, proc.stdout), (1, "No task running\n"))
+        self.start("write +doc", str(datetime.now()))
+        proc = self.lets("--format", "{name}")
+        self.assertEqual((proc.returncode, proc.stdout), (0, "write +doc\n"))
+        proc = self.lets("--format={unknown}")
+        self.assertEqual(proc.returncode, 1)
+        self.assertIn("invalid status format", proc.stderr)
+
+    def test_imports(self):
+        """Test lets status reads neither the configuration nor the history"""
+        self.start("write +doc", str(datetime.now()))
+        # the first run loads the configuration and caches the data directory
+        self.lets()
+        env = dict(os.environ, HOME=self.home.name, PYTHONPATH=SRC)
+        proc = subprocess.run(
+            [sys.executable, "-c", IMPORTS, "--format=json"],
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        modules = json.loads(proc.stderr.splitlines()[-1])
+        for module in HEAVY_MODULES:
+            self.assertNotIn(module, modules)
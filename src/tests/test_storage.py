@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+# vi: set ft=python :
+"""Unittest for storage module"""
+import io
+import os
+import unittest
+import tempfile
+from datetime import datetime
+
+from archive import archive_history
+from storage import CsvStorage, MergedStorage, SqliteStorage
+
+HISTORY = (
+    "2022-06-05,task one @home,2022-06-05 11:00,2022-06-05 12:00\n"
+    "2022-06-05,task two +tag,2022-06-05 12:00,2022-06-05 12:30\n"
+    "2022-06-07,task one @home,0:30,2022-06-07 09:00,2022-06-07 09:30\n"
+)
+
+
+class TestStorage(unittest.TestCase):
+    """Test the history storage backends give the same results"""
+
+    def setUp(self):
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.csv_path = os.path.join(self.test_dir.name, "letsdo-history")
+        with open(self.csv_path, "w", encoding="utf-8") as hfile:
+            hfile.write(HISTORY)
+        self.csv = CsvStorage(self.csv_path)
+        self.sqlite = SqliteStorage(
+            os.path.join(self.test_dir.name, "letsdo-history.db"), self.csv_path
+        )
+
+    def tearDown(self):
+        self.sqlite.connection.close()
+        self.test_dir.cleanup()
+
+    def test_import(self):
+        """Test the CSV history is imported in a new database"""
+        self.assertEqual(list(self.sqlite.all_records()), list(self.csv.all_records()))
+
+    def test_range(self):
+        """Test range queries"""
+        since, until = datetime(2022, 6, 5), datetime(2022, 6, 6)
+        self.assertEqual(
+            list(self.sqlite.iter_records(since, until)),
+            list(self.csv.iter_records(since, until)),
+        )
+        self.assertEqual(
+            list(self.sqlite.iter_records(since)), list(self.csv.iter_records(since))
+        )
+
+    def test_append(self):
+        """Test appended tasks are found by both backends"""
+        start, end = datetime(2022, 6, 8, 9), datetime(2022, 6, 8, 10)
+        self.csv.append("task two +tag", start, end, "2022-06-08")
+        self.sqlite.append("task two +tag", start, end, "2022-06-08")
+        self.assertEqual(list(self.sqlite.all_records()), list(self.csv.all_records()))
+
+    def test_open_range(self):
+        """Test a line appended out of order does not hide the older ones"""
+        with open(self.csv_path, "w", encoding="utf-8") as hfile:
+            hfile.write(
+                "2026-10-10,a,2026-10-10 09:00,2026-10-10 10:00\n"
+                "2026-10-12,b,2026-10-12 09:00,2026-10-12 10:00\n"
+                "2026-09-20,late,2026-09-20 09:00,2026-09-20 10:00\n"
+                "2026-10-15,c,2026-10-15 09:00,2026-10-15 10:00\n"
+            )
+        since = datetime(2026, 10, 5)
+        records = list(self.csv.iter_records(since))
+        self.assertEqual([record[0] for record in records], ["c", "b", "a"])
+        self.assertEqual(records, list(self.csv.iter_records(since, datetime(2026, 11, 1))))
+
+    def test_aggregate(self):
+        """Test the aggregate query"""
+        rows = list(self.sqlite.aggregate(datetime(2022, 6, 1), datetime(2022, 7, 1)))
+        self.assertEqual([(row[0], row[2], row[5]) for row in rows], [
+            ("task one @home", 1, 5400),
+            ("task two +tag", 2, 1800),
+        ])
+        # start and end time of the most recent occurrence
+        self.assertEqual(rows[0][4], datetime(2022, 6, 7, 9, 30))
+
+    def test_export(self):
+        """Test the export to CSV"""
+        stream = io.StringIO()
+        self.assertEqual(self.sqlite.export_csv(stream), 3)
+        with open(self.csv_path, "w", encoding="utf-8") as hfile:
+            hfile.write(stream.getvalue())
+        self.assertEqual(list(self.sqlite.all_records()), list(self.csv.all_records()))
+
+    def test_tags(self):
+        """Test tag queries"""
+        for alternatives in ([["@home"]], [["+tag"], ["@home"]], [["+tag", "@home"]]):
+            self.assertEqual(
+                list(self.sqlite.iter_tagged_records(alternatives)),
+                list(self.csv.iter_tagged_records(alternatives)),
+            )
+        since, until = datetime(2022, 6, 6), datetime(2022, 6, 8)
+        self.assertEqual(
+            list(self.sqlite.iter_tagged_records([["@home"]], since, until)),
+            list(self.csv.iter_tagged_records([["@home"]], since, until)),
+        )
+        self.assertEqual(
+            list(self.sqlite.iter_records(until=until)), list(self.csv.iter_records(until=until))
+        )
+
+    def test_aggregate_parity(self):
+        """Test both backends give the same summaries"""
+        since, until = datetime(2022, 6, 1), datetime(2022, 7, 1)
+        for options in ({}, {"tags": [["@home"]]}, {"by_day": True}):
+            self.assertEqual(
+                list(self.sqlite.aggregate(since, until, **options)),
+                list(self.csv.aggregate(since, until, **options)),
+            )
+
+
+LAPTOP_HISTORY = (
+    "2022-06-05,task two +tag,2022-06-05 08:00,2022-06-05 08:30\n"
+    "2022-06-06,task three,2022-06-06 10:00,2022-06-06 11:00\n"
+)
+
+
+class TestMergedStorage(unittest.TestCase):
+    """Test several histories are read as one"""
+
+    def setUp(self):
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.paths = []
+        for name, history in (("me", HISTORY), ("laptop", LAPTOP_HISTORY)):
+            path = os.path.join(self.test_dir.name, name)
+            with open(path, "w", encoding="utf-8") as hfile:
+                hfile.write(history)
+            self.paths.append(path)
+        self.merged = MergedStorage(CsvStorage(self.paths[0]), [("laptop", self.paths[1])])
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def test_merge(self):
+        """Test records are merged by end time, newest first, with their source"""
+        records = list(self.merged.iter_records())
+        self.assertEqual(
+            [(record[0], record[4], record[5]) for record in records],
+            [
+                ("task one @home", datetime(2022, 6, 7, 9, 30), None),
+                ("task three", datetime(2022, 6, 6, 11), "laptop"),
+                ("task two +tag", datetime(2022, 6, 5, 12, 30), None),
+                ("task one @home", datetime(2022, 6, 5, 12), None),
+                ("task two +tag", datetime(2022, 6, 5, 8, 30), "laptop"),
+            ],
+        )
+        self.assertEqual(list(self.merged.all_records()), records)
+        # the most recent task of each history first, shared by name
+        self.assertEqual([record[2] for record in records], [1, 2, 3, 1, 3])
+
+    def test_range_and_tags(self):
+        """Test range and tag queries go through each history"""
+        since, until = datetime(2022, 6, 5), datetime(2022, 6, 6)
+        records = list(self.merged.iter_records(since, until))
+        self.assertEqual([record[5] for record in records], [None, None, "laptop"])
+        records = list(self.merged.iter_tagged_records([["+tag"]]))
+        self.assertEqual([record[4].hour for record in records], [12, 8])
+
+    def test_aggregate(self):
+        """Test summaries are made by each history"""
+        rows = list(self.merged.aggregate(datetime(2022, 6, 1), datetime(2022, 7, 1)))
+        self.assertEqual(
+            [(row[0], row[5], row[6]) for row in rows],
+            [
+                ("task one @home", 5400, None),
+                ("task three", 3600, "laptop"),
+                ("task two +tag", 1800, None),
+                ("task two +tag", 1800, "laptop"),
+            ],
+        )
+
+    def test_append(self):
+        """Test tasks appended to the own history are merged, the others are read only"""
+        self.merged.own.append(
+            "task four", datetime(2022, 6, 8, 9), datetime(2022, 6, 8, 10), "2022-06-08"
+        )
+        self.assertFalse(hasattr(self.merged, "append"))
+        record = next(self.merged.iter_records())
+        self.assertEqual((record[0], record[5]), ("task four", None))
+
+    def test_unreachable(self):
+        """Test histories which cannot be read are skipped with a warning"""
+        missing_db = os.path.join(self.test_dir.name, "letsdo-history.db")
+        merged = MergedStorage(
+            CsvStorage(self.paths[0]),
+            [
+                ("gone", os.path.join(self.test_dir.name, "gone", "letsdo-history")),
+                ("db", missing_db),
+                ("laptop", self.paths[1]),
+            ],
+        )
+        with self.assertLogs("log", "WARNING") as logs:
+            records = list(merged.iter_records())
+        self.assertEqual(len(logs.output), 2)
+        self.assertEqual(records, list(self.merged.iter_records()))
+        # read only, not created
+        self.assertFalse(os.path.exists(missing_db))
+        self.assertEqual(
+            list(merged.aggregate(datetime(2022, 6, 1), datetime(2022, 7, 1))),
+            list(self.merged.aggregate(datetime(2022, 6, 1), datetime(2022, 7, 1))),
+        )
+
+    def test_read_only(self):
+        """Test the caches of another history are made in memory, never written"""
+        other_dir = os.path.join(self.test_dir.name, "other")
+        os.mkdir(other_dir)
+        path = os.path.join(other_dir, "letsdo-history")
+        with open(path, "w", encoding="utf-8") as hfile:
+            hfile.write("2021-03-01,task old +tag,2021-03-01 10:00,2021-03-01 11:00\n")
+            hfile.write(LAPTOP_HISTORY)
+            # appended out of order
+            hfile.write("2022-06-04,task late,2022-06-04 10:00,2022-06-04 11:00\n")
+        archive_history(path)
+        for name in os.listdir(other_dir):
+            if name.endswith(".totals"):
+                os.remove(os.path.join(other_dir, name))
+        files = {}
+        for name in os.listdir(other_dir):
+            with open(os.path.join(other_dir, name), "rb") as ofile:
+                files[name] = ofile.read()
+
+        merged = MergedStorage(CsvStorage(self.paths[0]), [("laptop", path)])
+        records = list(merged.all_records())
+        self.assertEqual(len(records), 7)
+        self.assertEqual(records, list(merged.iter_records()))
+        end_times = [record[4] for record in records]
+        self.assertEqual(end_times, sorted(end_times, reverse=True))
+        self.assertEqual(
+            [record[0] for record in merged.iter_records(datetime(2022, 6, 1))][-2:],
+            ["task two +tag", "task late"],
+        )
+        list(merged.iter_tagged_records([["+tag"]]))
+        rows = list(merged.aggregate(datetime(2021, 1, 1), datetime(2023, 1, 1)))
+        self.assertEqual(len(rows), 6)
+        merged.check()
+
+        unchanged = {}
+        for name in os.listdir(other_dir):
+            with open(os.path.join(other_dir, name), "rb") as ofile:
+                unchanged[name] = ofile.read()
+        self.assertEqual(unchanged, files)
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# vi: set ft=python :
+"""Unittest for tagindex module"""
+import os
+import unittest
+import tempfile
+
+from tagindex import (
+    TagIndex,
+    index_path,
+    iter_tagged_records,
+    load_tag_index,
+    parse_tag_query,
+    update_tag_index,
+)
+
+HISTORY = (
+    "2022-06-05,write +doc @home,2022-06-05 11:00,2022-06-05 12:00\n"
+    "2022-06-05,review +doc +code,2022-06-05 12:00,2022-06-05 12:30\n"
+    "2022-06-06,fix +code @office,2022-06-06 09:00,2022-06-06 10:00\n"
+)
+
+
+class TestTagIndex(unittest.TestCase):
+    """Test for the inverted index of tags and contexts"""
+
+    def setUp(self):
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.history = os.path.join(self.test_dir.name, "letsdo-history")
+        with open(self.history, "w", encoding="utf-8") as hfile:
+            hfile.write(HISTORY)
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def names(self, query):
+        alternatives = parse_tag_query(query)
+        return [record[0] for record in iter_tagged_records(self.history, alternatives)]
+
+    def test_parse_tag_query(self):
+        """Test tag query parsing"""
+        self.assertEqual(parse_tag_query("+a"), [["+a"]])
+        self.assertEqual(parse_tag_query("+a @b or +c"), [["+a", "@b"], ["+c"]])
+        self.assertEqual(parse_tag_query("+a | +c"), [["+a"], ["+c"]])
+        self.assertIsNone(parse_tag_query("+a something"))
+        self.assertIsNone(parse_tag_query("+a or"))
+        self.assertIsNone(parse_tag_query(None))
+
+    def test_queries(self):
+        """Test single tag, AND and OR queries"""
+        self.assertEqual(self.names("+doc"), ["review +doc +code", "write +doc @home"])
+        self.assertEqual(self.names("+doc +code"), ["review +doc +code"])
+        self.assertEqual(self.names("@home or @office"), ["fix +code @office", "write +doc @home"])
+        self.assertEqual(self.names("+missing"), [])
+
+    def test_task_ids(self):
+        """Test records come with the task IDs of the whole history"""
+        records = iter_tagged_records(self.history, [["@home"]])
+        self.assertEqual([record[2] for record in records], [3])
+
+    def test_update(self):
+        """Test the index is extended when the history grows"""
+        load_tag_index(self.history)
+        with open(self.history, "a", encoding="utf-8") as hfile:
+            hfile.write("2022-06-07,plan @home,2022-06-07 09:00,2022-06-07 10:00\n")
+        update_tag_index(self.history)
+        index = TagIndex.load(index_path(self.history))
+        self.assertEqual(len(index.postings["@home"]), 2)
+        self.assertEqual(self.names("@home"), ["plan @home", "write +doc @home"])
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# vi: set ft=python :
+"""Unittest for totals module"""
+import os
+import unittest
+import tempfile
+from datetime import datetime
+
+from storage import CsvStorage
+from totals import (
+    DAY,
+    MONTH,
+    WEEK,
+    check_totals,
+    journal_path,
+    load_totals,
+    rebuild_totals,
+    split_range,
+    totals_path,
+)
+
+HISTORY = (
+    "2022-05-31,write +doc @home,2022-05-31 11:00,2022-05-31 12:00\n"
+    "2022-06-05,review +doc +code,2022-06-05 12:00,2022-06-05 12:30\n"
+    "2022-06-06,fix +code @office,2022-06-06 09:00,2022-06-06 10:00\n"
+    "2022-06-06,write +doc @home,2022-06-06 10:00,2022-06-06 10:15\n"
+)
+
+
+class TestTotals(unittest.TestCase):
+    """Test for the day, week and month totals"""
+
+    def setUp(self):
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.history = os.path.join(self.test_dir.name, "letsdo-history")
+        with open(self.history, "w", encoding="utf-8") as hfile:
+            hfile.write(HISTORY)
+
+    def tearDown(self):
+        self.test_dir.cleanup()
+
+    def summary(self, *args, **kwargs):
+        return [
+            (name, tid, seconds)
+            for name, _, tid, _, _, seconds in load_totals(self.history).summarize(*args, **kwargs)
+        ]
+
+    def test_split_range(self):
+        """Test ranges are covered by the fewest buckets"""
+        self.assertEqual(
+            split_range(datetime(2022, 5, 31), datetime(2022, 7, 12)),
+            [(DAY, 738306), (MONTH, 202206), (DAY, 738337), (DAY, 738338), (DAY, 738339),
+             (WEEK, 202227), (DAY, 738347)],
+        )
+        with self.assertRaises(ValueError):
+            split_range(datetime(2022, 6, 1, 12), datetime(2022, 7, 1))
+
+    def test_summarize(self):
+        """Test summaries in a range, whole history included"""
+        self.assertEqual(
+            self.summary(datetime(2022, 6, 1), datetime(2022, 7, 1)),
+            [("write +doc @home", 1, 900), ("fix +code @office", 2, 3600),
+             ("review +doc +code", 3, 1800)],
+        )
+        self.assertEqual(
+            self.summary(),
+            [("write +doc @home", 1, 4500), ("fix +code @office", 2, 3600),
+             ("review +doc +code", 3, 1800)],
+        )
+        self.assertEqual(
+            self.summary(tags=[["+doc"]]),
+            [("write +doc @home", 1, 4500), ("review +doc +code", 3, 1800)],
+        )
+        with self.assertRaises(ValueError):
+            load_totals(self.history).summarize(datetime(2022, 6, 1, 8), datetime(2022, 7, 1))
+
+    def test_by_day(self):
+        """Test day by day summaries, oldest day first"""
+        self.assertEqual(
+            self.summary(datetime(2022, 6, 5), datetime(2022, 6, 7), by_day=True),
+            [("review +doc +code", 3, 1800), ("write +doc @home", 1, 900),
+             ("fix +code @office", 2, 3600)],
+        )
+
+    def test_tag_totals(self):
+        """Test the totals of tags and contexts"""
+        totals = load_totals(self.history).tag_totals(datetime(2022, 6, 1), datetime(2022, 7, 1))
+        self.assertEqual(totals, {"+doc": 2700, "+code": 5400, "@office": 3600, "@home": 900})
+
+    def test_journal(self):
+        """Test stopped tasks go through the journal, merged at the next load"""
+        load_totals(self.history)
+        CsvStorage(self.history).append(
+            "fix +code @office", datetime(2022, 6, 7, 9), datetime(2022, 6, 7, 9, 30), "2022-06-07"
+        )
+        self.assertTrue(os.path.exists(journal_path(self.history)))
+        self.assertEqual(
+            self.summary(datetime(2022, 6, 6), datetime(2022, 6, 8)),
+            [("fix +code @office", 1, 5400), ("write +doc @home", 2, 900)],
+        )
+        self.assertFalse(os.path.exists(journal_path(self.history)))
+        self.assertEqual(check_totals(self.history), [])
+
+    def test_check_and_rebuild(self):
+        """Test hand edits of the totals are found and repaired"""
+        load_totals(self.history)
+        self.assertEqual(check_totals(self.history), [])
+
+        totals = load_totals(self.history)
+        totals.section("tasks", DAY)[738312][0][0] += 60
+        totals.dump(totals_path(self.history))
+        self.assertEqual(check_totals(self.history), ["task totals differ for day 738312"])
+
+        rebuild_totals(self.history)
+        self.assertEqual(check_totals(self.history), [])
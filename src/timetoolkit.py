@@ -1,7 +1,6 @@
 from datetime import datetime
 import re
 from string import Formatter
-import parsedatetime as pdt
 
 
 def strfdelta(tdelta, fmt="{H:2}h {M:02}m", inputtype="timedelta"):
@@ -122,6 +121,9 @@ def str2datetime(string):
             today_str = datetime.today().strftime("%Y-%m-%d")
             return datetime.strptime(today_str + " " + string, out_fmt)
 
+    # parsedatetime is slow to import, it is needed for natural language only
+    import parsedatetime as pdt
+
     cal = pdt.Calendar()
     res, ok = cal.parseDT(string, datetime.now())
     if ok:
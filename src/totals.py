@@ -0,0 +1,490 @@
+"""
+This module keeps the work time totals of each task and tag by day, ISO
+week and month, so that summary reports do not read the history records.
+
+Like the other caches next to the history, the totals are extended when the
+history grows and rebuilt when it is edited by hand. On top of that, each
+task stopped is recorded in a journal next to the totals in constant time,
+the journal is merged in the totals when they are loaded.
+"""
+import marshal
+import os
+import struct
+from datetime import datetime, timedelta
+
+from history import decode_line, from_epoch, is_read_only, load_cache, region_crcs, to_epoch
+from log import LOGGER
+from names import identify
+from parallel import map_lines
+from tagindex import find_tags
+
+
+TOTALS_SUFFIX = ".totals"
+JOURNAL_SUFFIX = ".log"
+
+MAGIC = b"LDTOTALS"
+VERSION = 1
+
+DAY, WEEK, MONTH = "day", "week", "month"
+TASKS, TAGS = "tasks", "tags"
+SECTIONS = [(kind, period) for kind in (TASKS, TAGS) for period in (DAY, WEEK, MONTH)]
+
+# magic, version, marshal version, history size, history mtime, head crc,
+# tail crc, size of the task names and of each section
+HEADER = struct.Struct("<8sHHqqII7I")
+
+# Item fields of the per task buckets
+SECONDS, COUNT, LAST_SEQ, LAST_START, LAST_END = range(5)
+
+
+def totals_path(history_path):
+    """Return the totals file path of the given history"""
+    return history_path + TOTALS_SUFFIX
+
+
+def journal_path(history_path):
+    """Return the journal file path of the totals of the given history"""
+    return totals_path(history_path) + JOURNAL_SUFFIX
+
+
+def period_keys(end_time):
+    """Return the day, ISO week and month keys of a task end time"""
+    year, week, _ = end_time.isocalendar()
+    return (
+        (DAY, end_time.toordinal()),
+        (WEEK, year * 100 + week),
+        (MONTH, end_time.year * 100 + end_time.month),
+    )
+
+
+def split_range(since, until):
+    """Return the fewest (period, key) buckets covering [since, until)
+
+    Both bounds must be midnights, raises ValueError otherwise.
+    """
+    for bound in (since, until):
+        if bound.time() != datetime.min.time():
+            raise ValueError("%s is not a day boundary" % bound)
+
+    buckets = []
+    day = since
+    while day < until:
+        next_month = (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+        if day.day == 1 and next_month <= until:
+            buckets.append((MONTH, day.year * 100 + day.month))
+            day = next_month
+        elif day.weekday() == 0 and day + timedelta(days=7) <= until:
+            year, week, _ = day.isocalendar()
+            buckets.append((WEEK, year * 100 + week))
+            day += timedelta(days=7)
+        else:
+            buckets.append((DAY, day.toordinal()))
+            day += timedelta(days=1)
+    return buckets
+
+
+def _matches(name, alternatives):
+    tags = find_tags(name)
+    return any(all(tag in tags for tag in alternative) for alternative in alternatives)
+
+
+class Totals(object):
+    """Work time totals by period, for each task and each tag
+
+    The totals of each period are read from the file only when used.
+    """
+
+    def __init__(self):
+        self.size = 0
+        self.mtime_ns = 0
+        self.head_crc = 0
+        self.tail_crc = 0
+        # records seen, the sequence number of the next one
+        self.records = 0
+        # task uid, name and sequence number of its last record, by task index
+        self.uids = []
+        self.names = []
+        self.lasts = []
+        self.index = {}
+        # (TASKS, period) -> key -> task index -> [seconds, count, last seq, last start, last end]
+        # (TAGS, period) -> key -> tag -> [seconds, count]
+        self.sections = {}
+        # sections as read from the file, not decoded yet
+        self.blobs = {}
+        self.journal_entries = 0
+
+    def section(self, kind, period):
+        """Return the totals of a kind (TASKS or TAGS) in a period"""
+        section = self.sections.get((kind, period))
+        if section is None:
+            blob = self.blobs.pop((kind, period), None)
+            try:
+                section = marshal.loads(blob) if blob else {}
+            except (EOFError, TypeError) as error:
+                raise ValueError("unreadable totals: %s" % error)
+            self.sections[(kind, period)] = section
+        return section
+
+    def add(self, name, start_time, end_time):
+        """Account a history record"""
+        seq = self.records
+        self.records += 1
+        uid = identify(name).uid
+        index = self.index.get(uid)
+        if index is None:
+            index = self.index[uid] = len(self.uids)
+            self.uids.append(uid)
+            self.names.append(name)
+            self.lasts.append(seq)
+        else:
+            self.lasts[index] = seq
+        if not end_time or not start_time:
+            return
+
+        seconds = (end_time - start_time) // timedelta(seconds=1)
+        start, end = to_epoch(start_time), to_epoch(end_time)
+        tags = find_tags(name)
+        for period, key in period_keys(end_time):
+            items = self.section(TASKS, period).setdefault(key, {})
+            item = items.get(index)
+            if item is None:
+                items[index] = [seconds, 1, seq, start, end]
+            else:
+                item[SECONDS] += seconds
+                item[COUNT] += 1
+                item[LAST_SEQ], item[LAST_START], item[LAST_END] = seq, start, end
+            if tags:
+                tag_items = self.section(TAGS, period).setdefault(key, {})
+                for tag in tags:
+                    tag_item = tag_items.get(tag)
+                    if tag_item is None:
+                        tag_items[tag] = [seconds, 1]
+                    else:
+                        tag_item[0] += seconds
+                        tag_item[1] += 1
+
+    def extend(self, data, offset):
+        """Account the history bytes in data
+
+        Large histories are accounted by parts in parallel, see parallel.map_lines.
+        """
+        parts = map_lines(_account_part, data)
+        if parts is None:
+            self.account(data)
+        else:
+            for part in parts:
+                self.merge(*part)
+
+    def account(self, data):
+        """Account the records in the given history bytes"""
+        for line in data.split(b"\n"):
+            if not line.strip():
+                continue
+            record = decode_line(line.decode("utf-8", errors="replace"))
+            if record:
+                self.add(*record)
+
+    def merge(self, records, uids, names, lasts, sections):
+        """Account the totals of the next part of the history, see _account_part"""
+        base = self.records
+        self.records += records
+        indexes = []
+        for uid, name, last in zip(uids, names, lasts):
+            index = self.index.get(uid)
+            if index is None:
+                index = self.index[uid] = len(self.uids)
+                self.uids.append(uid)
+                self.names.append(name)
+                self.lasts.append(base + last)
+            else:
+                self.lasts[index] = base + last
+            indexes.append(index)
+
+        for (kind, period), buckets in sections.items():
+            section = self.section(kind, period)
+            for key, items in buckets.items():
+                totals = section.setdefault(key, {})
+                for item_key, item in items.items():
+                    if kind == TASKS:
+                        item_key = indexes[item_key]
+                        item[LAST_SEQ] += base
+                    total = totals.get(item_key)
+                    if total is None:
+                        totals[item_key] = item
+                        continue
+                    total[SECONDS] += item[SECONDS]
+                    total[COUNT] += item[COUNT]
+                    if kind == TASKS:
+                        # the part is more recent
+                        total[LAST_SEQ:] = item[LAST_SEQ:]
+
+    def tids(self):
+        """Return the task ID of each task index"""
+        by_recency = sorted(range(len(self.lasts)), key=self.lasts.__getitem__, reverse=True)
+        tids = [0] * len(by_recency)
+        for tid, index in enumerate(by_recency, 1):
+            tids[index] = tid
+        return tids
+
+    def _buckets(self, since, until):
+        if since is None and until is None:
+            return [(MONTH, key) for key in sorted(self.section(TASKS, MONTH))]
+        if since is None or until is None:
+            raise ValueError("open ranges are not supported")
+        return split_range(since, until)
+
+    def summarize(self, since=None, until=None, tags=None, by_day=False):
+        """Return an iterator on the work time of each task ended in [since, until)
+
+        Items are (name, uid, tid, start_time, end_time, seconds) tuples, the
+        start and end time are the ones of the most recent occurrence. When
+        tags is given (see tagindex.parse_tag_query) only the tasks matching
+        it are considered. When by_day is true, tasks are summed day by day,
+        oldest day first.
+
+        Raises ValueError when the bounds are not midnights.
+        """
+        buckets = self._buckets(since, until)
+        if by_day:
+            days = self.section(TASKS, DAY)
+            if since is None:
+                keys = sorted(days)
+            else:
+                keys = range(since.toordinal(), until.toordinal())
+            groups = [days.get(key, {}) for key in keys]
+        else:
+            groups = [
+                self._merge(self.section(TASKS, period).get(key, {}) for period, key in buckets)
+            ]
+        return self._iter_summary(groups, self.tids(), tags)
+
+    def _iter_summary(self, groups, tids, tags):
+        for items in groups:
+            for index, item in sorted(items.items(), key=lambda pair: -pair[1][LAST_SEQ]):
+                name = self.names[index]
+                if tags and not _matches(name, tags):
+                    continue
+                yield (
+                    name,
+                    self.uids[index],
+                    tids[index],
+                    from_epoch(item[LAST_START]),
+                    from_epoch(item[LAST_END]),
+                    item[SECONDS],
+                )
+
+    @staticmethod
+    def _merge(bucket_items):
+        merged = {}
+        for items in bucket_items:
+            for index, item in items.items():
+                total = merged.get(index)
+                if total is None:
+                    merged[index] = list(item)
+                    continue
+                total[SECONDS] += item[SECONDS]
+                total[COUNT] += item[COUNT]
+                if item[LAST_SEQ] > total[LAST_SEQ]:
+                    total[LAST_SEQ:] = item[LAST_SEQ:]
+        return merged
+
+    def tag_totals(self, since=None, until=None):
+        """Return the work seconds of each tag and context ended in [since, until)"""
+        totals = {}
+        for period, key in self._buckets(since, until):
+            for tag, (seconds, _) in self.section(TAGS, period).get(key, {}).items():
+                totals[tag] = totals.get(tag, 0) + seconds
+        return totals
+
+    def dump(self, path):
+        """Write the totals atomically to path, merging the journal"""
+        meta = marshal.dumps((self.records, self.uids, self.names, self.lasts))
+        blobs = []
+        for section in SECTIONS:
+            blob = self.blobs.get(section)
+            if blob is None:
+                blob = marshal.dumps(self.sections.get(section, {}))
+            blobs.append(blob)
+
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp_path, "wb") as tfile:
+            tfile.write(
+                HEADER.pack(
+                    MAGIC,
+                    VERSION,
+                    marshal.version,
+                    self.size,
+                    self.mtime_ns,
+                    self.head_crc,
+                    self.tail_crc,
+                    len(meta),
+                    *(len(blob) for blob in blobs)
+                )
+            )
+            tfile.write(meta)
+            for blob in blobs:
+                tfile.write(blob)
+        os.replace(tmp_path, path)
+        try:
+            os.remove(path + JOURNAL_SUFFIX)
+        except FileNotFoundError:
+            pass
+        self.journal_entries = 0
+
+    @staticmethod
+    def load(path):
+        """Read a totals file and its journal, returns None if missing or unreadable"""
+        try:
+            with open(path, "rb") as tfile:
+                data = tfile.read()
+        except IOError:
+            return None
+
+        try:
+            (
+                magic,
+                version,
+                marshal_version,
+                size,
+                mtime_ns,
+                head_crc,
+                tail_crc,
+                meta_size,
+                *sizes,
+            ) = HEADER.unpack_from(data)
+            if magic != MAGIC or version != VERSION or marshal_version != marshal.version:
+                return None
+            if HEADER.size + meta_size + sum(sizes) != len(data):
+                return None
+
+            totals = Totals()
+            totals.size, totals.mtime_ns = size, mtime_ns
+            totals.head_crc, totals.tail_crc = head_crc, tail_crc
+            offset = HEADER.size
+            totals.records, totals.uids, totals.names, totals.lasts = marshal.loads(
+                data[offset : offset + meta_size]
+            )
+            totals.index = {uid: index for index, uid in enumerate(totals.uids)}
+            offset += meta_size
+            for section, section_size in zip(SECTIONS, sizes):
+                totals.blobs[section] = data[offset : offset + section_size]
+                offset += section_size
+        except (struct.error, ValueError, EOFError, TypeError) as error:
+            LOGGER.debug("could not read totals: %s", error)
+            return None
+
+        totals.replay(path + JOURNAL_SUFFIX)
+        return totals
+
+    def replay(self, path):
+        """Account the records of the journal following these totals"""
+        try:
+            with open(path, encoding="utf-8") as jfile:
+                entries = jfile.readlines()
+        except OSError:
+            return
+
+        for entry in entries:
+            try:
+                header, line = entry.rstrip("\n").split("\t", 1)
+                offset, prev_head, prev_tail, size, mtime_ns, head_crc, tail_crc = (
+                    int(field) for field in header.split()
+                )
+            except ValueError:
+                break
+            if (offset, prev_head, prev_tail) != (self.size, self.head_crc, self.tail_crc):
+                # the history changed in between, the totals are refreshed from it
+                break
+            self.extend(line.encode(), offset)
+            self.size, self.mtime_ns = size, mtime_ns
+            self.head_crc, self.tail_crc = head_crc, tail_crc
+            self.journal_entries += 1
+
+
+def _account_part(data):
+    """Return the totals of a part of the history, in a worker"""
+    totals = Totals()
+    totals.account(data)
+    return totals.records, totals.uids, totals.names, totals.lasts, totals.sections
+
+
+def load_totals(history_path):
+    """Return the up-to-date Totals of the given history file
+
+    A journal is merged in the totals file the first time it is read.
+    """
+    path = totals_path(history_path)
+    totals = load_cache(Totals, path, history_path)
+    if totals.journal_entries and not is_read_only(path):
+        try:
+            totals.dump(path)
+        except IOError as error:
+            LOGGER.debug("could not save %s: %s", path, error)
+    return totals
+
+
+def record_append(history_path, offset, line):
+    """Journal a line appended to the history at offset, in constant time
+
+    Nothing is done when there are no totals yet.
+    """
+    if not os.path.exists(totals_path(history_path)):
+        return
+    with open(history_path, "rb") as hfile:
+        size = os.fstat(hfile.fileno()).st_size
+        if size != offset + len(line.encode()):
+            # more than this line was appended, the totals will be extended
+            return
+        prev_head, prev_tail = region_crcs(hfile, offset)[:2]
+        head_crc, tail_crc = region_crcs(hfile, size)[:2]
+        mtime_ns = os.fstat(hfile.fileno()).st_mtime_ns
+    with open(journal_path(history_path), "a", encoding="utf-8") as jfile:
+        jfile.write(
+            "%d %d %d %d %d %d %d\t%s\n"
+            % (offset, prev_head, prev_tail, size, mtime_ns, head_crc, tail_crc, line.rstrip("\n"))
+        )
+
+
+def rebuild_totals(history_path):
+    """Rebuild the totals from the whole history"""
+    path = totals_path(history_path)
+    for stale in (path, journal_path(history_path)):
+        if os.path.exists(stale):
+            os.remove(stale)
+    return load_totals(history_path)
+
+
+def check_totals(history_path):
+    """Compare the stored totals with the history
+
+    Returns a list of problems, empty when the totals are consistent.
+    """
+    stored = Totals.load(totals_path(history_path))
+    if stored is None:
+        return ["no totals for %s" % history_path]
+
+    problems = []
+    stat = os.stat(history_path)
+    if (stored.size, stored.mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+        problems.append(
+            "totals are for %d bytes of history, the history has %d bytes"
+            % (stored.size, stat.st_size)
+        )
+
+    fresh = Totals()
+    with open(history_path, "rb") as hfile:
+        fresh.extend(hfile.read(), 0)
+    if stored.records != fresh.records:
+        problems.append(
+            "totals count %d records, the history has %d" % (stored.records, fresh.records)
+        )
+    if stored.names != fresh.names:
+        problems.append("totals do not have the tasks of the history")
+        return problems
+    for kind, period in SECTIONS:
+        stored_buckets = stored.section(kind, period)
+        fresh_buckets = fresh.section(kind, period)
+        for key in sorted(set(stored_buckets) | set(fresh_buckets)):
+            if stored_buckets.get(key) != fresh_buckets.get(key):
+                problems.append("%s totals differ for %s %d" % (kind[:-1], period, key))
+    return problems
@@ -0,0 +1,94 @@
+"""
+This module builds the vocabulary file used by the shell completion, see
+the completion module. It is extended when the history grows and rebuilt
+when the history is edited by hand.
+
+The vocabulary of a SQLite history (see storage.SqliteStorage) is kept at the
+same place, its header names the database it was made from.
+"""
+import os
+
+from completion import read_vocabulary, vocabulary_path
+from history import decode_line, load_cache
+from tagindex import find_tags
+
+
+# Number of task names kept for completion
+RECENT_NAMES = 200
+
+
+class Vocabulary(object):
+    """Tags, contexts and task names of the history, by recency"""
+
+    def __init__(self, source=None):
+        # the history the vocabulary is made from, None for the CSV history
+        self.source = source
+        self.size = 0
+        self.mtime_ns = 0
+        self.head_crc = 0
+        self.tail_crc = 0
+        # insertion order is the recency order, least recent first
+        self.tags = {}
+        self.names = {}
+
+    def extend(self, data, offset):
+        """Add the words in the history bytes in data"""
+        for line in data.split(b"\n"):
+            if not line.strip():
+                continue
+            record = decode_line(line.decode("utf-8", errors="replace"))
+            if record:
+                self.add(record[0])
+
+    def add(self, name):
+        """Add the words of a task name, the most recent"""
+        self.names.pop(name, None)
+        self.names[name] = None
+        for tag in find_tags(name):
+            self.tags.pop(tag, None)
+            self.tags[tag] = None
+
+    def recent_tags(self):
+        return list(reversed(self.tags))
+
+    def recent_names(self):
+        return list(reversed(self.names))[:RECENT_NAMES]
+
+    def dump(self, path):
+        """Write the vocabulary atomically to path"""
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp_path, "w", encoding="utf-8") as vfile:
+            vfile.write(
+                "%d %d %d %d" % (self.size, self.mtime_ns, self.head_crc, self.tail_crc)
+            )
+            vfile.write(" %s\n" % self.source if self.source else "\n")
+            vfile.write("\n".join(self.recent_tags()))
+            vfile.write("\n\n")
+            vfile.write("\n".join(self.recent_names()))
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path):
+        """Read a vocabulary file, returns None if missing or unreadable"""
+        try:
+            header, tags, names = read_vocabulary(path)
+            size, mtime_ns, head_crc, tail_crc = (int(x) for x in header[:4])
+        except (OSError, ValueError):
+            return None
+
+        vocabulary = Vocabulary(header[4] if len(header) > 4 else None)
+        vocabulary.size, vocabulary.mtime_ns = size, mtime_ns
+        vocabulary.head_crc, vocabulary.tail_crc = head_crc, tail_crc
+        vocabulary.tags = dict.fromkeys(reversed(tags))
+        vocabulary.names = dict.fromkeys(reversed(names))
+        return vocabulary
+
+
+def load_vocabulary(history_path):
+    """Return the up-to-date Vocabulary of the given history file"""
+    return load_cache(Vocabulary, vocabulary_path(history_path), history_path)
+
+
+def update_vocabulary(history_path):
+    """Bring the vocabulary up to date with the history, building it if missing"""
+    load_vocabulary(history_path)